@@ -0,0 +1,132 @@
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+
+def decode_card(path: Path, height: int) -> Image.Image:
+    with Image.open(path) as img:
+        width = max(1, round(img.width * height / img.height))
+        img.draft("RGB", (width, height))
+        image = img.convert("RGB")
+    if image.height != height:
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    return image
+
+
+def image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+def compose_collage(images: List[Image.Image]) -> bytes:
+    collage = Image.new("RGB", (sum(image.width for image in images), max(image.height for image in images)))
+    offset = 0
+    for image in images:
+        collage.paste(image, (offset, 0))
+        offset += image.width
+    buffer = BytesIO()
+    collage.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class CardImageCache:
+    def __init__(self, height: int = 720, max_bytes: int = 256 * 1024 * 1024, collage_max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.height = height
+        self.max_bytes = max_bytes
+        self.collage_max_bytes = collage_max_bytes
+        self._cards: "OrderedDict[Path, Image.Image]" = OrderedDict()
+        self._collages: "OrderedDict[Tuple[str, ...], bytes]" = OrderedDict()
+        self.card_bytes = 0
+        self.collage_bytes = 0
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "card_hits": 0,
+            "card_misses": 0,
+            "card_evictions": 0,
+            "collage_hits": 0,
+            "collage_misses": 0,
+            "collage_evictions": 0,
+        }
+
+    def card(self, path: Path) -> Image.Image:
+        with self._lock:
+            image = self._cards.get(path)
+            if image is not None:
+                self._cards.move_to_end(path)
+                self.counters["card_hits"] += 1
+                return image
+            self.counters["card_misses"] += 1
+        image = decode_card(path, self.height)
+        size = image_bytes(image)
+        with self._lock:
+            if path not in self._cards and size <= self.max_bytes:
+                while self.card_bytes + size > self.max_bytes:
+                    _, evicted = self._cards.popitem(last=False)
+                    self.card_bytes -= image_bytes(evicted)
+                    self.counters["card_evictions"] += 1
+                self._cards[path] = image
+                self.card_bytes += size
+        return image
+
+    def warm(self, paths: Iterable[Path]) -> int:
+        loaded = 0
+        last_size = 0
+        for path in sorted(paths):
+            if self.card_bytes + last_size > self.max_bytes:
+                logging.warning("Бюджет памяти для карт (%s байт) исчерпан, остальные карты будут загружаться с диска", self.max_bytes)
+                break
+            try:
+                last_size = image_bytes(self.card(path))
+            except OSError as exc:
+                logging.warning("Не удалось загрузить карту %s: %s", path, exc)
+                continue
+            loaded += 1
+        return loaded
+
+    def cached_collage(self, paths: List[Path]) -> Optional[bytes]:
+        key = tuple(str(path) for path in paths)
+        with self._lock:
+            cached = self._collages.get(key)
+            if cached is None:
+                self.counters["collage_misses"] += 1
+                return None
+            self._collages.move_to_end(key)
+            self.counters["collage_hits"] += 1
+            return cached
+
+    def store_collage(self, paths: List[Path], data: bytes) -> None:
+        key = tuple(str(path) for path in paths)
+        with self._lock:
+            if key in self._collages or len(data) > self.collage_max_bytes:
+                return
+            while self.collage_bytes + len(data) > self.collage_max_bytes:
+                _, evicted = self._collages.popitem(last=False)
+                self.collage_bytes -= len(evicted)
+                self.counters["collage_evictions"] += 1
+            self._collages[key] = data
+            self.collage_bytes += len(data)
+
+    def render_collage(self, paths: List[Path]) -> bytes:
+        return compose_collage([self.card(path) for path in paths])
+
+    def collage(self, paths: List[Path]) -> bytes:
+        cached = self.cached_collage(paths)
+        if cached is not None:
+            return cached
+        data = self.render_collage(paths)
+        self.store_collage(paths, data)
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self.counters,
+                "cards": len(self._cards),
+                "card_bytes": self.card_bytes,
+                "collages": len(self._collages),
+                "collage_bytes": self.collage_bytes,
+            }
@@ -0,0 +1,86 @@
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CATALOG_FORMAT_VERSION = 1
+
+
+class InterpretationCatalog:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        with self.connection:
+            if version != CATALOG_FORMAT_VERSION:
+                self.connection.execute("DROP TABLE IF EXISTS interpretations")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS interpretations (\n"
+                "    prompt_key TEXT NOT NULL,\n"
+                "    subject TEXT NOT NULL,\n"
+                "    variant INTEGER NOT NULL,\n"
+                "    fingerprint TEXT NOT NULL,\n"
+                "    text TEXT NOT NULL,\n"
+                "    created_at INTEGER NOT NULL,\n"
+                "    PRIMARY KEY (prompt_key, subject, variant)\n"
+                ")"
+            )
+        self.connection.execute(f"PRAGMA user_version = {CATALOG_FORMAT_VERSION}")
+
+    def lookup(self, prompt_key: str, subject: str, fingerprint: str) -> Optional[str]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT text FROM interpretations WHERE prompt_key = ? AND subject = ? AND fingerprint = ?",
+                (prompt_key, subject, fingerprint),
+            ).fetchall()
+        return random.choice(rows)[0] if rows else None
+
+    def fresh_variants(self, prompt_key: str, subject: str, fingerprint: str) -> List[int]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT variant FROM interpretations WHERE prompt_key = ? AND subject = ? AND fingerprint = ?",
+                (prompt_key, subject, fingerprint),
+            ).fetchall()
+        return [variant for (variant,) in rows]
+
+    def put(self, prompt_key: str, subject: str, variant: int, fingerprint: str, text: str) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO interpretations "
+                "(prompt_key, subject, variant, fingerprint, text, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (prompt_key, subject, variant, fingerprint, text, int(time.time())),
+            )
+
+    def prune(self, prompt_keys: List[str], live: Iterable[Tuple[str, str, str]]) -> int:
+        placeholders = ", ".join("?" for _ in prompt_keys)
+        with self._lock, self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS live (prompt_key, subject, fingerprint, "
+                "PRIMARY KEY (prompt_key, subject, fingerprint))"
+            )
+            self.connection.execute("DELETE FROM live")
+            self.connection.executemany("INSERT OR IGNORE INTO live VALUES (?, ?, ?)", live)
+            cursor = self.connection.execute(
+                f"DELETE FROM interpretations WHERE prompt_key IN ({placeholders}) AND NOT EXISTS ("
+                "SELECT 1 FROM live WHERE live.prompt_key = interpretations.prompt_key "
+                "AND live.subject = interpretations.subject AND live.fingerprint = interpretations.fingerprint)",
+                prompt_keys,
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT prompt_key, COUNT(*) FROM interpretations GROUP BY prompt_key"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
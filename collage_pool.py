@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from card_images import CardImageCache
+from metrics import LatencyTracker
+
+EXECUTOR_MODES = ("process", "thread")
+
+_worker_cards: Optional[CardImageCache] = None
+
+
+def init_worker(height: int, max_bytes: int, deck: Tuple[str, ...]) -> None:
+    global _worker_cards
+    _worker_cards = CardImageCache(height, max_bytes, collage_max_bytes=0)
+    _worker_cards.warm(Path(path) for path in deck)
+
+
+def worker_cards() -> int:
+    return _worker_cards.stats()["cards"]
+
+
+def render_in_worker(paths: Tuple[str, ...]) -> Tuple[bytes, float]:
+    started = time.perf_counter()
+    data = _worker_cards.render_collage([Path(path) for path in paths])
+    return data, time.perf_counter() - started
+
+
+def render_with_cache(cards: CardImageCache, paths: List[Path]) -> Tuple[bytes, float]:
+    started = time.perf_counter()
+    data = cards.render_collage(paths)
+    return data, time.perf_counter() - started
+
+
+class CollageRenderer:
+    def __init__(self, cards: CardImageCache, *, mode: str = "process", workers: int = 2, max_pending: int = 16) -> None:
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Неизвестный режим рендеринга коллажей: {mode}")
+        self.cards = cards
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.deck: Tuple[str, ...] = ()
+        self._executor: Optional[Executor] = None
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._restart_lock = asyncio.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.peak_waiting = 0
+        self.render_times = LatencyTracker()
+        self.queue_times = LatencyTracker()
+        self.counters: Dict[str, int] = {"rendered": 0, "cached": 0, "failed": 0, "restarts": 0}
+        self.render_seconds = 0.0
+        self.max_render = 0.0
+
+    def _build_executor(self) -> Executor:
+        if self.mode == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="collage")
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(self.cards.height, self.cards.max_bytes, self.deck),
+        )
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._build_executor()
+        return self._executor
+
+    async def start(self, card_paths: Iterable[Path]) -> int:
+        self.deck = tuple(str(path) for path in sorted(card_paths))
+        loop = asyncio.get_running_loop()
+        executor = self._ensure_executor()
+        if self.mode == "thread":
+            return await loop.run_in_executor(executor, self.cards.warm, [Path(path) for path in self.deck])
+        loaded = await asyncio.gather(*(loop.run_in_executor(executor, worker_cards) for _ in range(self.workers)))
+        return min(loaded)
+
+    async def _restart(self, broken: Executor) -> None:
+        async with self._restart_lock:
+            if self._executor is not broken:
+                return
+            logging.warning("Пул рендеринга коллажей упал, перезапускаю процессы")
+            self.counters["restarts"] += 1
+            self._executor = self._build_executor()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, paths: List[Path]) -> Tuple[bytes, float]:
+        loop = asyncio.get_running_loop()
+        executor = self._ensure_executor()
+        if self.mode == "thread":
+            return await loop.run_in_executor(executor, render_with_cache, self.cards, paths)
+        key = tuple(str(path) for path in paths)
+        try:
+            return await loop.run_in_executor(executor, render_in_worker, key)
+        except BrokenProcessPool:
+            await self._restart(executor)
+            return await loop.run_in_executor(self._ensure_executor(), render_in_worker, key)
+
+    async def render(self, paths: List[Path]) -> bytes:
+        cached = self.cards.cached_collage(paths)
+        if cached is not None:
+            self.counters["cached"] += 1
+            return cached
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.queue_times.add(time.perf_counter() - queued_at)
+        self.in_flight += 1
+        try:
+            data, elapsed = await self._submit(paths)
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+        self.counters["rendered"] += 1
+        self.render_seconds += elapsed
+        self.max_render = max(self.max_render, elapsed)
+        self.render_times.add(elapsed)
+        self.cards.store_collage(paths, data)
+        return data
+
+    def stats(self) -> Dict[str, float]:
+        rendered = self.counters["rendered"]
+        return {
+            **self.counters,
+            "mode": self.mode,
+            "workers": self.workers,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "peak_waiting": self.peak_waiting,
+            "avg_render_ms": round(self.render_seconds / rendered * 1000, 1) if rendered else 0.0,
+            "p95_render_ms": round((self.render_times.percentile(95) or 0.0) * 1000, 1),
+            "max_render_ms": round(self.max_render * 1000, 1),
+            "p95_queue_ms": round((self.queue_times.percentile(95) or 0.0) * 1000, 1),
+        }
+
+    async def run_reporter(self, interval: float) -> None:
+        reported = None
+        while True:
+            await asyncio.sleep(interval)
+            snapshot = (self.counters["rendered"], self.counters["failed"])
+            if snapshot != reported:
+                reported = snapshot
+                logging.info("Рендеринг коллажей: %s", self.stats())
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
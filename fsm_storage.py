@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from io_pool import IOExecutor
+
+
+def _now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+class SqliteFSMStorage(BaseStorage):
+    def __init__(
+        self,
+        path: Path,
+        executor: IOExecutor,
+        *,
+        ttl: float = 86400,
+        key_builder: Optional[KeyBuilder] = None,
+    ) -> None:
+        self.path = path
+        self.executor = executor
+        self.ttl_ms = int(ttl * 1000)
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS fsm_states (\n"
+                "    key TEXT PRIMARY KEY,\n"
+                "    state TEXT,\n"
+                "    data TEXT NOT NULL,\n"
+                "    expires_at INTEGER NOT NULL\n"
+                ")"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_fsm_states_expires_at ON fsm_states(expires_at)"
+            )
+
+    def _write(self, key: str, column: str, value: Optional[str]) -> None:
+        now = _now_ms()
+        other = "data" if column == "state" else "state"
+        reset = "'{}'" if other == "data" else "NULL"
+        with self._lock, self.connection:
+            self.connection.execute(
+                f"INSERT INTO fsm_states (key, state, data, expires_at) VALUES (?, ?, ?, ?)\n"
+                f"ON CONFLICT(key) DO UPDATE SET {column} = excluded.{column},\n"
+                f"    {other} = CASE WHEN fsm_states.expires_at <= ? THEN {reset} ELSE fsm_states.{other} END,\n"
+                f"    expires_at = excluded.expires_at",
+                (
+                    key,
+                    value if column == "state" else None,
+                    value if column == "data" else "{}",
+                    now + self.ttl_ms,
+                    now,
+                ),
+            )
+            self.connection.execute(
+                "DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data = '{}'",
+                (key,),
+            )
+
+    def _read(self, key: str) -> Optional[Tuple[Optional[str], str]]:
+        with self._lock:
+            return self.connection.execute(
+                "SELECT state, data FROM fsm_states WHERE key = ? AND expires_at > ?",
+                (key, _now_ms()),
+            ).fetchone()
+
+    def sweep(self) -> int:
+        with self._lock, self.connection:
+            cursor = self.connection.execute("DELETE FROM fsm_states WHERE expires_at <= ?", (_now_ms(),))
+        return cursor.rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM fsm_states").fetchone()[0]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self.executor.run(self._write, self.key_builder.build(key), "state", value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self.executor.run(self._read, self.key_builder.build(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"FSM data must be a dict, got {type(data).__name__}")
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        await self.executor.run(self._write, self.key_builder.build(key), "data", payload)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self.executor.run(self._read, self.key_builder.build(key))
+        return json.loads(row[1]) if row else {}
+
+    async def run_sweeper(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.executor.run(self.sweep)
+            except Exception as exc:  # noqa: BLE001
+                logging.error("Не удалось очистить устаревшие состояния диалогов: %s", exc)
+                continue
+            if removed:
+                logging.info("Удалено устаревших состояний диалогов: %s", removed)
+
+    async def close(self) -> None:
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Optional, Tuple
+
+from storage import atomic_write_text
+
+
+class DiamondLedger:
+    def __init__(self, log_path: Path, snapshot_path: Path) -> None:
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        self.balances: Dict[int, int] = {}
+        self.seq = 0
+        self.entries_since_snapshot = 0
+        self.snapshot_seq = 0
+        self._log: Optional[BinaryIO] = None
+        self._snapshot_lock = threading.Lock()
+
+    def load(self) -> None:
+        snapshot_seq = 0
+        if self.snapshot_path.exists():
+            snapshot = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            snapshot_seq = snapshot.get("seq", 0)
+            self.balances = {int(user_id): balance for user_id, balance in snapshot.get("balances", {}).items()}
+        self.seq = snapshot_seq
+        self.snapshot_seq = snapshot_seq
+
+        if self.log_path.exists():
+            valid_size = 0
+            with open(self.log_path, "rb") as handle:
+                for line_number, line in enumerate(handle, start=1):
+                    if not line.endswith(b"\n"):
+                        logging.warning("Отброшена недописанная запись журнала алмазиков: строка %s", line_number)
+                        break
+                    valid_size += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning("Пропущена повреждённая запись журнала алмазиков: строка %s", line_number)
+                        continue
+                    if entry["seq"] <= snapshot_seq:
+                        continue
+                    user_id = entry["user"]
+                    self.balances[user_id] = self.balances.get(user_id, 0) + entry["delta"]
+                    self.seq = max(self.seq, entry["seq"])
+                    self.entries_since_snapshot += 1
+            if self.log_path.stat().st_size > valid_size:
+                with open(self.log_path, "r+b") as handle:
+                    handle.truncate(valid_size)
+
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._log = open(self.log_path, "ab")
+
+    def has(self, user_id: int) -> bool:
+        return user_id in self.balances
+
+    def balance(self, user_id: int, default: int = 0) -> int:
+        return self.balances.get(user_id, default)
+
+    def _append(self, user_id: int, delta: int, reason: str) -> None:
+        self.seq += 1
+        entry = {"seq": self.seq, "user": user_id, "delta": delta, "reason": reason, "ts": round(time.time(), 3)}
+        self._log.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._log.flush()
+        self.balances[user_id] = self.balances.get(user_id, 0) + delta
+        self.entries_since_snapshot += 1
+
+    def apply(self, user_id: int, delta: int, reason: str, *, opening_balance: int = 0) -> int:
+        if user_id not in self.balances and opening_balance:
+            self._append(user_id, opening_balance, "opening")
+        current = self.balances.get(user_id, 0)
+        new_balance = max(0, current + delta)
+        self._append(user_id, new_balance - current, reason)
+        return new_balance
+
+    def capture(self) -> Tuple[int, Dict[int, int], int, int]:
+        self._log.flush()
+        return self.seq, dict(self.balances), self._log.tell(), self.entries_since_snapshot
+
+    def write_snapshot(self, seq: int, balances: Dict[int, int]) -> bool:
+        with self._snapshot_lock:
+            if seq < self.snapshot_seq:
+                return False
+            snapshot = {"seq": seq, "balances": {str(user_id): balance for user_id, balance in balances.items()}}
+            atomic_write_text(self.snapshot_path, json.dumps(snapshot, separators=(",", ":")))
+            self.snapshot_seq = seq
+            return True
+
+    def discard_through(self, offset: int, entries: int) -> None:
+        self._log.flush()
+        if self._log.tell() == offset:
+            self._log.truncate(0)
+        else:
+            with open(self.log_path, "rb") as handle:
+                handle.seek(offset)
+                tail = handle.read()
+            atomic_write_text(self.log_path, tail.decode("utf-8"))
+            self._log.close()
+            self._log = open(self.log_path, "ab")
+        self.entries_since_snapshot -= entries
+
+    def compact(self) -> None:
+        seq, balances, offset, entries = self.capture()
+        if self.write_snapshot(seq, balances):
+            self.discard_through(offset, entries)
+
+    async def compact_in(self, run_io: Callable[..., Awaitable[Any]]) -> None:
+        seq, balances, offset, entries = self.capture()
+        if await run_io(self.write_snapshot, seq, balances):
+            self.discard_through(offset, entries)
+
+    async def run_compactor(self, interval: float, min_entries: int, run_io: Callable[..., Awaitable[Any]]) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if self.entries_since_snapshot < min_entries:
+                continue
+            try:
+                await self.compact_in(run_io)
+            except Exception as exc:  # noqa: BLE001
+                logging.error("Не удалось сжать журнал алмазиков: %s", exc)
+
+    def close(self) -> None:
+        if self._log is None:
+            return
+        if self.entries_since_snapshot:
+            self.compact()
+        self._log.close()
+        self._log = None
@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from storage import atomic_write_text
+
+
+def prompt_fingerprint(messages: List[Dict[str, str]]) -> str:
+    payload = json.dumps(messages, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def interpretation_key(prompt_key: str, subject: str, messages: List[Dict[str, str]], model: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        [prompt_key, subject, prompt_fingerprint(messages), model, params],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InterpretationCache:
+    def __init__(
+        self,
+        *,
+        variants: int = 3,
+        ttl: float = 7 * 86400,
+        max_keys: int = 1000,
+        path: Optional[Path] = None,
+    ) -> None:
+        self.variants = variants
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.path = path
+        self.entries: "OrderedDict[str, List[List[Any]]]" = OrderedDict()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, key: str) -> List[List[Any]]:
+        variants = self.entries.get(key)
+        if variants is None:
+            return []
+        deadline = time.time() - self.ttl
+        alive = [variant for variant in variants if variant[1] > deadline]
+        if len(alive) != len(variants):
+            self.dirty = True
+            if alive:
+                self.entries[key] = alive
+            else:
+                del self.entries[key]
+        return alive
+
+    def get(self, key: str) -> Optional[str]:
+        variants = self._fresh(key)
+        if len(variants) < self.variants:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return random.choice(variants)[0]
+
+    def any(self, key: str) -> Optional[str]:
+        variants = self._fresh(key)
+        return random.choice(variants)[0] if variants else None
+
+    def add(self, key: str, text: str) -> None:
+        variants = self._fresh(key)
+        variants.append([text, time.time()])
+        self.entries[key] = variants[-self.variants:]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "keys": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            stored = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as exc:
+            logging.warning("Не удалось прочитать кэш интерпретаций %s: %s", self.path, exc)
+            return
+        for key, variants in stored.items():
+            self.entries[key] = variants[-self.variants:]
+        for key in list(self.entries):
+            self._fresh(key)
+        while len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+        self.dirty = False
+
+    def snapshot(self) -> Optional[str]:
+        if self.path is None or not self.dirty:
+            return None
+        self.dirty = False
+        return json.dumps(self.entries, ensure_ascii=False, separators=(",", ":"))
+
+    def save(self) -> None:
+        payload = self.snapshot()
+        if payload is not None:
+            atomic_write_text(self.path, payload)
+
+    async def run_saver(self, interval: float, run_io: Callable[..., Awaitable[Any]]) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            payload = self.snapshot()
+            if payload is None:
+                continue
+            try:
+                await run_io(atomic_write_text, self.path, payload)
+            except Exception as exc:  # noqa: BLE001
+                self.dirty = True
+                logging.error("Не удалось сохранить кэш интерпретаций: %s", exc)
+
+
+class FrequencySketch:
+    def __init__(self, width: int, depth: int = 4, sample_size: Optional[int] = None) -> None:
+        self.width = width
+        self.depth = depth
+        self.tables = [bytearray(width) for _ in range(depth)]
+        self.sample_size = sample_size or width * 10
+        self.additions = 0
+
+    def _indexes(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def increment(self, key: str) -> None:
+        for table, index in zip(self.tables, self._indexes(key)):
+            if table[index] < 255:
+                table[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            for table in self.tables:
+                for index, value in enumerate(table):
+                    table[index] = value >> 1
+            self.additions //= 2
+
+    def estimate(self, key: str) -> int:
+        return min(table[index] for table, index in zip(self.tables, self._indexes(key)))
+
+
+class TinyLFUCache:
+    def __init__(self, max_bytes: int, *, sketch_width: int = 4096) -> None:
+        self.max_bytes = max_bytes
+        self.sketch = FrequencySketch(sketch_width)
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _size(key: str, text: str) -> int:
+        return len(key) + len(text.encode("utf-8"))
+
+    def get(self, key: str) -> Optional[str]:
+        self.sketch.increment(key)
+        text = self.entries.get(key)
+        if text is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def _remove(self, key: str) -> None:
+        del self.entries[key]
+        self.total_bytes -= self.sizes.pop(key)
+
+    def put(self, key: str, text: str) -> bool:
+        size = self._size(key, text)
+        if size > self.max_bytes:
+            self.rejected += 1
+            return False
+        resident = key in self.entries
+        victims = []
+        freed = self.sizes.get(key, 0)
+        for victim in self.entries:
+            if self.total_bytes - freed + size <= self.max_bytes:
+                break
+            if victim == key:
+                continue
+            victims.append(victim)
+            freed += self.sizes[victim]
+        if not resident:
+            candidate_frequency = self.sketch.estimate(key)
+            if any(self.sketch.estimate(victim) >= candidate_frequency for victim in victims):
+                self.rejected += 1
+                return False
+        for victim in victims:
+            self._remove(victim)
+            self.evicted += 1
+        if resident:
+            self._remove(key)
+        self.entries[key] = text
+        self.sizes[key] = size
+        self.total_bytes += size
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
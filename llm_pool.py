@@ -0,0 +1,174 @@
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+@dataclass
+class LLMEndpoint:
+    name: str
+    api_key: str
+    base_url: Optional[str] = None
+
+
+def parse_endpoints(spec: str, default_base_url: Optional[str] = None) -> List[LLMEndpoint]:
+    endpoints = []
+    for index, entry in enumerate(part.strip() for part in spec.split(",")):
+        if not entry:
+            continue
+        api_key, _, base_url = entry.partition("@")
+        endpoints.append(LLMEndpoint(f"key{index + 1}", api_key, base_url or default_base_url))
+    return endpoints
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class PooledKey:
+    def __init__(self, name: str, client: Any) -> None:
+        self.name = name
+        self.client = client
+        self.in_flight = 0
+        self.limit_requests: Optional[int] = None
+        self.remaining_requests: Optional[int] = None
+        self.limit_tokens: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.reset_at = 0.0
+        self.dispatched_since_update = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.rate_limited = 0
+
+    def cooling(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+    def headroom(self, now: float) -> float:
+        if now >= self.reset_at:
+            return 1.0
+        fractions = []
+        if self.remaining_requests is not None and self.limit_requests:
+            fractions.append((self.remaining_requests - self.dispatched_since_update) / self.limit_requests)
+        if self.remaining_tokens is not None and self.limit_tokens:
+            fractions.append(self.remaining_tokens / self.limit_tokens)
+        return max(0.0, min(fractions)) if fractions else 1.0
+
+    def observe(self, status_code: int, headers: Mapping[str, str], default_cooldown: float) -> None:
+        now = time.monotonic()
+        self.limit_requests = _header_int(headers, "x-ratelimit-limit-requests") or self.limit_requests
+        self.limit_tokens = _header_int(headers, "x-ratelimit-limit-tokens") or self.limit_tokens
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests is not None or remaining_tokens is not None:
+            self.remaining_requests = remaining_requests
+            self.remaining_tokens = remaining_tokens
+            self.dispatched_since_update = 0
+            resets = [
+                parse_duration(headers.get("x-ratelimit-reset-requests")),
+                parse_duration(headers.get("x-ratelimit-reset-tokens")),
+            ]
+            self.reset_at = now + max((reset for reset in resets if reset is not None), default=60.0)
+        if status_code == 429:
+            self.rate_limited += 1
+            retry_after_ms = _header_int(headers, "retry-after-ms")
+            retry_after = retry_after_ms / 1000 if retry_after_ms is not None else parse_duration(headers.get("retry-after"))
+            cooldown = retry_after if retry_after is not None else default_cooldown
+            if not self.cooling(now):
+                logging.warning("Ключ LLM %s получил 429, пауза %.1f с", self.name, cooldown)
+            self.cooldown_until = max(self.cooldown_until, now + cooldown)
+
+    def stats(self) -> Dict[str, object]:
+        now = time.monotonic()
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "rate_limited": self.rate_limited,
+            "headroom": round(self.headroom(now), 3),
+            "cooldown": round(max(0.0, self.cooldown_until - now), 1),
+        }
+
+
+def build_pooled_key(
+    endpoint: LLMEndpoint,
+    *,
+    max_connections: int,
+    max_keepalive: int,
+    keepalive_expiry: float,
+    default_cooldown: float,
+) -> PooledKey:
+    key = PooledKey(endpoint.name, None)
+
+    async def observe_response(response: httpx.Response) -> None:
+        key.observe(response.status_code, response.headers, default_cooldown)
+
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        event_hooks={"response": [observe_response]},
+    )
+    key.client = AsyncOpenAI(
+        api_key=endpoint.api_key, base_url=endpoint.base_url, max_retries=0, http_client=http_client
+    )
+    return key
+
+
+class LLMClientPool:
+    def __init__(self, keys: List[PooledKey]) -> None:
+        self.keys = keys
+
+    def choose(self) -> PooledKey:
+        now = time.monotonic()
+        ready = [key for key in self.keys if not key.cooling(now)]
+        if not ready:
+            wait = min(key.cooldown_until for key in self.keys) - now
+            raise PoolExhausted(f"All LLM keys are rate limited for {wait:.1f}s")
+        return max(ready, key=lambda key: (key.headroom(now), -key.in_flight))
+
+    @asynccontextmanager
+    async def client(self) -> AsyncIterator[Any]:
+        key = self.choose()
+        key.requests += 1
+        key.in_flight += 1
+        key.dispatched_since_update += 1
+        try:
+            yield key.client
+        finally:
+            key.in_flight -= 1
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {key.name: key.stats() for key in self.keys}
+
+    async def close(self) -> None:
+        for key in self.keys:
+            await key.client.close()
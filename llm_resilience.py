@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+
+from llm_scheduler import LLMScheduler
+from metrics import LatencyTracker
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS_CODES or exc.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logging.info("LLM снова доступен, автомат замкнут")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.warning("LLM недоступен, автомат разомкнут на %s с", self.reset_timeout)
+                self.opened_count += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        self._probe_in_flight = False
+
+
+class ResilientCaller:
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        *,
+        retries: int = 2,
+        base_delay: float = 0.5,
+        max_delay: float = 4.0,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+        hedge_limiter: Optional[LLMScheduler] = None,
+        hedge_priority: int = 0,
+    ) -> None:
+        self.breaker = breaker
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_limiter = hedge_limiter
+        self.hedge_priority = hedge_priority
+        self.latency = LatencyTracker()
+        self.counters: Dict[str, int] = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "hedges_skipped": 0,
+            "short_circuited": 0,
+        }
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_percentile or len(self.latency.samples) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def _attempt(self, func: Callable[[], Awaitable[T]], hedge: bool) -> T:
+        primary = asyncio.ensure_future(func())
+        delay = self._hedge_delay() if hedge else None
+        if delay is None:
+            return await primary
+        tasks = {primary}
+        hedge_slot = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            if self.hedge_limiter is not None:
+                hedge_slot = self.hedge_limiter.try_acquire(self.hedge_priority)
+                if not hedge_slot:
+                    self.counters["hedges_skipped"] += 1
+                    return await primary
+            self.counters["hedges"] += 1
+            backup = asyncio.ensure_future(func())
+            tasks.add(backup)
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, *tasks):
+                if not task.done():
+                    task.cancel()
+            if hedge_slot:
+                self.hedge_limiter.release()
+
+    async def call(self, func: Callable[[], Awaitable[T]], *, deadline: float, hedge: bool = True) -> T:
+        if not self.breaker.allow():
+            raise self.short_circuit()
+        self.counters["calls"] += 1
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + deadline
+        attempt = 0
+        while True:
+            started = loop.time()
+            try:
+                result = await asyncio.wait_for(self._attempt(func, hedge), max(0.0, deadline_at - started))
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as exc:  # noqa: BLE001
+                if isinstance(exc, asyncio.TimeoutError):
+                    self.counters["timeouts"] += 1
+                retryable = is_retryable(exc)
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if retryable and attempt < self.retries and loop.time() + backoff < deadline_at:
+                    attempt += 1
+                    self.counters["retries"] += 1
+                    logging.info("Повтор запроса к LLM #%s через %.2f с: %s", attempt, backoff, exc)
+                    await asyncio.sleep(backoff)
+                    continue
+                self.counters["failures"] += 1
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_probe()
+                raise
+            self.latency.add(loop.time() - started)
+            self.counters["successes"] += 1
+            self.breaker.record_success()
+            return result
+
+    def short_circuit(self) -> CircuitOpenError:
+        self.counters["short_circuited"] += 1
+        return CircuitOpenError("LLM circuit breaker is open")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **self.counters,
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened_count,
+            "p50": self.latency.percentile(50),
+            "p95": self.latency.percentile(95),
+        }
+
+    async def run_reporter(self, interval: float) -> None:
+        reported = None
+        while True:
+            await asyncio.sleep(interval)
+            snapshot = (self.counters["calls"], self.counters["short_circuited"], self.breaker.state)
+            if snapshot != reported:
+                reported = snapshot
+                logging.info("Устойчивость LLM: %s", self.stats())
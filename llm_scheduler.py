@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+
+PRIORITY_CLARIFY = 0
+PRIORITY_THREE = 1
+PRIORITY_DAY = 2
+PRIORITY_BACKGROUND = 3
+PRIORITY_NAMES = {
+    PRIORITY_CLARIFY: "clarify",
+    PRIORITY_THREE: "three",
+    PRIORITY_DAY: "day",
+    PRIORITY_BACKGROUND: "background",
+}
+
+
+class SchedulerOverloaded(Exception):
+    pass
+
+
+class SchedulerTimeout(Exception):
+    pass
+
+
+class _PriorityStats:
+    __slots__ = ("granted", "shed", "timed_out", "wait_total", "wait_max")
+
+    def __init__(self) -> None:
+        self.granted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "granted": self.granted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "avg_wait": self.wait_total / self.granted if self.granted else 0.0,
+            "max_wait": self.wait_max,
+        }
+
+
+class LLMScheduler:
+    def __init__(self, concurrency: int, *, max_queue: int = 100, max_wait: float = 15.0) -> None:
+        self.concurrency = concurrency
+        self.available = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.peak_depth = 0
+        self._counter = itertools.count()
+        self._stats: Dict[int, _PriorityStats] = {priority: _PriorityStats() for priority in PRIORITY_NAMES}
+
+    @property
+    def depth(self) -> int:
+        return len(self.waiters)
+
+    @property
+    def in_flight(self) -> int:
+        return self.concurrency - self.available
+
+    def _stats_for(self, priority: int) -> _PriorityStats:
+        return self._stats.setdefault(priority, _PriorityStats())
+
+    def _granted(self, priority: int, started: float) -> None:
+        waited = time.monotonic() - started
+        stats = self._stats_for(priority)
+        stats.granted += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+
+    def _make_room(self, priority: int) -> None:
+        worst = max(self.waiters, key=lambda waiter: (waiter[0], waiter[1]))
+        if worst[0] <= priority:
+            self._stats_for(priority).shed += 1
+            raise SchedulerOverloaded(f"LLM queue is full ({self.max_queue})")
+        self.waiters.remove(worst)
+        heapq.heapify(self.waiters)
+        self._stats_for(worst[0]).shed += 1
+        worst[2].set_exception(SchedulerOverloaded("Displaced by a higher priority request"))
+
+    async def acquire(self, priority: int) -> None:
+        started = time.monotonic()
+        if self.available > 0 and not self.waiters:
+            self.available -= 1
+            self._granted(priority, started)
+            return
+        if len(self.waiters) >= self.max_queue:
+            self._make_room(priority)
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._counter), future)
+        heapq.heappush(self.waiters, entry)
+        self.peak_depth = max(self.peak_depth, len(self.waiters))
+        timeout = None if priority >= PRIORITY_BACKGROUND else self.max_wait
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._forget(entry)
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()
+            self._stats_for(priority).timed_out += 1
+            raise SchedulerTimeout(f"Waited more than {self.max_wait}s for an LLM slot") from None
+        except BaseException:
+            self._forget(entry)
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()
+            raise
+        self._granted(priority, started)
+
+    def try_acquire(self, priority: int) -> bool:
+        if self.available > 0 and not self.waiters:
+            self.available -= 1
+            self._granted(priority, time.monotonic())
+            return True
+        return False
+
+    def _forget(self, entry: Tuple[int, int, asyncio.Future]) -> None:
+        if entry in self.waiters:
+            self.waiters.remove(entry)
+            heapq.heapify(self.waiters)
+
+    def release(self) -> None:
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.available += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "in_flight": self.in_flight,
+            "depth": self.depth,
+            "peak_depth": self.peak_depth,
+            "priorities": {
+                PRIORITY_NAMES.get(priority, str(priority)): stats.as_dict()
+                for priority, stats in self._stats.items()
+            },
+        }
+
+    async def run_reporter(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if self.depth or self.in_flight:
+                logging.info("Очередь LLM: %s", self.stats())
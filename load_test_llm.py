@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+os.environ.setdefault("BOT_TOKEN", "load-test")
+os.environ.setdefault("CHANNEL_USERNAME", "@load_test")
+
+import main  # noqa: E402
+from llm_cache import TinyLFUCache  # noqa: E402
+from llm_pool import LLMClientPool, LLMEndpoint, build_pooled_key  # noqa: E402
+from mock_llm_server import MockLLMServer, add_config_arguments, config_from_args  # noqa: E402
+from prompts import PROMPT_REGISTRY  # noqa: E402
+from question_cache import QuestionSimilarityCache  # noqa: E402
+
+CARD_NAMES = [
+    "Шут", "Маг", "Верховная Жрица", "Императрица", "Император", "Иерофант", "Влюблённые",
+    "Колесница", "Сила", "Отшельник", "Колесо Фортуны", "Справедливость", "Повешенный",
+    "Смерть", "Умеренность", "Дьявол", "Башня", "Звезда", "Луна", "Солнце", "Суд", "Мир",
+]
+QUESTIONS = [
+    "Что насчёт любви?",
+    "А что с работой?",
+    "Будут ли деньги?",
+    "Стоит ли менять работу?",
+    "Что меня ждёт на этой неделе?",
+    "Помиримся ли мы?",
+    "На что обратить внимание?",
+]
+SPREAD_KEYS = [key for key, config in PROMPT_REGISTRY.items() if config.mode == "THREE"]
+
+
+class DiscardingReply:
+    def __init__(self) -> None:
+        self.started_at = 0.0
+        self.first_delta: Optional[float] = None
+
+    async def start(self) -> None:
+        self.started_at = time.perf_counter()
+
+    async def update(self, text: str) -> None:
+        if self.first_delta is None:
+            self.first_delta = time.perf_counter()
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+async def run_request(kind: str, rng: random.Random, stream: bool) -> Tuple[str, float, Optional[float]]:
+    reply = DiscardingReply() if stream else None
+    started = time.perf_counter()
+    if kind == "clarify":
+        await main.generate_clarify_interpretation(rng.choice(CARD_NAMES), rng.choice(QUESTIONS), reply=reply)
+    else:
+        prompt_key = rng.choice(SPREAD_KEYS)
+        question = rng.choice(QUESTIONS) if "{question}" in PROMPT_REGISTRY[prompt_key].user_template else ""
+        await main.generate_prompt_interpretation(prompt_key, question, rng.sample(CARD_NAMES, 3), reply=reply)
+    finished = time.perf_counter()
+    first_token = reply.first_delta - started if reply is not None and reply.first_delta is not None else None
+    return kind, finished - started, first_token
+
+
+async def run_load(
+    *, rate: float, duration: float, clarify_share: float, stream: bool, seed: Optional[int]
+) -> Tuple[List[Tuple[str, float, Optional[float]]], float]:
+    rng = random.Random(seed)
+    tasks = []
+    started = time.perf_counter()
+    deadline = started + duration
+    next_at = started
+    while next_at < deadline:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = "clarify" if rng.random() < clarify_share else "spread"
+        tasks.append(asyncio.create_task(run_request(kind, random.Random(rng.random()), stream)))
+        next_at += rng.expovariate(rate)
+    results = await asyncio.gather(*tasks)
+    return results, time.perf_counter() - started
+
+
+def summarize(results: List[Tuple[str, float, Optional[float]]], elapsed: float) -> Dict[str, Dict[str, float]]:
+    report = {}
+    for kind in ("spread", "clarify", "all"):
+        rows = [row for row in results if kind == "all" or row[0] == kind]
+        if not rows:
+            continue
+        latencies = [latency for _, latency, _ in rows]
+        first_tokens = [first for _, _, first in rows if first is not None]
+        summary = {
+            "requests": len(rows),
+            "throughput": len(rows) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        }
+        if first_tokens:
+            summary["ttft_p50"] = percentile(first_tokens, 50)
+            summary["ttft_p95"] = percentile(first_tokens, 95)
+        report[kind] = summary
+    return report
+
+
+async def run(args: argparse.Namespace) -> None:
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = MockLLMServer(config_from_args(args))
+        base_url = await server.start()
+    pool = main._llm_pool = LLMClientPool(
+        [
+            build_pooled_key(
+                LLMEndpoint(f"mock{index + 1}", f"mock-{index + 1}", base_url),
+                max_connections=main.LLM_POOL_MAX_CONNECTIONS,
+                max_keepalive=main.LLM_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=main.LLM_POOL_KEEPALIVE_EXPIRY,
+                default_cooldown=main.LLM_RATE_LIMIT_COOLDOWN,
+            )
+            for index in range(args.keys)
+        ]
+    )
+    main.LLM_ENABLED = True
+    if args.no_cache:
+        main._clarify_cache = QuestionSimilarityCache(threshold=2.0)
+        main._spread_cache = TinyLFUCache(0)
+    try:
+        results, elapsed = await run_load(
+            rate=args.rate,
+            duration=args.duration,
+            clarify_share=args.clarify_share,
+            stream=args.stream,
+            seed=args.seed,
+        )
+    finally:
+        await pool.close()
+        if server is not None:
+            await server.stop()
+
+    print(f"{len(results)} запросов за {elapsed:.1f} с к {base_url}")
+    for kind, summary in summarize(results, elapsed).items():
+        line = ", ".join(f"{name}={value:.3f}" if isinstance(value, float) else f"{name}={value}" for name, value in summary.items())
+        print(f"  {kind}: {line}")
+    print(f"Устойчивость LLM: {main.get_llm_caller().stats()}")
+    print(f"Очередь LLM: {main.get_llm_scheduler().stats()}")
+    print(f"Ключи LLM: {pool.stats()}")
+    print(f"Кэш уточнений: {main.get_clarify_cache().stats()}")
+    print(f"Кэш раскладов: {main.get_spread_cache().stats()}")
+    if server is not None:
+        print(f"Заглушка: {server.counters}")
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест генерации интерпретаций без обращения к OpenAI.")
+    parser.add_argument("--base-url", help="адрес уже запущенной заглушки (по умолчанию поднимается внутри процесса)")
+    parser.add_argument("--rate", type=float, default=10.0, help="запросов в секунду (пуассоновский поток)")
+    parser.add_argument("--duration", type=float, default=30.0, help="длительность подачи запросов, с")
+    parser.add_argument("--clarify-share", type=float, default=0.3, help="доля уточняющих вопросов")
+    parser.add_argument("--stream", action="store_true", help="запрашивать потоковые ответы и мерить время до первого токена")
+    parser.add_argument("--keys", type=int, default=1, help="сколько ключей в пуле клиентов LLM")
+    parser.add_argument("--no-cache", action="store_true", help="не отвечать из кэшей раскладов и уточнений")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        main.DATA_FILE = Path(data_dir) / "users.json"
+        try:
+            asyncio.run(run(args))
+        finally:
+            main.get_io_executor().shutdown()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,41 +1,74 @@
 import asyncio
-import json
 import logging
 import os
 import random
-from datetime import datetime, timedelta, timezone
-from io import BytesIO
+import signal
+from datetime import timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 import inspect
 
 from aiogram import BaseMiddleware, Bot, Dispatcher, Router, F
 from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ChatMemberStatus, ParseMode
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart
 from aiogram.types import (
     BufferedInputFile,
     CallbackQuery,
     FSInputFile,
     InlineKeyboardMarkup,
+    InputFile,
     KeyboardButton,
+    Chat,
+    ChatMemberUpdated,
     Message,
     ReplyKeyboardMarkup,
+    User,
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
-from PIL import Image
-from openai import AsyncOpenAI
-from prompts import DEFAULT_SYSTEM_PROMPT, PROMPT_REGISTRY, build_prompt_messages
+from prompts import DEFAULT_SYSTEM_PROMPT, PROMPT_REGISTRY, PromptRegistry
+from card_images import CardImageCache
+from collage_pool import CollageRenderer
+from catalog import InterpretationCatalog
+from fsm_storage import SqliteFSMStorage
+from io_pool import IOExecutor
+from ledger import DiamondLedger
+from llm_cache import InterpretationCache, TinyLFUCache, interpretation_key
+from llm_pool import LLMClientPool, PoolExhausted, build_pooled_key, parse_endpoints
+from llm_resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+from llm_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_CLARIFY,
+    PRIORITY_DAY,
+    PRIORITY_THREE,
+    LLMScheduler,
+    SchedulerOverloaded,
+    SchedulerTimeout,
+)
+from question_cache import QuestionSimilarityCache
+from records import UserRecord, timestamp_now, timestamp_to_datetime
+from singleflight import SingleFlight
+from streaming import StreamingReply
+from storage import AsyncUserStorage, CachedUserStorage, create_user_storage
+from subscriptions import UNSUBSCRIBED_STATUSES, SubscriptionCache, SubscriptionSweeper
+from telegram_files import TelegramFileCache
+from user_locks import UserLockManager, UserSerialMiddleware
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHANNEL_USERNAME = os.getenv("CHANNEL_USERNAME")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_API_KEYS = os.getenv("OPENAI_API_KEYS") or OPENAI_API_KEY or ""
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "30"))
+LLM_RATE_LIMIT_COOLDOWN = float(os.getenv("LLM_RATE_LIMIT_COOLDOWN", "20"))
 LLM_ENABLED = os.getenv("LLM_ENABLED", "1") == "1"
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1-mini")
 LLM_MAX_TOKENS_DAY = int(os.getenv("LLM_MAX_TOKENS_DAY", "220"))
@@ -48,29 +81,67 @@ LLM_TOP_P = float(os.getenv("LLM_TOP_P", "1.0"))
 LLM_FREQUENCY_PENALTY = float(os.getenv("LLM_FREQUENCY_PENALTY", "0.2"))
 LLM_PRESENCE_PENALTY = float(os.getenv("LLM_PRESENCE_PENALTY", "0.0"))
 LLM_SEED = os.getenv("LLM_SEED")
+LLM_CACHE_VARIANTS = int(os.getenv("LLM_CACHE_VARIANTS", "3"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 86400)))
+LLM_CACHE_MAX_KEYS = int(os.getenv("LLM_CACHE_MAX_KEYS", "1000"))
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "1") == "1"
+LLM_CACHE_SAVE_INTERVAL = float(os.getenv("LLM_CACHE_SAVE_INTERVAL", "300"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "100"))
+LLM_QUEUE_MAX_WAIT = float(os.getenv("LLM_QUEUE_MAX_WAIT", "15"))
+LLM_METRICS_INTERVAL = float(os.getenv("LLM_METRICS_INTERVAL", "60"))
+LLM_TIMEOUT_DAY = float(os.getenv("LLM_TIMEOUT_DAY", "20"))
+LLM_TIMEOUT_THREE = float(os.getenv("LLM_TIMEOUT_THREE", "40"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"
+LLM_STREAM_EDIT_INTERVAL = float(os.getenv("LLM_STREAM_EDIT_INTERVAL", "1.0"))
+CLARIFY_CACHE_THRESHOLD = float(os.getenv("CLARIFY_CACHE_THRESHOLD", "0.8"))
+CLARIFY_CACHE_PER_CARD = int(os.getenv("CLARIFY_CACHE_PER_CARD", "64"))
+CLARIFY_CACHE_MAX_CARDS = int(os.getenv("CLARIFY_CACHE_MAX_CARDS", "512"))
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "5"))
+SPREAD_CACHE_MAX_BYTES = int(os.getenv("SPREAD_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
 DAILY_GIFT_COOLDOWN = timedelta(hours=24)
 CLARIFY_COST = 10
 DATA_FILE = Path("data/users.json")
+USER_STORAGE_BACKEND = os.getenv("USER_STORAGE_BACKEND", "sqlite")
+USER_SHARDS = int(os.getenv("USER_SHARDS", "16"))
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", "5"))
+USER_FLUSH_THRESHOLD = int(os.getenv("USER_FLUSH_THRESHOLD", "100"))
+USER_CACHE_MAX_RECORDS = int(os.getenv("USER_CACHE_MAX_RECORDS", "50000"))
+LEDGER_COMPACT_INTERVAL = float(os.getenv("LEDGER_COMPACT_INTERVAL", "300"))
+LEDGER_COMPACT_MIN_ENTRIES = int(os.getenv("LEDGER_COMPACT_MIN_ENTRIES", "1000"))
+STORAGE_IO_WORKERS = int(os.getenv("STORAGE_IO_WORKERS", "4"))
+STORAGE_IO_MAX_PENDING = int(os.getenv("STORAGE_IO_MAX_PENDING", "256"))
+UPDATES_CONCURRENCY_LIMIT = int(os.getenv("UPDATES_CONCURRENCY_LIMIT", "0")) or None
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "86400"))
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "600"))
+SUBSCRIPTION_CACHE_TTL = float(os.getenv("SUBSCRIPTION_CACHE_TTL", "600"))
+SUBSCRIPTION_NEGATIVE_TTL = float(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "60"))
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "100000"))
+SUBSCRIPTION_RECHECK_AGE = float(os.getenv("SUBSCRIPTION_RECHECK_AGE", str(SUBSCRIPTION_CACHE_TTL * 0.8)))
+SUBSCRIPTION_SWEEP_INTERVAL = float(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL", "60"))
+SUBSCRIPTION_SWEEP_RATE = float(os.getenv("SUBSCRIPTION_SWEEP_RATE", "2"))
 CARDS_DIR = Path("assets/cards")
 CARD_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+CARD_IMAGE_HEIGHT = int(os.getenv("CARD_IMAGE_HEIGHT", "720"))
+CARD_CACHE_MAX_BYTES = int(os.getenv("CARD_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TELEGRAM_FILE_CACHE = os.getenv("TELEGRAM_FILE_CACHE", "1") == "1"
+COLLAGE_CACHE_MAX_BYTES = int(os.getenv("COLLAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+COLLAGE_EXECUTOR = os.getenv("COLLAGE_EXECUTOR", "process").strip().lower()
+COLLAGE_WORKERS = int(os.getenv("COLLAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+COLLAGE_MAX_PENDING = int(os.getenv("COLLAGE_MAX_PENDING", "16"))
+COLLAGE_METRICS_INTERVAL = float(os.getenv("COLLAGE_METRICS_INTERVAL", "300"))
 THREE_CARD_SPREAD_COST = 5
 DAILY_SPREAD_COST = 5
 INVITE_DIAMOND_REWARD = 10
 SUBSCRIPTION_DIAMOND_REWARD = 10
 SUBSCRIPTION_REQUIRED_FLAG = "requires_subscription"
-DEFAULT_USER = {
-    "free_granted": False,
-    "invited_count": 0,
-    "referred_by": None,
-    "registration_date": None,
-    "diamonds": 0,
-    "last_daily_spread_at": None,
-    "last_daily_gift_at": None,
-    "daily_spread_count": 0,
-    "last_daily_card": None,
-    "subscription_status": None,
-    "subscription_checked_at": None,
-}
 RELATION_OPTIONS: List[Tuple[str, str]] = [
     (f"Есть ли у него другая? {THREE_CARD_SPREAD_COST}💎", "REL_HAS_OTHER"),
     (f"Изменял ли он мне? {THREE_CARD_SPREAD_COST}💎", "REL_IS_CHEATING"),
@@ -112,17 +183,54 @@ SELF_SPREADS = [
     "Какую роль ты сейчас играешь",
 ]
 
-if not BOT_TOKEN:
-    raise RuntimeError("BOT_TOKEN is not set. Please provide it in the environment or .env file.")
+def check_bot_settings() -> None:
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN is not set. Please provide it in the environment or .env file.")
+
+    if not CHANNEL_USERNAME:
+        raise RuntimeError(
+            "CHANNEL_USERNAME is not set. Please provide it in the environment or .env file."
+        )
 
-if not CHANNEL_USERNAME:
-    raise RuntimeError(
-        "CHANNEL_USERNAME is not set. Please provide it in the environment or .env file."
+
+def build_llm_pool() -> Optional[LLMClientPool]:
+    endpoints = parse_endpoints(OPENAI_API_KEYS, LLM_BASE_URL)
+    if not endpoints:
+        return None
+    return LLMClientPool(
+        [
+            build_pooled_key(
+                endpoint,
+                max_connections=LLM_POOL_MAX_CONNECTIONS,
+                max_keepalive=LLM_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
+                default_cooldown=LLM_RATE_LIMIT_COOLDOWN,
+            )
+            for endpoint in endpoints
+        ]
     )
 
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
 router = Router()
+user_locks = UserLockManager()
+referral_tasks: Set[asyncio.Task] = set()
+bot_api_calls = SingleFlight()
+_bot_profiles: Dict[int, User] = {}
+_llm_pool: Optional[LLMClientPool] = None
+_io_executor: Optional[IOExecutor] = None
+_user_storage: Optional[AsyncUserStorage] = None
+_diamond_ledger: Optional[DiamondLedger] = None
+_subscription_cache: Optional[SubscriptionCache] = None
+_interpretation_cache: Optional[InterpretationCache] = None
+_interpretation_catalog: Optional[InterpretationCatalog] = None
+_spread_cache: Optional[TinyLFUCache] = None
+_llm_scheduler: Optional[LLMScheduler] = None
+_llm_caller: Optional[ResilientCaller] = None
+_prompt_registry: Optional[PromptRegistry] = None
+_clarify_cache: Optional[QuestionSimilarityCache] = None
+_card_images: Optional[CardImageCache] = None
+_collage_renderer: Optional[CollageRenderer] = None
+_telegram_files: Optional[TelegramFileCache] = None
 
 
 class SpreadStates(StatesGroup):
@@ -130,31 +238,210 @@ class SpreadStates(StatesGroup):
     waiting_for_clarify = State()
 
 
-def ensure_data_file() -> None:
-    DATA_FILE.parent.mkdir(parents=True, exist_ok=True)
-    if not DATA_FILE.exists():
-        DATA_FILE.write_text("{}", encoding="utf-8")
+def get_llm_pool() -> Optional[LLMClientPool]:
+    global _llm_pool
+    if not LLM_ENABLED:
+        return None
+    if _llm_pool is None:
+        _llm_pool = build_llm_pool()
+    return _llm_pool
+
 
+async def close_llm_pool() -> None:
+    global _llm_pool
+    if _llm_pool is not None:
+        logging.info("Ключи LLM: %s", _llm_pool.stats())
+        await _llm_pool.close()
+        _llm_pool = None
+
+
+def get_io_executor() -> IOExecutor:
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = IOExecutor(max_workers=STORAGE_IO_WORKERS, max_pending=STORAGE_IO_MAX_PENDING)
+    return _io_executor
+
+
+async def run_io(func: Any, *args: Any, **kwargs: Any) -> Any:
+    return await get_io_executor().run(func, *args, **kwargs)
+
+
+def get_user_storage() -> AsyncUserStorage:
+    global _user_storage
+    if _user_storage is None:
+        cache = CachedUserStorage(
+            create_user_storage(USER_STORAGE_BACKEND, DATA_FILE, shards=USER_SHARDS),
+            flush_threshold=USER_FLUSH_THRESHOLD,
+            preload=USER_STORAGE_BACKEND == "json",
+            max_records=USER_CACHE_MAX_RECORDS,
+        )
+        _user_storage = AsyncUserStorage(cache, get_io_executor())
+    return _user_storage
+
+
+def close_user_storage() -> None:
+    global _user_storage
+    if _user_storage is not None:
+        _user_storage.close()
+        _user_storage = None
+
+
+def get_diamond_ledger() -> DiamondLedger:
+    global _diamond_ledger
+    if _diamond_ledger is None:
+        ledger = DiamondLedger(DATA_FILE.parent / "diamonds.log", DATA_FILE.parent / "diamonds.snapshot.json")
+        ledger.load()
+        _diamond_ledger = ledger
+    return _diamond_ledger
+
+
+def close_diamond_ledger() -> None:
+    global _diamond_ledger
+    if _diamond_ledger is not None:
+        _diamond_ledger.close()
+        _diamond_ledger = None
+
+
+def get_subscription_cache() -> SubscriptionCache:
+    global _subscription_cache
+    if _subscription_cache is None:
+        _subscription_cache = SubscriptionCache(
+            positive_ttl=SUBSCRIPTION_CACHE_TTL,
+            negative_ttl=SUBSCRIPTION_NEGATIVE_TTL,
+            max_entries=SUBSCRIPTION_CACHE_SIZE,
+        )
+    return _subscription_cache
+
+
+def get_interpretation_cache() -> InterpretationCache:
+    global _interpretation_cache
+    if _interpretation_cache is None:
+        cache = InterpretationCache(
+            variants=LLM_CACHE_VARIANTS,
+            ttl=LLM_CACHE_TTL,
+            max_keys=LLM_CACHE_MAX_KEYS,
+            path=DATA_FILE.parent / "interpretations.json" if LLM_CACHE_PERSIST else None,
+        )
+        cache.load()
+        _interpretation_cache = cache
+    return _interpretation_cache
+
+
+def close_interpretation_cache() -> None:
+    global _interpretation_cache
+    if _interpretation_cache is not None:
+        _interpretation_cache.save()
+        _interpretation_cache = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        _llm_scheduler = LLMScheduler(LLM_CONCURRENCY, max_queue=LLM_QUEUE_SIZE, max_wait=LLM_QUEUE_MAX_WAIT)
+    return _llm_scheduler
+
+
+def get_prompt_registry() -> PromptRegistry:
+    global _prompt_registry
+    if _prompt_registry is None:
+        _prompt_registry = PromptRegistry(LLM_SYSTEM_PROMPT, LLM_SYSTEM_PROMPT_DAY, LLM_SYSTEM_PROMPT_3)
+    return _prompt_registry
+
+
+def get_llm_caller() -> ResilientCaller:
+    global _llm_caller
+    if _llm_caller is None:
+        _llm_caller = ResilientCaller(
+            CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET),
+            retries=LLM_RETRIES,
+            base_delay=LLM_RETRY_BASE_DELAY,
+            max_delay=LLM_RETRY_MAX_DELAY,
+            hedge_percentile=LLM_HEDGE_PERCENTILE,
+            hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+            hedge_limiter=get_llm_scheduler(),
+            hedge_priority=PRIORITY_BACKGROUND,
+        )
+    return _llm_caller
+
+
+def get_card_images() -> CardImageCache:
+    global _card_images
+    if _card_images is None:
+        _card_images = CardImageCache(CARD_IMAGE_HEIGHT, CARD_CACHE_MAX_BYTES, COLLAGE_CACHE_MAX_BYTES)
+    return _card_images
+
+
+def get_collage_renderer() -> CollageRenderer:
+    global _collage_renderer
+    if _collage_renderer is None:
+        _collage_renderer = CollageRenderer(
+            get_card_images(), mode=COLLAGE_EXECUTOR, workers=COLLAGE_WORKERS, max_pending=COLLAGE_MAX_PENDING
+        )
+    return _collage_renderer
 
-def load_users() -> Dict[str, Dict[str, Any]]:
-    ensure_data_file()
-    try:
-        return json.loads(DATA_FILE.read_text(encoding="utf-8"))
-    except json.JSONDecodeError:
-        logging.warning("User data file is corrupted. Resetting storage.")
-        DATA_FILE.write_text("{}", encoding="utf-8")
-        return {}
 
+def close_collage_renderer() -> None:
+    global _collage_renderer
+    if _collage_renderer is not None:
+        _collage_renderer.shutdown()
+        _collage_renderer = None
 
-def save_users(users: Dict[str, Dict[str, Any]]) -> None:
-    ensure_data_file()
-    DATA_FILE.write_text(json.dumps(users, ensure_ascii=False, indent=2), encoding="utf-8")
 
+def get_telegram_files() -> Optional[TelegramFileCache]:
+    global _telegram_files
+    if _telegram_files is None and TELEGRAM_FILE_CACHE:
+        _telegram_files = TelegramFileCache(DATA_FILE.parent / "file_ids.db")
+    return _telegram_files
 
-def ensure_user_defaults(user: Dict[str, Any]) -> Dict[str, Any]:
-    updated = {**DEFAULT_USER, **(user or {})}
-    if not updated.get("registration_date"):
-        updated["registration_date"] = datetime.now(timezone.utc).isoformat()
+
+def close_telegram_files() -> None:
+    global _telegram_files
+    if _telegram_files is not None:
+        _telegram_files.close()
+        _telegram_files = None
+
+
+def get_clarify_cache() -> QuestionSimilarityCache:
+    global _clarify_cache
+    if _clarify_cache is None:
+        _clarify_cache = QuestionSimilarityCache(
+            CLARIFY_CACHE_THRESHOLD, per_card=CLARIFY_CACHE_PER_CARD, max_cards=CLARIFY_CACHE_MAX_CARDS
+        )
+    return _clarify_cache
+
+
+def get_spread_cache() -> TinyLFUCache:
+    global _spread_cache
+    if _spread_cache is None:
+        _spread_cache = TinyLFUCache(SPREAD_CACHE_MAX_BYTES)
+    return _spread_cache
+
+
+def get_interpretation_catalog() -> Optional[InterpretationCatalog]:
+    global _interpretation_catalog
+    path = DATA_FILE.parent / "catalog.db"
+    if _interpretation_catalog is None and path.exists():
+        _interpretation_catalog = InterpretationCatalog(path)
+    return _interpretation_catalog
+
+
+def close_interpretation_catalog() -> None:
+    global _interpretation_catalog
+    if _interpretation_catalog is not None:
+        _interpretation_catalog.close()
+        _interpretation_catalog = None
+
+
+def change_diamonds(user_id: int, user: UserRecord, delta: int, reason: str) -> int:
+    balance = get_diamond_ledger().apply(user_id, delta, reason, opening_balance=user.get("diamonds", 0))
+    user["diamonds"] = balance
+    return balance
+
+
+def ensure_user_defaults(user: UserRecord | Dict[str, Any] | None) -> UserRecord:
+    updated = user.copy() if isinstance(user, UserRecord) else UserRecord.from_dict(user or {})
+    if updated.registration_date is None:
+        updated.registration_date = timestamp_now()
     return updated
 
 
@@ -166,10 +453,8 @@ def subscription_required(handler: Any) -> Any:
     return handler
 
 
-def save_user_record(user_id: int, user: Dict[str, Any]) -> None:
-    users = load_users()
-    users[str(user_id)] = ensure_user_defaults(user)
-    save_users(users)
+def save_user_record(user_id: int, user: UserRecord) -> None:
+    get_user_storage().put(user_id, ensure_user_defaults(user))
 
 
 def build_subscription_keyboard() -> InlineKeyboardMarkup:
@@ -291,41 +576,41 @@ def load_card_files() -> List[Path]:
     ]
 
 
-def create_three_card_collage(card_paths: List[Path]) -> BufferedInputFile:
-    images = []
-    for path in card_paths:
-        with Image.open(path) as img:
-            images.append(img.convert("RGB"))
+async def create_three_card_collage(card_paths: List[Path]) -> BufferedInputFile:
+    return BufferedInputFile(await get_collage_renderer().render(card_paths), filename="three_cards.jpg")
 
-    target_height = max(image.height for image in images)
-    resized_images = []
-    for image in images:
-        if image.height != target_height:
-            new_width = int(image.width * (target_height / image.height))
-            resized_images.append(image.resize((new_width, target_height)))
-        else:
-            resized_images.append(image)
-
-    total_width = sum(image.width for image in resized_images)
-    collage = Image.new("RGB", (total_width, target_height))
-    offset = 0
-    for image in resized_images:
-        collage.paste(image, (offset, 0))
-        offset += image.width
-
-    buffer = BytesIO()
-    collage.save(buffer, format="JPEG")
-    buffer.seek(0)
-    return BufferedInputFile(buffer.getvalue(), filename="three_cards.jpg")
-
-
-def get_user_record(user_id: int) -> Dict[str, Any]:
-    users = load_users()
-    user_key = str(user_id)
-    user = ensure_user_defaults(users.get(user_key, {}))
-    if users.get(user_key) != user:
-        users[user_key] = user
-        save_users(users)
+
+async def send_photo_cached(
+    message: Message, key_builder: Callable[[TelegramFileCache], str], build: Callable[[], Awaitable[InputFile]]
+) -> None:
+    files = get_telegram_files()
+    key = None
+    if files is not None:
+        try:
+            key = await run_io(key_builder, files)
+        except OSError as exc:
+            logging.warning("Не удалось вычислить ключ изображения: %s", exc)
+    if key is not None:
+        file_id = files.get(message.bot.id, key)
+        if file_id:
+            try:
+                await message.answer_photo(file_id)
+                return
+            except TelegramBadRequest as exc:
+                logging.warning("Сохранённый file_id для %s не принят Telegram: %s", key, exc)
+                await run_io(files.forget, message.bot.id, key)
+    sent = await message.answer_photo(await build())
+    if key is not None and sent.photo:
+        await run_io(files.put, message.bot.id, key, sent.photo[-1].file_id)
+
+
+async def get_user_record(user_id: int) -> UserRecord:
+    storage = get_user_storage()
+    stored = await storage.get(user_id)
+    user = ensure_user_defaults(stored)
+    if stored != user:
+        storage.put(user_id, user)
+    user["diamonds"] = get_diamond_ledger().balance(user_id, default=user["diamonds"])
     return user
 
 
@@ -349,29 +634,12 @@ def render_markers_to_html(text: str) -> str:
     return text.replace("[B]", "<b>").replace("[/B]", "</b>")
 
 
-def iso_to_datetime(value: Optional[str]) -> Optional[datetime]:
-    if not value:
-        return None
-    try:
-        dt = datetime.fromisoformat(value)
-        if dt.tzinfo is None:
-            return dt.replace(tzinfo=timezone.utc)
-        return dt
-    except ValueError:
-        return None
-
-
-def now_utc() -> datetime:
-    return datetime.now(timezone.utc)
-
-
-def is_on_cooldown(last_ts: Optional[str], cooldown: timedelta) -> tuple[bool, int]:
-    last_dt = iso_to_datetime(last_ts)
-    if not last_dt:
+def is_on_cooldown(last_ts: Optional[int], cooldown: timedelta) -> tuple[bool, int]:
+    if last_ts is None:
         return False, 0
-    elapsed = now_utc() - last_dt
-    remaining = cooldown - elapsed
-    remaining_seconds = int(remaining.total_seconds())
+    elapsed_us = timestamp_now() - last_ts
+    remaining_us = cooldown // timedelta(microseconds=1) - elapsed_us
+    remaining_seconds = int(remaining_us / 1_000_000)
     return remaining_seconds > 0, max(0, remaining_seconds)
 
 
@@ -395,22 +663,69 @@ def evaluate_slot_reward(value: int) -> tuple[int, str]:
     return 5, "❌ Не совпало — Жабка даёт 5 кристалликов"
 
 
-async def ensure_subscribed(bot: Bot, user_id: int, message_or_callback: Message | CallbackQuery) -> bool:
+async def cached_subscription_status(user_id: int) -> Optional[str]:
+    cache = get_subscription_cache()
+    status = cache.get(user_id)
+    if status is not None:
+        return status
+    user = await get_user_record(user_id)
+    return cache.seed(user_id, user.subscription_status, user.subscription_checked_at)
+
+
+async def fetch_subscription_status(bot: Bot, user_id: int) -> Optional[str]:
     try:
         member = await bot.get_chat_member(CHANNEL_USERNAME, user_id)
         status = member.status
     except Exception as exc:  # noqa: BLE001
         logging.warning("Не удалось проверить подписку: %s", exc)
-        status = None
+        return None
 
-    if status is not None:
-        user = get_user_record(user_id)
-        user["subscription_status"] = status
-        user["subscription_checked_at"] = now_utc().isoformat()
-        if status not in {ChatMemberStatus.LEFT, ChatMemberStatus.KICKED} and not user.get("free_granted"):
-            user["diamonds"] = user.get("diamonds", 0) + SUBSCRIPTION_DIAMOND_REWARD
-            user["free_granted"] = True
-        save_user_record(user_id, user)
+    return apply_subscription_status(user_id, await get_user_record(user_id), status)
+
+
+def apply_subscription_status(user_id: int, user: UserRecord, status: str) -> str:
+    user["subscription_status"] = status
+    user["subscription_checked_at"] = timestamp_now()
+    if status not in UNSUBSCRIBED_STATUSES and not user.get("free_granted"):
+        change_diamonds(user_id, user, SUBSCRIPTION_DIAMOND_REWARD, "subscription")
+        user["free_granted"] = True
+    save_user_record(user_id, user)
+    get_subscription_cache().put(user_id, user.subscription_status, user.subscription_checked_at)
+    return user.subscription_status
+
+
+async def get_bot_profile(bot: Bot) -> User:
+    profile = _bot_profiles.get(bot.id)
+    if profile is None:
+        profile = _bot_profiles[bot.id] = await bot_api_calls.do(("get_me", bot.id), bot.get_me)
+    return profile
+
+
+def is_subscription_channel(chat: Chat) -> bool:
+    channel = CHANNEL_USERNAME.lstrip("@").lower()
+    return channel == (chat.username or "").lower() or CHANNEL_USERNAME == str(chat.id)
+
+
+async def recheck_subscription(bot: Bot, user_id: int, checked_before: int) -> bool:
+    async with user_locks.hold(user_id):
+        stored = await get_user_storage().get(user_id)
+        checked_at = stored.subscription_checked_at if stored is not None else None
+        if checked_at is None or checked_at >= checked_before:
+            return False
+        await fetch_subscription_status(bot, user_id)
+    return True
+
+
+async def ensure_subscribed(
+    bot: Bot,
+    user_id: int,
+    message_or_callback: Message | CallbackQuery,
+    *,
+    force: bool = False,
+) -> bool:
+    status = None if force else await cached_subscription_status(user_id)
+    if status is None:
+        status = await fetch_subscription_status(bot, user_id)
 
     is_callback = isinstance(message_or_callback, CallbackQuery) or hasattr(message_or_callback, "message")
 
@@ -428,7 +743,7 @@ async def ensure_subscribed(bot: Bot, user_id: int, message_or_callback: Message
             await message_or_callback.answer(text, reply_markup=build_subscription_keyboard())
         return False
 
-    if status in {ChatMemberStatus.LEFT, ChatMemberStatus.KICKED}:
+    if status in UNSUBSCRIBED_STATUSES:
         text = "Для использования бота подпишитесь на канал"
         keyboard = build_subscription_keyboard()
         if is_callback:
@@ -475,8 +790,9 @@ class SubscriptionMiddleware(BaseMiddleware):
         return await handler(event, clean_data)
 
 
-def format_profile_text(user: Dict[str, Any]) -> str:
-    reg_dt = iso_to_datetime(user.get("registration_date"))
+def format_profile_text(user: UserRecord) -> str:
+    registration_date = user.get("registration_date")
+    reg_dt = timestamp_to_datetime(registration_date) if registration_date is not None else None
     reg_str = reg_dt.strftime("%Y-%m-%d %H:%M UTC") if reg_dt else "неизвестно"
     diamonds = user.get("diamonds", 0)
     invited = user.get("invited_count", 0)
@@ -491,46 +807,139 @@ def format_profile_text(user: Dict[str, Any]) -> str:
     )
 
 
-async def call_llm(messages: List[Dict[str, str]], max_tokens: int, mode: str) -> Optional[str]:
-    if not (LLM_ENABLED and openai_client):
-        return None
+def llm_sampling_params(max_tokens: int) -> Dict[str, Any]:
+    return {
+        "max_tokens": max_tokens,
+        "temperature": LLM_TEMPERATURE,
+        "top_p": LLM_TOP_P,
+        "frequency_penalty": LLM_FREQUENCY_PENALTY,
+        "presence_penalty": LLM_PRESENCE_PENALTY,
+        "seed": int(LLM_SEED) if LLM_SEED is not None else None,
+    }
 
-    try:
-        response = await openai_client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=LLM_TEMPERATURE,
-            top_p=LLM_TOP_P,
-            frequency_penalty=LLM_FREQUENCY_PENALTY,
-            presence_penalty=LLM_PRESENCE_PENALTY,
-            seed=int(LLM_SEED) if LLM_SEED is not None else None,
+
+def prompt_max_tokens(prompt_key: str) -> int:
+    config = PROMPT_REGISTRY.get(prompt_key)
+    return LLM_MAX_TOKENS_DAY if config and config.mode == "DAY" else LLM_MAX_TOKENS_3
+
+
+def build_interpretation_messages(prompt_key: str, **fields: str) -> List[Dict[str, str]]:
+    return get_prompt_registry().build(prompt_key, **fields)
+
+
+def interpretation_fingerprint(prompt_key: str, subject: str, messages: List[Dict[str, str]]) -> str:
+    return interpretation_key(prompt_key, subject, messages, LLM_MODEL, llm_sampling_params(prompt_max_tokens(prompt_key)))
+
+
+async def lookup_catalog(prompt_key: str, subject: str, fingerprint: str) -> Optional[str]:
+    catalog = get_interpretation_catalog()
+    if catalog is None:
+        return None
+    return await run_io(catalog.lookup, prompt_key, subject, fingerprint)
+
+
+def log_llm_usage(mode: str, usage: Any) -> None:
+    if usage:
+        logging.info(
+            "OpenAI usage mode=%s prompt=%s completion=%s total=%s temperature=%s top_p=%s frequency_penalty=%s presence_penalty=%s seed=%s",
+            mode,
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None),
+            getattr(usage, "total_tokens", None),
+            LLM_TEMPERATURE,
+            LLM_TOP_P,
+            LLM_FREQUENCY_PENALTY,
+            LLM_PRESENCE_PENALTY,
+            LLM_SEED,
         )
-        usage = getattr(response, "usage", None)
-        if usage:
-            logging.info(
-                "OpenAI usage mode=%s prompt=%s completion=%s total=%s temperature=%s top_p=%s frequency_penalty=%s presence_penalty=%s seed=%s",
-                mode,
-                getattr(usage, "prompt_tokens", None),
-                getattr(usage, "completion_tokens", None),
-                getattr(usage, "total_tokens", None),
-                LLM_TEMPERATURE,
-                LLM_TOP_P,
-                LLM_FREQUENCY_PENALTY,
-                LLM_PRESENCE_PENALTY,
-                LLM_SEED,
-            )
-        else:
-            logging.info(
-                "OpenAI usage missing mode=%s temperature=%s top_p=%s frequency_penalty=%s presence_penalty=%s seed=%s",
-                mode,
-                LLM_TEMPERATURE,
-                LLM_TOP_P,
-                LLM_FREQUENCY_PENALTY,
-                LLM_PRESENCE_PENALTY,
-                LLM_SEED,
+    else:
+        logging.info(
+            "OpenAI usage missing mode=%s temperature=%s top_p=%s frequency_penalty=%s presence_penalty=%s seed=%s",
+            mode,
+            LLM_TEMPERATURE,
+            LLM_TOP_P,
+            LLM_FREQUENCY_PENALTY,
+            LLM_PRESENCE_PENALTY,
+            LLM_SEED,
+        )
+
+
+async def stream_llm(
+    client: Any,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    mode: str,
+    on_delta: Callable[[str], Awaitable[None]],
+) -> Optional[str]:
+    stream = await client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        **llm_sampling_params(max_tokens),
+    )
+    text = ""
+    usage = None
+    async for chunk in stream:
+        usage = getattr(chunk, "usage", None) or usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            text += delta
+            await on_delta(text)
+    log_llm_usage(mode, usage)
+    return text or None
+
+
+def llm_deadline(mode: str, max_tokens: int) -> float:
+    if mode == "THREE" or max_tokens > LLM_MAX_TOKENS_DAY:
+        return LLM_TIMEOUT_THREE
+    return LLM_TIMEOUT_DAY
+
+
+async def call_llm(
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    mode: str,
+    on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    priority: Optional[int] = None,
+) -> Optional[str]:
+    llm_pool = get_llm_pool()
+    if llm_pool is None:
+        return None
+    if priority is None:
+        priority = PRIORITY_THREE if mode == "THREE" else PRIORITY_DAY
+
+    caller = get_llm_caller()
+
+    async def request() -> Optional[str]:
+        async with llm_pool.client() as client:
+            if on_delta is not None:
+                return await stream_llm(client, messages, max_tokens, mode, on_delta)
+            response = await client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=messages,
+                **llm_sampling_params(max_tokens),
             )
+        log_llm_usage(mode, getattr(response, "usage", None))
         return response.choices[0].message.content if response.choices else None
+
+    try:
+        if caller.breaker.is_open:
+            raise caller.short_circuit()
+        async with get_llm_scheduler().slot(priority):
+            return await caller.call(request, deadline=llm_deadline(mode, max_tokens), hedge=on_delta is None)
+    except (SchedulerOverloaded, SchedulerTimeout) as exc:
+        logging.warning("Запрос к LLM отклонён из-за перегрузки mode=%s: %s", mode, exc)
+        return None
+    except CircuitOpenError:
+        logging.warning("LLM временно недоступен, используем запасной текст mode=%s", mode)
+        return None
+    except PoolExhausted as exc:
+        logging.warning("Все ключи LLM упёрлись в лимит, используем запасной текст mode=%s: %s", mode, exc)
+        return None
+    except asyncio.TimeoutError:
+        logging.warning("LLM не ответил вовремя mode=%s", mode)
+        return None
     except Exception as exc:  # noqa: BLE001
         logging.warning("Не удалось получить ответ от LLM: %s", exc)
         return None
@@ -547,56 +956,106 @@ async def send_rendered_message(
         await message.answer(text, reply_markup=reply_markup)
 
 
-async def generate_card_day_interpretation(card_name: str) -> str:
-    fallback = f"[B]Карта дня:[/B] {card_name}. Интерпретация будет добавлена позже."
-    messages = build_prompt_messages(
-        "card_day",
-        base_prompt=LLM_SYSTEM_PROMPT,
-        day_prompt=LLM_SYSTEM_PROMPT_DAY,
-        three_prompt=LLM_SYSTEM_PROMPT_3,
-        card_name=card_name,
+def make_streaming_reply(
+    message: Message, reply_markup: Optional[ReplyKeyboardMarkup | InlineKeyboardMarkup]
+) -> Optional[StreamingReply]:
+    if not LLM_STREAMING:
+        return None
+    return StreamingReply(
+        message,
+        render_markers_to_html,
+        placeholder="🐸 Жабка смотрит на карты…",
+        reply_markup=reply_markup,
+        min_interval=LLM_STREAM_EDIT_INTERVAL,
     )
 
-    text = await call_llm(messages=messages, max_tokens=LLM_MAX_TOKENS_DAY, mode="DAY")
-    return text or fallback
+
+async def call_llm_with_reply(
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    mode: str,
+    reply: Optional[StreamingReply],
+    priority: Optional[int] = None,
+) -> Optional[str]:
+    if reply is None or get_llm_pool() is None:
+        return await call_llm(messages=messages, max_tokens=max_tokens, mode=mode, priority=priority)
+    await reply.start()
+    return await call_llm(messages=messages, max_tokens=max_tokens, mode=mode, on_delta=reply.update, priority=priority)
+
+
+async def deliver_interpretation(
+    message: Message,
+    reply: Optional[StreamingReply],
+    text: str,
+    reply_markup: Optional[ReplyKeyboardMarkup | InlineKeyboardMarkup],
+) -> None:
+    if reply is None or not await reply.finish(text):
+        await send_rendered_message(message, text, reply_markup=reply_markup)
 
 
-async def generate_prompt_interpretation(prompt_key: str, question: str = "", card_names: List[str] | None = None) -> str:
+async def generate_card_day_interpretation(card_name: str, reply: Optional[StreamingReply] = None) -> str:
+    fallback = f"[B]Карта дня:[/B] {card_name}. Интерпретация будет добавлена позже."
+    messages = build_interpretation_messages("card_day", card_name=card_name)
+    key = interpretation_fingerprint("card_day", card_name, messages)
+    precomputed = await lookup_catalog("card_day", card_name, key)
+    if precomputed:
+        return precomputed
+
+    cache = get_interpretation_cache()
+    cached = cache.get(key)
+    if cached:
+        return cached
+    text = await call_llm_with_reply(messages, LLM_MAX_TOKENS_DAY, "DAY", reply)
+    if text:
+        cache.add(key, text)
+        return text
+    return cache.any(key) or fallback
+
+
+async def generate_prompt_interpretation(
+    prompt_key: str,
+    question: str = "",
+    card_names: List[str] | None = None,
+    reply: Optional[StreamingReply] = None,
+) -> str:
     card_names = card_names or []
     joined_cards = ", ".join(card_names)
     safe_question = question or ""
     config = PROMPT_REGISTRY.get(prompt_key)
     mode = config.mode if config else "THREE"
-    messages = build_prompt_messages(
-        prompt_key,
-        base_prompt=LLM_SYSTEM_PROMPT,
-        day_prompt=LLM_SYSTEM_PROMPT_DAY,
-        three_prompt=LLM_SYSTEM_PROMPT_3,
-        question=safe_question,
-        cards=joined_cards,
-    )
+    messages = build_interpretation_messages(prompt_key, question=safe_question, cards=joined_cards)
+    key = None
+    if not safe_question:
+        key = interpretation_fingerprint(prompt_key, joined_cards, messages)
+        precomputed = await lookup_catalog(prompt_key, joined_cards, key)
+        if precomputed:
+            return precomputed
+        cached = get_spread_cache().get(key)
+        if cached:
+            return cached
     fallback = "[B]Интерпретация недоступна.[/B] Позже добавим подробности по раскладу."
-    max_tokens = LLM_MAX_TOKENS_DAY if mode == "DAY" else LLM_MAX_TOKENS_3
-    text = await call_llm(messages=messages, max_tokens=max_tokens, mode=mode)
+    text = await call_llm_with_reply(messages, prompt_max_tokens(prompt_key), mode, reply)
+    if text and key is not None:
+        get_spread_cache().put(key, text)
     return text or fallback
 
 
-async def generate_clarify_interpretation(card_name: str, question: str) -> str:
-    messages = build_prompt_messages(
-        "clarify",
-        base_prompt=LLM_SYSTEM_PROMPT,
-        day_prompt=LLM_SYSTEM_PROMPT_DAY,
-        three_prompt=LLM_SYSTEM_PROMPT_3,
-        card_name=card_name,
-        question=question,
-    )
+async def generate_clarify_interpretation(card_name: str, question: str, reply: Optional[StreamingReply] = None) -> str:
+    messages = build_interpretation_messages("clarify", card_name=card_name, question=question)
+    cache = get_clarify_cache()
+    scope = interpretation_fingerprint("clarify", card_name, build_interpretation_messages("clarify", card_name=card_name))
+    cached = cache.get(scope, question)
+    if cached:
+        return cached
     fallback = "[B]Уточнение временно недоступно.[/B] Попробуйте позже."
-    text = await call_llm(messages=messages, max_tokens=LLM_MAX_TOKENS_DAY, mode="DAY")
+    text = await call_llm_with_reply(messages, LLM_MAX_TOKENS_DAY, "DAY", reply, priority=PRIORITY_CLARIFY)
+    if text:
+        cache.put(scope, question, text)
     return text or fallback
 
 
 async def process_prompt_spread(message: Message, prompt_key: str, question: str = "") -> bool:
-    user = get_user_record(message.from_user.id)
+    user = await get_user_record(message.from_user.id)
     diamonds = user.get("diamonds", 0)
     if diamonds < THREE_CARD_SPREAD_COST:
         await message.answer(
@@ -605,7 +1064,7 @@ async def process_prompt_spread(message: Message, prompt_key: str, question: str
         )
         return False
 
-    card_files = load_card_files()
+    card_files = await run_io(load_card_files)
     if len(card_files) < 3:
         await message.answer(
             "Недостаточно карт в базе, добавьте не менее 3 изображений в assets/cards.",
@@ -614,54 +1073,66 @@ async def process_prompt_spread(message: Message, prompt_key: str, question: str
         return False
 
     selected_cards = random.sample(card_files, 3)
-    collage_file = create_three_card_collage(selected_cards)
-    await message.answer_photo(collage_file)
+
+    async def build_collage() -> InputFile:
+        return await create_three_card_collage(selected_cards)
+
+    await send_photo_cached(message, lambda files: files.collage_key(selected_cards, CARD_IMAGE_HEIGHT), build_collage)
 
     card_names = [card.stem for card in selected_cards]
     card_names_text = "Выпали карты: " + ", ".join(card_names)
     await message.answer(card_names_text)
-    interpretation = await generate_prompt_interpretation(prompt_key, question=question, card_names=card_names)
-    await send_rendered_message(message, interpretation, reply_markup=build_menu_keyboard())
+    keyboard = build_menu_keyboard()
+    reply = make_streaming_reply(message, keyboard)
+    interpretation = await generate_prompt_interpretation(
+        prompt_key, question=question, card_names=card_names, reply=reply
+    )
+    await deliver_interpretation(message, reply, interpretation, keyboard)
 
-    user["diamonds"] = max(0, diamonds - THREE_CARD_SPREAD_COST)
+    change_diamonds(message.from_user.id, user, -THREE_CARD_SPREAD_COST, f"spread:{prompt_key}")
     save_user_record(message.from_user.id, user)
     return True
 
 
+async def reward_inviter(bot: Bot, inviter_id: int, user_id: int) -> None:
+    async with user_locks.hold(inviter_id):
+        inviter_record = await get_user_record(inviter_id)
+        change_diamonds(inviter_id, inviter_record, INVITE_DIAMOND_REWARD, f"referral:{user_id}")
+        inviter_record["invited_count"] += 1
+        save_user_record(inviter_id, inviter_record)
+    try:
+        await bot.send_message(
+            inviter_id,
+            f"Вам начислено {INVITE_DIAMOND_REWARD}💎 за приглашенного друга. "
+            f"Доступно {inviter_record['diamonds']}💎",
+        )
+    except Exception as exc:  # noqa: BLE001
+        logging.info("Не удалось отправить уведомление приглашавшему %s: %s", inviter_id, exc)
+
+
 @router.message(CommandStart())
 async def handle_start(message: Message, bot: Bot) -> None:
-    users = load_users()
+    storage = get_user_storage()
     user_id = message.from_user.id
-    user_key = str(user_id)
-    is_new_user = user_key not in users
+    stored_user = await storage.get(user_id)
+    is_new_user = stored_user is None
     payload_text = extract_start_payload(message)
     referral_payload = parse_referral_id(payload_text) if payload_text else None
 
     if is_new_user:
         new_user_record = ensure_user_defaults({})
+        updates = {user_id: new_user_record}
         if referral_payload and referral_payload != user_id:
-            inviter_key = str(referral_payload)
-            inviter_record = ensure_user_defaults(users.get(inviter_key, {}))
-            inviter_record["diamonds"] = inviter_record.get("diamonds", 0) + INVITE_DIAMOND_REWARD
-            inviter_record["invited_count"] += 1
-            users[inviter_key] = inviter_record
             new_user_record["referred_by"] = referral_payload
-            try:
-                await bot.send_message(
-                    referral_payload,
-                    f"Вам начислено {INVITE_DIAMOND_REWARD}💎 за приглашенного друга. "
-                    f"Доступно {inviter_record['diamonds']}💎",
-                )
-            except Exception as exc:  # noqa: BLE001
-                logging.info("Не удалось отправить уведомление приглашавшему %s: %s", referral_payload, exc)
-
-        users[user_key] = new_user_record
-        save_users(users)
+        storage.put(user_id, new_user_record)
+        if "referred_by" in new_user_record:
+            task = asyncio.create_task(reward_inviter(bot, referral_payload, user_id))
+            referral_tasks.add(task)
+            task.add_done_callback(referral_tasks.discard)
     else:
-        current_user = ensure_user_defaults(users.get(user_key, {}))
-        if users.get(user_key) != current_user:
-            users[user_key] = current_user
-            save_users(users)
+        current_user = ensure_user_defaults(stored_user)
+        if stored_user != current_user:
+            storage.put(user_id, current_user)
 
     subscribed = await ensure_subscribed(bot, user_id, message)
     if not subscribed:
@@ -677,7 +1148,7 @@ async def handle_start(message: Message, bot: Bot) -> None:
 
 @router.callback_query(lambda c: c.data == "check_subscription")
 async def handle_check_subscription(callback: CallbackQuery, bot: Bot) -> None:
-    subscribed = await ensure_subscribed(bot, callback.from_user.id, callback)
+    subscribed = await ensure_subscribed(bot, callback.from_user.id, callback, force=True)
     if not subscribed:
         return
 
@@ -689,11 +1160,22 @@ async def handle_check_subscription(callback: CallbackQuery, bot: Bot) -> None:
     )
 
 
+@router.chat_member()
+async def handle_channel_member(update: ChatMemberUpdated) -> None:
+    if not is_subscription_channel(update.chat):
+        return
+    member = update.new_chat_member
+    if await get_user_storage().get(member.user.id) is None:
+        return
+    user = await get_user_record(member.user.id)
+    apply_subscription_status(member.user.id, user, member.status)
+
+
 @subscription_required
 @router.message(F.text.in_({"Меню", "⬅️ В меню", "⬅️Назад"}))
 async def handle_menu(message: Message, state: FSMContext) -> None:
     await state.clear()
-    user = get_user_record(message.from_user.id)
+    user = await get_user_record(message.from_user.id)
     diamonds = user.get("diamonds", 0)
 
     await message.answer(
@@ -707,7 +1189,7 @@ async def handle_menu(message: Message, state: FSMContext) -> None:
 @router.message(F.text.in_({"Профиль", "⚙️ Профиль", "👤 Профиль"}))
 async def handle_profile(message: Message, state: FSMContext) -> None:
     await state.clear()
-    user = get_user_record(message.from_user.id)
+    user = await get_user_record(message.from_user.id)
     await send_rendered_message(
         message,
         format_profile_text(user),
@@ -792,22 +1274,28 @@ async def handle_get_diamonds(message: Message, state: FSMContext) -> None:
 
 
 async def process_card_of_day(
-    message: Message, user: Dict[str, Any], card_files: List[Path], *, cost: int
+    message: Message, user: UserRecord, card_files: List[Path], *, cost: int
 ) -> None:
     card_path = random.choice(card_files)
-    await message.answer_photo(FSInputFile(card_path))
-    interpretation = await generate_card_day_interpretation(card_path.stem)
-    await send_rendered_message(message, interpretation, reply_markup=build_clarify_keyboard())
-    user["last_daily_spread_at"] = now_utc().isoformat()
+
+    async def build_card() -> InputFile:
+        return FSInputFile(card_path)
+
+    await send_photo_cached(message, lambda files: files.content_key(card_path), build_card)
+    keyboard = build_clarify_keyboard()
+    reply = make_streaming_reply(message, keyboard)
+    interpretation = await generate_card_day_interpretation(card_path.stem, reply=reply)
+    await deliver_interpretation(message, reply, interpretation, keyboard)
+    user["last_daily_spread_at"] = timestamp_now()
     user["daily_spread_count"] = user.get("daily_spread_count", 0) + 1
     user["last_daily_card"] = card_path.stem
-    user["diamonds"] = max(0, user.get("diamonds", 0) - cost)
+    change_diamonds(message.from_user.id, user, -cost, "card_of_day")
     save_user_record(message.from_user.id, user)
 
 
 async def trigger_daily_spread(user_id: int, message: Message) -> None:
-    user = get_user_record(user_id)
-    card_files = load_card_files()
+    user = await get_user_record(user_id)
+    card_files = await run_io(load_card_files)
     if not card_files:
         await message.answer(
             "Нет карт в базе, добавьте изображения в assets/cards.",
@@ -847,7 +1335,7 @@ async def handle_advanced_entry(message: Message, state: FSMContext) -> None:
 @router.message(F.text == "Расклад из 3 карт")
 async def handle_advanced_spread_choice(message: Message, state: FSMContext) -> None:
     await state.clear()
-    user = get_user_record(message.from_user.id)
+    user = await get_user_record(message.from_user.id)
     diamonds = user.get("diamonds", 0)
     if diamonds < THREE_CARD_SPREAD_COST:
         await message.answer(
@@ -856,7 +1344,7 @@ async def handle_advanced_spread_choice(message: Message, state: FSMContext) ->
         )
         return
 
-    card_files = load_card_files()
+    card_files = await run_io(load_card_files)
     if len(card_files) < 3:
         await message.answer(
             "Недостаточно карт в базе, добавьте не менее 3 изображений в assets/cards.",
@@ -890,7 +1378,7 @@ async def handle_buy_diamonds(message: Message, state: FSMContext) -> None:
 @subscription_required
 @router.message(F.text.in_({"Пригласить друга", "Пригласить друзей"}))
 async def handle_invite_friend(message: Message, bot: Bot) -> None:
-    me = await bot.get_me()
+    me = await get_bot_profile(bot)
     bot_username = me.username
     if not bot_username:
         await message.answer("Не удалось получить имя бота для ссылки.", reply_markup=build_menu_keyboard())
@@ -907,7 +1395,7 @@ async def handle_invite_friend(message: Message, bot: Bot) -> None:
 @router.message(F.text.in_({"🎁 Подарок", "🎁Подарок", "🏛 Испытай судьбу"}))
 async def handle_daily_gift(message: Message, state: FSMContext) -> None:
     await state.clear()
-    user = get_user_record(message.from_user.id)
+    user = await get_user_record(message.from_user.id)
     on_cooldown, remaining = is_on_cooldown(user.get("last_daily_gift_at"), DAILY_GIFT_COOLDOWN)
     if on_cooldown:
         await message.answer(
@@ -931,7 +1419,7 @@ async def handle_daily_gift(message: Message, state: FSMContext) -> None:
 @router.callback_query(F.data == "roll_daily_gift")
 async def handle_roll_daily_gift(callback: CallbackQuery) -> None:
     await callback.answer()
-    user = get_user_record(callback.from_user.id)
+    user = await get_user_record(callback.from_user.id)
     on_cooldown, remaining = is_on_cooldown(user.get("last_daily_gift_at"), DAILY_GIFT_COOLDOWN)
     if on_cooldown:
         await callback.message.answer(
@@ -944,8 +1432,8 @@ async def handle_roll_daily_gift(callback: CallbackQuery) -> None:
     dice_value = dice_msg.dice.value if dice_msg.dice else 0
     reward, _ = evaluate_slot_reward(dice_value)
 
-    user["diamonds"] = user.get("diamonds", 0) + reward
-    user["last_daily_gift_at"] = now_utc().isoformat()
+    change_diamonds(callback.from_user.id, user, reward, "daily_gift")
+    user["last_daily_gift_at"] = timestamp_now()
     save_user_record(callback.from_user.id, user)
 
     await callback.message.answer(
@@ -999,7 +1487,7 @@ async def handle_leaf_selection(callback: CallbackQuery, state: FSMContext) -> N
 @router.message(F.text == "Уточняющий вопрос 10💎")
 async def handle_clarify_request(message: Message, state: FSMContext) -> None:
     await state.clear()
-    user = get_user_record(message.from_user.id)
+    user = await get_user_record(message.from_user.id)
     card_name = user.get("last_daily_card")
     if not card_name:
         await message.answer("Сначала получите расклад дня.", reply_markup=build_menu_keyboard())
@@ -1047,7 +1535,7 @@ async def handle_three_card_question(message: Message, state: FSMContext) -> Non
 @subscription_required
 @router.message(SpreadStates.waiting_for_clarify)
 async def handle_clarify_question(message: Message, state: FSMContext) -> None:
-    user = get_user_record(message.from_user.id)
+    user = await get_user_record(message.from_user.id)
     diamonds = user.get("diamonds", 0)
     if diamonds < CLARIFY_COST:
         await state.clear()
@@ -1065,14 +1553,17 @@ async def handle_clarify_question(message: Message, state: FSMContext) -> None:
         return
 
     question_text = message.text or ""
-    interpretation = await generate_clarify_interpretation(card_name, question_text)
-    user["diamonds"] = max(0, diamonds - CLARIFY_COST)
+    keyboard = build_menu_keyboard()
+    reply = make_streaming_reply(message, keyboard)
+    interpretation = await generate_clarify_interpretation(card_name, question_text, reply=reply)
+    change_diamonds(message.from_user.id, user, -CLARIFY_COST, "clarify")
     save_user_record(message.from_user.id, user)
-    await send_rendered_message(message, interpretation, reply_markup=build_menu_keyboard())
+    await deliver_interpretation(message, reply, interpretation, keyboard)
     await state.clear()
 
 
 async def main() -> None:
+    check_bot_settings()
     logging.basicConfig(level=logging.INFO)
     logging.info(
         "LLM params temperature=%s top_p=%s frequency_penalty=%s presence_penalty=%s seed=%s",
@@ -1082,8 +1573,11 @@ async def main() -> None:
         LLM_PRESENCE_PENALTY,
         LLM_SEED,
     )
+    prompt_registry = get_prompt_registry()
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dispatcher = Dispatcher(storage=MemoryStorage())
+    fsm_storage = SqliteFSMStorage(DATA_FILE.parent / "fsm.db", get_io_executor(), ttl=FSM_STATE_TTL)
+    dispatcher = Dispatcher(storage=fsm_storage)
+    dispatcher.update.outer_middleware(UserSerialMiddleware(user_locks))
     subscription_middleware = SubscriptionMiddleware(
         exempt_handlers={"handle_start", "handle_check_subscription"}
     )
@@ -1092,7 +1586,69 @@ async def main() -> None:
     dispatcher.include_router(router)
 
     await bot.delete_webhook(drop_pending_updates=True)
-    await dispatcher.start_polling(bot)
+    card_images = get_card_images()
+    collage_renderer = get_collage_renderer()
+    loaded_cards = await collage_renderer.start(await run_io(load_card_files))
+    logging.info(
+        "Загружено карт в память: %s (режим %s, исполнителей %s)",
+        loaded_cards,
+        collage_renderer.mode,
+        collage_renderer.workers,
+    )
+    storage = get_user_storage()
+    interpretation_cache = get_interpretation_cache()
+    background_tasks = [
+        asyncio.create_task(storage.run_flusher(USER_FLUSH_INTERVAL)),
+        asyncio.create_task(
+            get_diamond_ledger().run_compactor(LEDGER_COMPACT_INTERVAL, LEDGER_COMPACT_MIN_ENTRIES, run_io)
+        ),
+        asyncio.create_task(fsm_storage.run_sweeper(FSM_SWEEP_INTERVAL)),
+        asyncio.create_task(get_llm_scheduler().run_reporter(LLM_METRICS_INTERVAL)),
+        asyncio.create_task(get_llm_caller().run_reporter(LLM_METRICS_INTERVAL)),
+        asyncio.create_task(collage_renderer.run_reporter(COLLAGE_METRICS_INTERVAL)),
+        asyncio.create_task(interpretation_cache.run_saver(LLM_CACHE_SAVE_INTERVAL, run_io)),
+        asyncio.create_task(
+            SubscriptionSweeper(
+                storage.stale_subscriptions,
+                lambda user_id, checked_before: recheck_subscription(bot, user_id, checked_before),
+                max_age=SUBSCRIPTION_RECHECK_AGE,
+                rate=SUBSCRIPTION_SWEEP_RATE,
+                interval=SUBSCRIPTION_SWEEP_INTERVAL,
+            ).run()
+        ),
+    ]
+    if PROMPT_RELOAD_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(prompt_registry.run_watcher(PROMPT_RELOAD_INTERVAL, run_io)))
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP, lambda: background_tasks.append(asyncio.create_task(run_io(prompt_registry.reload)))
+        )
+    try:
+        await dispatcher.start_polling(bot, tasks_concurrency_limit=UPDATES_CONCURRENCY_LIMIT)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*referral_tasks, return_exceptions=True)
+        close_user_storage()
+        close_diamond_ledger()
+        await fsm_storage.close()
+        logging.info("Кэш пользователей: %s", storage.cache.stats())
+        logging.info("Кэш подписок: %s", get_subscription_cache().stats())
+        logging.info("Кэш интерпретаций: %s", interpretation_cache.stats())
+        logging.info("Кэш раскладов: %s", get_spread_cache().stats())
+        logging.info("Кэш уточнений: %s", get_clarify_cache().stats())
+        logging.info("Кэш изображений карт: %s", card_images.stats())
+        logging.info("Рендеринг коллажей: %s", collage_renderer.stats())
+        close_collage_renderer()
+        logging.info("Очередь LLM: %s", get_llm_scheduler().stats())
+        logging.info("Устойчивость LLM: %s", get_llm_caller().stats())
+        await close_llm_pool()
+        close_interpretation_cache()
+        close_interpretation_catalog()
+        if _telegram_files is not None:
+            logging.info("Кэш file_id: %s", _telegram_files.stats())
+        close_telegram_files()
+        get_io_executor().shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,17 @@
+from collections import deque
+from typing import Deque, Optional
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200) -> None:
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
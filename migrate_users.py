@@ -0,0 +1,403 @@
+import argparse
+import codecs
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from records import UserRecord, iter_record_file, write_record_entry
+from storage import SqliteUserStorage, atomic_write_text, shard_index
+
+FORMATS = ("json", "sqlite", "sharded", "binary")
+Entry = Tuple[int, UserRecord, Any]
+
+
+class _NeedMoreData(Exception):
+    pass
+
+
+class JsonObjectStream:
+    def __init__(self, handle: BinaryIO, *, start_offset: int = 0, chunk_size: int = 1 << 16, max_entry_size: int = 64 << 20) -> None:
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.max_entry_size = max_entry_size
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.byte_offset = start_offset
+        self.at_start = start_offset == 0
+        self.first = start_offset == 0
+        handle.seek(start_offset)
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.handle.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            tail = self.text_decoder.decode(b"", final=True)
+        else:
+            tail = self.text_decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + tail
+        self.pos = 0
+        if len(self.buffer) > self.max_entry_size:
+            raise ValueError("JSON entry is larger than the allowed maximum")
+        return bool(chunk) or bool(tail)
+
+    def _skip_whitespace(self, index: int) -> int:
+        while index < len(self.buffer) and self.buffer[index] in " \t\r\n":
+            index += 1
+        if index == len(self.buffer):
+            raise _NeedMoreData
+        return index
+
+    def _expect(self, index: int, char: str) -> int:
+        index = self._skip_whitespace(index)
+        if self.buffer[index] != char:
+            raise ValueError(f"Expected {char!r} at byte {self.byte_offset}, got {self.buffer[index]!r}")
+        return index + 1
+
+    def _decode(self, index: int) -> Tuple[Any, int]:
+        index = self._skip_whitespace(index)
+        try:
+            return self.decoder.raw_decode(self.buffer, index)
+        except json.JSONDecodeError:
+            if self.eof:
+                raise
+            raise _NeedMoreData
+
+    def _parse_entry(self) -> Optional[Tuple[str, Any, int]]:
+        index = self.pos
+        if self.at_start:
+            index = self._expect(index, "{")
+        index = self._skip_whitespace(index)
+        if self.buffer[index] == "}":
+            return None
+        if not self.first:
+            index = self._expect(index, ",")
+        key, index = self._decode(index)
+        if not isinstance(key, str):
+            raise ValueError(f"Expected an object key at byte {self.byte_offset}")
+        index = self._expect(index, ":")
+        value, index = self._decode(index)
+        return key, value, index
+
+    def __iter__(self) -> Iterator[Tuple[str, Any, int]]:
+        while True:
+            try:
+                entry = self._parse_entry()
+            except _NeedMoreData:
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON data")
+                continue
+            if entry is None:
+                return
+            key, value, end = entry
+            self.byte_offset += len(self.buffer[self.pos:end].encode("utf-8"))
+            self.pos = end
+            self.at_start = False
+            self.first = False
+            yield key, value, self.byte_offset
+
+
+class StreamingJsonWriter:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.count = 0
+        self.handle: Optional[BinaryIO] = None
+
+    def open(self, size: int = 0, count: int = 0) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if size:
+            self.handle = open(self.path, "r+b")
+            self.handle.truncate(size)
+            self.handle.seek(size)
+        else:
+            self.handle = open(self.path, "wb")
+            self.handle.write(b"{")
+        self.count = count
+
+    def write(self, user_id: int, record: UserRecord) -> None:
+        separator = b"," if self.count else b""
+        payload = json.dumps(record.to_dict(), ensure_ascii=False)
+        self.handle.write(separator + f'\n"{user_id}": {payload}'.encode("utf-8"))
+        self.count += 1
+
+    def sync(self) -> Dict[str, int]:
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        return {"size": self.handle.tell(), "count": self.count}
+
+    def finish(self) -> None:
+        self.handle.write(b"\n}\n")
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        self.handle.close()
+
+
+def iter_json_source(path: Path, position: Optional[int]) -> Iterator[Entry]:
+    with open(path, "rb") as handle:
+        for key, data, offset in JsonObjectStream(handle, start_offset=position or 0):
+            yield int(key), UserRecord.from_dict(data), offset
+
+
+def iter_binary_source(path: Path, position: Optional[int]) -> Iterator[Entry]:
+    with open(path, "rb") as handle:
+        handle.seek(position or 0)
+        for user_id, record in iter_record_file(handle):
+            yield user_id, record, handle.tell()
+
+
+def iter_sqlite_source(path: Path, position: Optional[int]) -> Iterator[Entry]:
+    storage = SqliteUserStorage(path)
+    try:
+        for user_id, record in storage.items(after_user_id=position):
+            yield user_id, record, user_id
+    finally:
+        storage.close()
+
+
+def iter_sharded_source(directory: Path, position: Optional[List[int]]) -> Iterator[Entry]:
+    manifest = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+    start_shard, start_offset = position or (0, 0)
+    for index in range(start_shard, manifest["shards"]):
+        shard_path = directory / f"users-{index:03d}.json"
+        if not shard_path.exists():
+            continue
+        offset = start_offset if index == start_shard else 0
+        with open(shard_path, "rb") as handle:
+            for key, data, end in JsonObjectStream(handle, start_offset=offset):
+                yield int(key), UserRecord.from_dict(data), [index, end]
+
+
+class JsonTarget:
+    def __init__(self, path: Path) -> None:
+        self.writer = StreamingJsonWriter(path)
+
+    def open(self, state: Optional[Dict[str, int]]) -> None:
+        self.writer.open(**(state or {}))
+
+    def write_batch(self, batch: Dict[int, UserRecord]) -> None:
+        for user_id, record in batch.items():
+            self.writer.write(user_id, record)
+
+    def sync(self) -> Dict[str, int]:
+        return self.writer.sync()
+
+    def finish(self) -> None:
+        self.writer.finish()
+
+
+class BinaryTarget:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.handle: Optional[BinaryIO] = None
+
+    def open(self, state: Optional[Dict[str, int]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        size = (state or {}).get("size", 0)
+        if size:
+            self.handle = open(self.path, "r+b")
+            self.handle.truncate(size)
+            self.handle.seek(size)
+        else:
+            self.handle = open(self.path, "wb")
+
+    def write_batch(self, batch: Dict[int, UserRecord]) -> None:
+        for user_id, record in batch.items():
+            write_record_entry(self.handle, user_id, record)
+
+    def sync(self) -> Dict[str, int]:
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        return {"size": self.handle.tell()}
+
+    def finish(self) -> None:
+        self.handle.close()
+
+
+class SqliteTarget:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.storage: Optional[SqliteUserStorage] = None
+
+    def open(self, state: Optional[Dict[str, int]]) -> None:
+        self.storage = SqliteUserStorage(self.path)
+
+    def write_batch(self, batch: Dict[int, UserRecord]) -> None:
+        self.storage.put_many(batch)
+
+    def sync(self) -> Dict[str, int]:
+        return {}
+
+    def finish(self) -> None:
+        self.storage.close()
+
+
+class ShardedTarget:
+    def __init__(self, directory: Path, shards: int) -> None:
+        self.directory = directory
+        self.shards = shards
+        self.writers = [StreamingJsonWriter(directory / f"users-{index:03d}.json") for index in range(shards)]
+
+    def open(self, state: Optional[Dict[str, List[int]]]) -> None:
+        atomic_write_text(self.directory / "manifest.json", json.dumps({"shards": self.shards}))
+        sizes = (state or {}).get("sizes", [0] * self.shards)
+        counts = (state or {}).get("counts", [0] * self.shards)
+        for writer, size, count in zip(self.writers, sizes, counts):
+            writer.open(size, count)
+
+    def write_batch(self, batch: Dict[int, UserRecord]) -> None:
+        for user_id, record in batch.items():
+            self.writers[shard_index(user_id, self.shards)].write(user_id, record)
+
+    def sync(self) -> Dict[str, List[int]]:
+        states = [writer.sync() for writer in self.writers]
+        return {"sizes": [state["size"] for state in states], "counts": [state["count"] for state in states]}
+
+    def finish(self) -> None:
+        for writer in self.writers:
+            writer.finish()
+
+
+def open_source(kind: str, path: Path, position: Any) -> Iterator[Entry]:
+    if kind == "json":
+        return iter_json_source(path, position)
+    if kind == "binary":
+        return iter_binary_source(path, position)
+    if kind == "sqlite":
+        return iter_sqlite_source(path, position)
+    if kind == "sharded":
+        return iter_sharded_source(path, position)
+    raise ValueError(f"Unknown format: {kind}")
+
+
+def create_target(kind: str, path: Path, shards: int) -> Any:
+    if kind == "json":
+        return JsonTarget(path)
+    if kind == "binary":
+        return BinaryTarget(path)
+    if kind == "sqlite":
+        return SqliteTarget(path)
+    if kind == "sharded":
+        return ShardedTarget(path, shards)
+    raise ValueError(f"Unknown format: {kind}")
+
+
+def source_bytes(kind: str, position: Any) -> Optional[int]:
+    if kind in ("json", "binary"):
+        return position or 0
+    return None
+
+
+def checkpoint_path(target_path: Path) -> Path:
+    return target_path.with_name(f"{target_path.name}.checkpoint.json")
+
+
+def migrate(
+    source_kind: str,
+    source_path: Path,
+    target_kind: str,
+    target_path: Path,
+    *,
+    shards: int = 16,
+    batch_size: int = 1000,
+    resume: bool = False,
+    progress_interval: float = 5.0,
+    out: Any = sys.stderr,
+) -> int:
+    checkpoint_file = checkpoint_path(target_path)
+    checkpoint: Optional[Dict[str, Any]] = None
+    if resume and checkpoint_file.exists():
+        checkpoint = json.loads(checkpoint_file.read_text(encoding="utf-8"))
+        expected = {"source": [source_kind, str(source_path)], "target": [target_kind, str(target_path)]}
+        if {key: checkpoint[key] for key in expected} != expected:
+            raise ValueError(f"{checkpoint_file} belongs to a different migration")
+    elif target_path.exists():
+        raise FileExistsError(f"{target_path} already exists; remove it or pass --resume")
+
+    target = create_target(target_kind, target_path, shards)
+    target.open(checkpoint["target_state"] if checkpoint else None)
+    position = checkpoint["position"] if checkpoint else None
+    migrated = checkpoint["count"] if checkpoint else 0
+    if checkpoint:
+        print(f"Продолжение с записи {migrated}", file=out)
+
+    started_at = last_report = time.monotonic()
+    start_count = migrated
+    start_bytes = source_bytes(source_kind, position) or 0
+    batch: Dict[int, UserRecord] = {}
+
+    def commit() -> None:
+        target.write_batch(batch)
+        state = {
+            "source": [source_kind, str(source_path)],
+            "target": [target_kind, str(target_path)],
+            "position": position,
+            "count": migrated,
+            "target_state": target.sync(),
+        }
+        atomic_write_text(checkpoint_file, json.dumps(state))
+        batch.clear()
+
+    def report(final: bool = False) -> None:
+        elapsed = max(time.monotonic() - started_at, 1e-9)
+        rate = (migrated - start_count) / elapsed
+        text = f"Перенесено записей: {migrated} ({rate:.0f} зап/с)"
+        read_bytes = source_bytes(source_kind, position)
+        if read_bytes is not None:
+            text += f", прочитано {read_bytes / 2**20:.1f} МиБ ({(read_bytes - start_bytes) / 2**20 / elapsed:.1f} МиБ/с)"
+        print(("Готово. " if final else "") + text, file=out)
+
+    for user_id, record, entry_position in open_source(source_kind, source_path, position):
+        batch[user_id] = record
+        position = entry_position
+        migrated += 1
+        if len(batch) >= batch_size:
+            commit()
+            if time.monotonic() - last_report >= progress_interval:
+                last_report = time.monotonic()
+                report()
+
+    commit()
+    target.finish()
+    checkpoint_file.unlink()
+    report(final=True)
+    return migrated
+
+
+def parse_location(value: str) -> Tuple[str, Path]:
+    kind, _, path = value.partition(":")
+    if kind not in FORMATS or not path:
+        raise argparse.ArgumentTypeError(f"Ожидается <формат>:<путь>, формат один из {', '.join(FORMATS)}")
+    return kind, Path(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Потоковый перенос пользователей между форматами хранения (бот должен быть остановлен)."
+    )
+    parser.add_argument("--from", dest="source", type=parse_location, required=True, help="источник, например json:data/users.json")
+    parser.add_argument("--to", dest="target", type=parse_location, required=True, help="назначение, например sqlite:data/users.db")
+    parser.add_argument("--shards", type=int, default=16, help="число шардов для формата sharded")
+    parser.add_argument("--batch-size", type=int, default=1000, help="сколько записей фиксировать за раз")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="период вывода прогресса в секундах")
+    parser.add_argument("--resume", action="store_true", help="продолжить прерванный перенос по контрольной точке")
+    args = parser.parse_args()
+
+    migrate(
+        *args.source,
+        *args.target,
+        shards=args.shards,
+        batch_size=args.batch_size,
+        resume=args.resume,
+        progress_interval=args.progress_interval,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+SAMPLE_TEXT = (
+    "[B]Главный вывод:[/B] сейчас важнее наблюдать, чем действовать. "
+    "Первая карта говорит о том, что ситуация ещё складывается, и поспешные решения могут её запутать. "
+    "Вторая карта показывает внутреннее сопротивление: вы ждёте ясности от других, хотя ответ уже есть у вас. "
+    "Третья карта советует спокойно собрать факты и не додумывать за партнёра или обстоятельства. "
+    "[B]Совет:[/B] дайте себе несколько дней, а затем вернитесь к вопросу с новыми силами."
+)
+
+
+@dataclass
+class MockLLMConfig:
+    latency: str = "lognormal"
+    latency_ms: float = 800.0
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    tokens_per_second: float = 60.0
+    requests_per_minute: int = 0
+    seed: Optional[int] = None
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class MockLLMServer:
+    def __init__(self, config: MockLLMConfig) -> None:
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.counters: Dict[str, int] = {
+            "requests": 0,
+            "streams": 0,
+            "errors": 0,
+            "rate_limited": 0,
+            "completion_tokens": 0,
+        }
+        self.windows: Dict[str, Deque[float]] = {}
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self.handle_completions)
+        self.app.router.add_get("/stats", self.handle_stats)
+
+    def sample_latency(self) -> float:
+        median = self.config.latency_ms / 1000
+        if self.config.latency == "fixed":
+            return median
+        if self.config.latency == "uniform":
+            return self.random.uniform(0, 2 * median)
+        if self.config.latency == "exponential":
+            return self.random.expovariate(1 / median) if median else 0.0
+        return self.random.lognormvariate(0, self.config.latency_sigma) * median
+
+    def completion_text(self, max_tokens: int) -> str:
+        return SAMPLE_TEXT[: max_tokens * 4]
+
+    def consume_budget(self, api_key: str) -> Tuple[Dict[str, str], bool]:
+        limit = self.config.requests_per_minute
+        if not limit:
+            return {}, True
+        now = time.monotonic()
+        window = self.windows.setdefault(api_key, deque())
+        while window and now - window[0] >= 60:
+            window.popleft()
+        allowed = len(window) < limit
+        if allowed:
+            window.append(now)
+        headers = {
+            "x-ratelimit-limit-requests": str(limit),
+            "x-ratelimit-remaining-requests": str(limit - len(window)),
+            "x-ratelimit-reset-requests": f"{60 - (now - window[0]):.3f}s",
+        }
+        return headers, allowed
+
+    def error_response(
+        self, status: int, message: str, error_type: str, headers: Optional[Dict[str, str]] = None
+    ) -> web.Response:
+        headers = dict(headers or {})
+        if status == 429:
+            headers.setdefault("retry-after", str(self.config.retry_after))
+        body = {"error": {"message": message, "type": error_type, "code": None, "param": None}}
+        return web.json_response(body, status=status, headers=headers)
+
+    async def handle_completions(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.counters["requests"] += 1
+        api_key = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        headers, allowed = self.consume_budget(api_key)
+        if not allowed:
+            self.counters["rate_limited"] += 1
+            retry_after = headers["x-ratelimit-reset-requests"].removesuffix("s")
+            return self.error_response(
+                429, "Rate limit reached for requests", "requests", {**headers, "retry-after": retry_after}
+            )
+        roll = self.random.random()
+        if roll < self.config.rate_limit_rate:
+            self.counters["rate_limited"] += 1
+            return self.error_response(429, "Rate limit reached", "rate_limit_exceeded", headers)
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            await asyncio.sleep(self.sample_latency() / 2)
+            self.counters["errors"] += 1
+            return self.error_response(500, "The server had an error", "server_error", headers)
+
+        messages: List[Dict[str, Any]] = payload.get("messages", [])
+        text = self.completion_text(int(payload.get("max_tokens") or 256))
+        usage = {
+            "prompt_tokens": sum(count_tokens(str(message.get("content", ""))) for message in messages),
+            "completion_tokens": count_tokens(text),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.counters["completion_tokens"] += usage["completion_tokens"]
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": payload.get("model", "mock"),
+        }
+        await asyncio.sleep(self.sample_latency())
+        if payload.get("stream"):
+            self.counters["streams"] += 1
+            include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+            return await self.stream(request, base, text, usage if include_usage else None, headers)
+        return web.json_response(
+            {
+                **base,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+            headers=headers,
+        )
+
+    async def stream(
+        self,
+        request: web.Request,
+        base: Dict[str, Any],
+        text: str,
+        usage: Optional[Dict[str, int]],
+        headers: Dict[str, str],
+    ) -> web.StreamResponse:
+        response = web.StreamResponse(
+            headers={**headers, "Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+
+        async def send(choices: List[Dict[str, Any]], **extra: Any) -> None:
+            chunk = {**base, "object": "chat.completion.chunk", "choices": choices, **extra}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        await send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        delay = 1 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0
+        for start in range(0, len(text), 4):
+            await send([{"index": 0, "delta": {"content": text[start:start + 4]}, "finish_reason": None}])
+            if delay:
+                await asyncio.sleep(delay)
+        await send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage is not None:
+            await send([], usage=usage)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.counters)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_port = self.runner.addresses[0][1]
+        return f"http://{host}:{bound_port}/v1"
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", choices=["fixed", "uniform", "exponential", "lognormal"], default="lognormal", help="распределение задержки ответа")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="медиана задержки до первого токена, мс (для exponential — среднее)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="sigma для lognormal")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="значение заголовка retry-after для 429, с")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="скорость потоковой выдачи")
+    parser.add_argument("--requests-per-minute", type=int, default=0, help="лимит запросов в минуту на ключ с заголовками x-ratelimit-* (0 — без лимита)")
+    parser.add_argument("--seed", type=int, default=None, help="seed генератора случайных чисел")
+
+
+def config_from_args(args: argparse.Namespace) -> MockLLMConfig:
+    return MockLLMConfig(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        tokens_per_second=args.tokens_per_second,
+        requests_per_minute=args.requests_per_minute,
+        seed=args.seed,
+    )
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Локальная заглушка OpenAI chat completions для нагрузочных тестов.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+    server = MockLLMServer(config_from_args(args))
+    print(f"LLM_BASE_URL=http://{args.host}:{args.port}/v1", flush=True)
+    web.run_app(server.app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import main
+from catalog import InterpretationCatalog
+from llm_scheduler import PRIORITY_BACKGROUND
+from prompts import PROMPT_REGISTRY
+
+
+def catalog_prompt_keys() -> List[str]:
+    return [key for key, config in PROMPT_REGISTRY.items() if "{question}" not in config.user_template]
+
+
+DEFAULT_MAX_TRIPLES = 2000
+
+
+def nth_triple(card_names: List[str], index: int) -> Tuple[str, str, str]:
+    remaining = list(card_names)
+    triple = []
+    for width in ((len(remaining) - 1) * (len(remaining) - 2), len(remaining) - 2, 1):
+        position, index = divmod(index, width)
+        triple.append(remaining.pop(position))
+    return tuple(triple)
+
+
+def iter_subjects(prompt_key: str, card_names: List[str], max_triples: int, seed: int) -> Iterator[Tuple[str, Dict[str, str]]]:
+    if PROMPT_REGISTRY[prompt_key].mode == "DAY":
+        for card_name in card_names:
+            yield card_name, {"card_name": card_name}
+        return
+    total = len(card_names) * (len(card_names) - 1) * (len(card_names) - 2)
+    if max_triples and total > max_triples:
+        indices = random.Random(f"{seed}:{prompt_key}").sample(range(total), max_triples)
+        triples = (nth_triple(card_names, index) for index in indices)
+    else:
+        triples = itertools.permutations(card_names, 3)
+    for triple in triples:
+        cards = ", ".join(triple)
+        yield cards, {"cards": cards}
+
+
+async def precompute(
+    catalog: InterpretationCatalog,
+    prompt_keys: List[str],
+    card_names: List[str],
+    *,
+    variants: int = 1,
+    concurrency: int = 4,
+    max_triples: int = 0,
+    seed: int = 0,
+    prune: bool = False,
+    progress_interval: float = 10.0,
+) -> Dict[str, int]:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)
+    counters = {"planned": 0, "fresh": 0, "generated": 0, "failed": 0}
+    live = []
+    started = time.monotonic()
+    last_report = started
+
+    async def worker() -> None:
+        nonlocal last_report
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            prompt_key, subject, variant, fingerprint, messages = job
+            text = await main.call_llm(
+                messages, main.prompt_max_tokens(prompt_key), "CATALOG", priority=PRIORITY_BACKGROUND
+            )
+            if text:
+                await main.run_io(catalog.put, prompt_key, subject, variant, fingerprint, text)
+                counters["generated"] += 1
+            else:
+                counters["failed"] += 1
+            now = time.monotonic()
+            if now - last_report >= progress_interval:
+                last_report = now
+                print(
+                    f"Готово {counters['generated']}, ошибок {counters['failed']}, "
+                    f"{counters['generated'] / (now - started):.1f} интерпретаций/с",
+                    flush=True,
+                )
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for prompt_key in prompt_keys:
+            for subject, fields in iter_subjects(prompt_key, card_names, max_triples, seed):
+                messages = main.build_interpretation_messages(prompt_key, **fields)
+                fingerprint = main.interpretation_fingerprint(prompt_key, subject, messages)
+                live.append((prompt_key, subject, fingerprint))
+                existing = set(catalog.fresh_variants(prompt_key, subject, fingerprint))
+                counters["planned"] += variants
+                counters["fresh"] += len(existing & set(range(variants)))
+                for variant in range(variants):
+                    if variant not in existing:
+                        await queue.put((prompt_key, subject, variant, fingerprint, messages))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    if prune:
+        counters["pruned"] = catalog.prune(prompt_keys, live)
+    return counters
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Заранее сгенерировать интерпретации для раскладов без вопроса.")
+    parser.add_argument("--catalog", type=Path, default=main.DATA_FILE.parent / "catalog.db", help="файл каталога")
+    parser.add_argument("--keys", nargs="*", help="ключи промптов (по умолчанию все без вопроса)")
+    parser.add_argument("--variants", type=int, default=1, help="вариантов на каждую карту или тройку карт")
+    parser.add_argument("--concurrency", type=int, default=4, help="одновременных запросов к LLM")
+    parser.add_argument(
+        "--max-triples-per-key",
+        type=int,
+        default=DEFAULT_MAX_TRIPLES,
+        help=f"сколько троек карт генерировать на расклад (по умолчанию {DEFAULT_MAX_TRIPLES}, 0 — все перестановки)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed выборки троек карт")
+    parser.add_argument("--prune", action="store_true", help="удалить устаревшие записи каталога")
+    args = parser.parse_args(argv)
+
+    if main.get_llm_pool() is None:
+        parser.error("LLM отключён или не задан OPENAI_API_KEY")
+    prompt_keys = args.keys or catalog_prompt_keys()
+    unknown = [key for key in prompt_keys if key not in PROMPT_REGISTRY or "{question}" in PROMPT_REGISTRY[key].user_template]
+    if unknown:
+        parser.error(f"нельзя заранее сгенерировать промпты: {', '.join(unknown)}")
+    card_names = sorted(path.stem for path in main.load_card_files())
+    if not card_names:
+        parser.error(f"в {main.CARDS_DIR} нет карт")
+
+    catalog = InterpretationCatalog(args.catalog)
+    try:
+        counters = asyncio.run(
+            precompute(
+                catalog,
+                prompt_keys,
+                card_names,
+                variants=args.variants,
+                concurrency=args.concurrency,
+                max_triples=args.max_triples_per_key,
+                seed=args.seed,
+                prune=args.prune,
+            )
+        )
+    finally:
+        catalog.close()
+        main.get_io_executor().shutdown()
+    print(f"Каталог {args.catalog}: {counters}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,12 +1,18 @@
+import asyncio
 import logging
 import os
+import string
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
 
-from dotenv import load_dotenv
+from dotenv import dotenv_values
 
-load_dotenv(".env.spreads", override=True)
+PROMPTS_DIR = Path("prompts")
+SPREADS_FILE = Path(".env.spreads")
+TEMPLATE_FIELDS = {"card_name", "cards", "question"}
+MODE_FIELDS = {"DAY": {"card_name", "question"}, "THREE": {"cards", "question"}}
 
 DEFAULT_SYSTEM_PROMPT = (
     "Ты помогаешь кратко и нейтрально интерпретировать карты Таро. "
@@ -194,48 +200,145 @@ def resolve_system_prompt(
     return fallback
 
 
-def load_prompt_override(prompt_key: str) -> Optional[str]:
-    env_value = os.getenv(f"SPREAD_PROMPT_{prompt_key.upper()}")
+class PromptTemplateError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    key: str
+    mode: str
+    system_prompt: str
+    template: str
+    source: str
+
+    def messages(self, **kwargs: str) -> List[Dict[str, str]]:
+        fields = {**dict.fromkeys(TEMPLATE_FIELDS, ""), **kwargs}
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self.template.format(**fields)},
+        ]
+
+
+def validate_template(config: PromptConfig, template: str) -> None:
+    try:
+        fields = {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+    except ValueError as exc:
+        raise PromptTemplateError(f"broken placeholder: {exc}") from None
+    unknown = fields - MODE_FIELDS.get(config.mode, TEMPLATE_FIELDS)
+    if unknown:
+        raise PromptTemplateError(f"unknown placeholders for {config.mode}: {', '.join(sorted(unknown))}")
+    if config.mode == "THREE" and "cards" not in fields:
+        raise PromptTemplateError("template does not include {cards}")
+
+
+def load_prompt_override(
+    prompt_key: str, spreads: Mapping[str, Optional[str]], prompts_dir: Path = PROMPTS_DIR
+) -> Optional[Tuple[str, str]]:
+    name = f"SPREAD_PROMPT_{prompt_key.upper()}"
+    env_value = spreads.get(name) or os.getenv(name)
     if env_value:
-        return env_value
+        return env_value, name
 
-    file_path = Path("prompts") / f"{prompt_key}.txt"
+    file_path = prompts_dir / f"{prompt_key}.txt"
     if file_path.exists():
         try:
-            return file_path.read_text(encoding="utf-8")
-        except OSError:
-            return None
+            return file_path.read_text(encoding="utf-8"), str(file_path)
+        except OSError as exc:
+            logging.warning("Не удалось прочитать шаблон %s: %s", file_path, exc)
     return None
 
 
-def build_prompt_messages(
-    prompt_key: str,
-    *,
+def compile_prompts(
     base_prompt: Optional[str],
     day_prompt: Optional[str],
     three_prompt: Optional[str],
-    **kwargs,
-) -> List[Dict[str, str]]:
-    config = PROMPT_REGISTRY.get(prompt_key)
-    if not config:
-        raise KeyError(f"Unknown prompt key: {prompt_key}")
-
-    system_prompt = resolve_system_prompt(config.mode, base_prompt, day_prompt, three_prompt)
-    override = load_prompt_override(prompt_key)
-    kwargs.setdefault("question", "")
-    kwargs.setdefault("cards", "")
-
-    template = override or config.user_template
-    if config.mode == "THREE" and "{cards}" not in template:
-        logging.warning(
-            "Template for prompt '%s' does not include {cards}. Falling back to default template.",
-            prompt_key,
+    *,
+    prompts_dir: Path = PROMPTS_DIR,
+    spreads_file: Path = SPREADS_FILE,
+    previous: Optional[Mapping[str, CompiledPrompt]] = None,
+) -> Mapping[str, CompiledPrompt]:
+    spreads = dotenv_values(spreads_file) if spreads_file.exists() else {}
+    compiled: Dict[str, CompiledPrompt] = {}
+    for key, config in PROMPT_REGISTRY.items():
+        system_prompt = resolve_system_prompt(config.mode, base_prompt, day_prompt, three_prompt)
+        template, source = config.user_template, "default"
+        override = load_prompt_override(key, spreads, prompts_dir)
+        if override:
+            try:
+                validate_template(config, override[0])
+                template, source = override
+            except PromptTemplateError as exc:
+                kept = previous.get(key) if previous else None
+                if kept is not None:
+                    template, source = kept.template, kept.source
+                logging.error("Шаблон промпта %s из %s отклонён (%s), используется %s", key, override[1], exc, source)
+        compiled[key] = CompiledPrompt(key, config.mode, system_prompt, template, source)
+    return MappingProxyType(compiled)
+
+
+class PromptRegistry:
+    def __init__(
+        self,
+        base_prompt: Optional[str],
+        day_prompt: Optional[str],
+        three_prompt: Optional[str],
+        *,
+        prompts_dir: Path = PROMPTS_DIR,
+        spreads_file: Path = SPREADS_FILE,
+    ) -> None:
+        self.system_prompts = (base_prompt, day_prompt, three_prompt)
+        self.prompts_dir = prompts_dir
+        self.spreads_file = spreads_file
+        self.reloads = 0
+        self._signature = self.source_signature()
+        self.compiled = compile_prompts(*self.system_prompts, prompts_dir=prompts_dir, spreads_file=spreads_file)
+
+    def source_signature(self) -> Tuple[Tuple[str, int, int], ...]:
+        paths = [self.spreads_file]
+        if self.prompts_dir.is_dir():
+            paths.extend(sorted(self.prompts_dir.glob("*.txt")))
+        signature = []
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def get(self, prompt_key: str) -> CompiledPrompt:
+        prompt = self.compiled.get(prompt_key)
+        if prompt is None:
+            raise KeyError(f"Unknown prompt key: {prompt_key}")
+        return prompt
+
+    def build(self, prompt_key: str, **kwargs: str) -> List[Dict[str, str]]:
+        return self.get(prompt_key).messages(**kwargs)
+
+    def reload(self) -> None:
+        self._signature = self.source_signature()
+        self.compiled = compile_prompts(
+            *self.system_prompts,
+            prompts_dir=self.prompts_dir,
+            spreads_file=self.spreads_file,
+            previous=self.compiled,
         )
-        template = config.user_template
+        self.reloads += 1
+        overrides = sorted(key for key, prompt in self.compiled.items() if prompt.source != "default")
+        logging.info("Шаблоны промптов перезагружены, переопределены: %s", ", ".join(overrides) or "нет")
+
+    def reload_if_changed(self) -> bool:
+        if self.source_signature() == self._signature:
+            return False
+        self.reload()
+        return True
 
-    user_text = template.format(**kwargs)
+    async def run_watcher(self, interval: float, run_io: Callable[..., Awaitable[Any]]) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_io(self.reload_if_changed)
+            except Exception as exc:  # noqa: BLE001
+                logging.warning("Не удалось перезагрузить шаблоны промптов: %s", exc)
 
-    return [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_text},
-    ]
@@ -0,0 +1,130 @@
+import re
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+STOP_WORDS = {
+    "а", "и", "но", "что", "как", "ли", "же", "ну", "вот", "там", "это", "то",
+    "по", "про", "на", "в", "во", "с", "со", "у", "о", "об", "к", "за", "для",
+    "мне", "меня", "мой", "моя", "мои", "я", "насчет", "скажи", "подскажи",
+}
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_question(text: str) -> List[str]:
+    words = _WORD_RE.findall(text.lower().replace("ё", "е"))
+    meaningful = [word for word in words if word not in STOP_WORDS]
+    return meaningful or words
+
+
+def question_features(words: List[str], ngram: int = 3) -> List[str]:
+    features = [f"w:{word}" for word in words]
+    for word in words:
+        padded = f" {word} "
+        features.extend(f"c:{padded[index:index + ngram]}" for index in range(len(padded) - ngram + 1))
+    return features
+
+
+def vectorize_question(text: str, dim: int = 1024) -> Optional[np.ndarray]:
+    words = normalize_question(text)
+    if not words:
+        return None
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in question_features(words):
+        digest = zlib.crc32(feature.encode("utf-8"))
+        vector[digest % dim] += 1.0 if digest & 0x80000000 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if not norm:
+        return None
+    return vector / norm
+
+
+class _CardAnswers:
+    __slots__ = ("vectors", "answers", "last_used", "count")
+
+    def __init__(self, dim: int) -> None:
+        self.vectors = np.zeros((4, dim), dtype=np.float32)
+        self.answers: List[str] = []
+        self.last_used = np.zeros(4, dtype=np.int64)
+        self.count = 0
+
+    def grow(self, limit: int) -> None:
+        capacity = min(limit, len(self.vectors) * 2)
+        self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+        self.last_used = np.resize(self.last_used, capacity)
+
+
+class QuestionSimilarityCache:
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        per_card: int = 64,
+        max_cards: int = 512,
+        dim: int = 1024,
+    ) -> None:
+        self.threshold = threshold
+        self.per_card = per_card
+        self.max_cards = max_cards
+        self.dim = dim
+        self._cards: "OrderedDict[str, _CardAnswers]" = OrderedDict()
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get(self, card_key: str, question: str) -> Optional[str]:
+        entries = self._cards.get(card_key)
+        vector = vectorize_question(question, self.dim) if entries is not None else None
+        if entries is None or vector is None or not entries.count:
+            self.misses += 1
+            return None
+        scores = entries.vectors[: entries.count] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] + 1e-6 < self.threshold:
+            self.misses += 1
+            return None
+        self._cards.move_to_end(card_key)
+        entries.last_used[best] = self._tick()
+        self.hits += 1
+        return entries.answers[best]
+
+    def put(self, card_key: str, question: str, answer: str) -> None:
+        vector = vectorize_question(question, self.dim)
+        if vector is None:
+            return
+        entries = self._cards.get(card_key)
+        if entries is None:
+            entries = self._cards[card_key] = _CardAnswers(self.dim)
+            if len(self._cards) > self.max_cards:
+                _, evicted = self._cards.popitem(last=False)
+                self.evictions += evicted.count
+        self._cards.move_to_end(card_key)
+        if entries.count < self.per_card:
+            if entries.count == len(entries.vectors):
+                entries.grow(self.per_card)
+            slot = entries.count
+            entries.count += 1
+            entries.answers.append(answer)
+        else:
+            slot = int(np.argmin(entries.last_used[: entries.count]))
+            entries.answers[slot] = answer
+            self.evictions += 1
+        entries.vectors[slot] = vector
+        entries.last_used[slot] = self._tick()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "cards": len(self._cards),
+            "entries": sum(entries.count for entries in self._cards.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,287 @@
+import argparse
+import json
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+DEFAULT_USER: Dict[str, Any] = {
+    "free_granted": False,
+    "invited_count": 0,
+    "referred_by": None,
+    "registration_date": None,
+    "diamonds": 0,
+    "last_daily_spread_at": None,
+    "last_daily_gift_at": None,
+    "daily_spread_count": 0,
+    "last_daily_card": None,
+    "subscription_status": None,
+    "subscription_checked_at": None,
+}
+TIMESTAMP_FIELDS = (
+    "registration_date",
+    "last_daily_spread_at",
+    "last_daily_gift_at",
+    "subscription_checked_at",
+)
+STRING_FIELDS = ("last_daily_card", "subscription_status")
+RECORD_FORMAT_VERSION = 1
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_FIXED = struct.Struct("<BBIqIq4q")
+_STRING_LENGTH = struct.Struct("<H")
+_EXTRA_LENGTH = struct.Struct("<I")
+_FILE_ENTRY = struct.Struct("<qI")
+_NULL_STRING = 0xFFFF
+_FLAG_FREE_GRANTED = 1
+_FLAG_REFERRED_BY = 2
+_FLAG_TIMESTAMP_SHIFT = 2
+
+
+def timestamp_now() -> int:
+    return time.time_ns() // 1000
+
+
+def datetime_to_timestamp(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def timestamp_to_datetime(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def timestamp_to_iso(value: int) -> str:
+    return timestamp_to_datetime(value).isoformat()
+
+
+def to_timestamp(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise TypeError("Timestamp cannot be a boolean")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        return datetime_to_timestamp(value)
+    try:
+        return datetime_to_timestamp(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _plain_string(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, Enum):
+        value = value.value
+    return str(value)
+
+
+class UserRecord:
+    __slots__ = (*DEFAULT_USER, "extra")
+
+    def __init__(self) -> None:
+        for field, default in DEFAULT_USER.items():
+            setattr(self, field, default)
+        self.extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserRecord":
+        record = cls()
+        extra = {}
+        for key, value in data.items():
+            if key not in DEFAULT_USER:
+                extra[key] = value
+                continue
+            try:
+                record[key] = value
+            except (TypeError, ValueError):
+                extra[key] = value
+                continue
+            if record._exported(key) != value:
+                extra[key] = value
+        record.extra = extra or None
+        return record
+
+    def _exported(self, field: str) -> Any:
+        value = getattr(self, field)
+        if field in TIMESTAMP_FIELDS and value is not None:
+            return timestamp_to_iso(value)
+        return value
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {field: self._exported(field) for field in DEFAULT_USER}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def copy(self) -> "UserRecord":
+        clone = UserRecord.__new__(UserRecord)
+        for field in DEFAULT_USER:
+            setattr(clone, field, getattr(self, field))
+        clone.extra = dict(self.extra) if self.extra else None
+        return clone
+
+    def __getitem__(self, key: str) -> Any:
+        if key in DEFAULT_USER:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in DEFAULT_USER:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+            return
+        if key in TIMESTAMP_FIELDS:
+            value = to_timestamp(value)
+        elif key in STRING_FIELDS:
+            value = _plain_string(value)
+        elif key == "free_granted":
+            value = bool(value)
+        elif key == "referred_by":
+            value = None if value is None else int(value)
+        else:
+            value = int(value)
+        setattr(self, key, value)
+        if self.extra and key in self.extra:
+            del self.extra[key]
+            if not self.extra:
+                self.extra = None
+
+    def __contains__(self, key: object) -> bool:
+        return key in DEFAULT_USER or bool(self.extra and key in self.extra)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, UserRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"UserRecord({self.to_dict()!r})"
+
+    def pack(self) -> bytes:
+        flags = _FLAG_FREE_GRANTED if self.free_granted else 0
+        if self.referred_by is not None:
+            flags |= _FLAG_REFERRED_BY
+        timestamps = []
+        for index, field in enumerate(TIMESTAMP_FIELDS):
+            value = getattr(self, field)
+            if value is not None:
+                flags |= 1 << (_FLAG_TIMESTAMP_SHIFT + index)
+            timestamps.append(value or 0)
+        parts = [
+            _FIXED.pack(
+                RECORD_FORMAT_VERSION,
+                flags,
+                self.invited_count,
+                self.diamonds,
+                self.daily_spread_count,
+                self.referred_by or 0,
+                *timestamps,
+            )
+        ]
+        for field in STRING_FIELDS:
+            value = getattr(self, field)
+            if value is None:
+                parts.append(_STRING_LENGTH.pack(_NULL_STRING))
+            else:
+                encoded = value.encode("utf-8")
+                parts.append(_STRING_LENGTH.pack(len(encoded)))
+                parts.append(encoded)
+        extra = json.dumps(self.extra, ensure_ascii=False).encode("utf-8") if self.extra else b""
+        parts.append(_EXTRA_LENGTH.pack(len(extra)))
+        parts.append(extra)
+        return b"".join(parts)
+
+    @classmethod
+    def unpack(cls, payload: bytes) -> "UserRecord":
+        (
+            version,
+            flags,
+            invited_count,
+            diamonds,
+            daily_spread_count,
+            referred_by,
+            *timestamps,
+        ) = _FIXED.unpack_from(payload)
+        if version != RECORD_FORMAT_VERSION:
+            raise ValueError(f"Unsupported user record version: {version}")
+        record = cls.__new__(cls)
+        record.free_granted = bool(flags & _FLAG_FREE_GRANTED)
+        record.invited_count = invited_count
+        record.diamonds = diamonds
+        record.daily_spread_count = daily_spread_count
+        record.referred_by = referred_by if flags & _FLAG_REFERRED_BY else None
+        for index, field in enumerate(TIMESTAMP_FIELDS):
+            present = flags & (1 << (_FLAG_TIMESTAMP_SHIFT + index))
+            setattr(record, field, timestamps[index] if present else None)
+        offset = _FIXED.size
+        for field in STRING_FIELDS:
+            (length,) = _STRING_LENGTH.unpack_from(payload, offset)
+            offset += _STRING_LENGTH.size
+            if length == _NULL_STRING:
+                setattr(record, field, None)
+            else:
+                setattr(record, field, payload[offset:offset + length].decode("utf-8"))
+                offset += length
+        (extra_length,) = _EXTRA_LENGTH.unpack_from(payload, offset)
+        offset += _EXTRA_LENGTH.size
+        record.extra = json.loads(payload[offset:offset + extra_length]) if extra_length else None
+        return record
+
+
+def write_record_entry(handle: BinaryIO, user_id: int, record: UserRecord) -> None:
+    payload = record.pack()
+    handle.write(_FILE_ENTRY.pack(user_id, len(payload)))
+    handle.write(payload)
+
+
+def iter_record_file(handle: BinaryIO) -> Iterator[Tuple[int, UserRecord]]:
+    while True:
+        header = handle.read(_FILE_ENTRY.size)
+        if len(header) < _FILE_ENTRY.size:
+            return
+        user_id, length = _FILE_ENTRY.unpack(header)
+        payload = handle.read(length)
+        if len(payload) < length:
+            return
+        yield user_id, UserRecord.unpack(payload)
+
+
+def convert_json_to_binary(source: Path, target: Path) -> int:
+    users = json.loads(source.read_text(encoding="utf-8"))
+    converted = 0
+    with open(target, "wb") as handle:
+        for key, data in users.items():
+            record = UserRecord.from_dict(data)
+            if record.to_dict() != {**DEFAULT_USER, **data}:
+                raise ValueError(f"User {key} cannot be converted losslessly")
+            write_record_entry(handle, int(key), record)
+            converted += 1
+    return converted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Конвертировать users.json в компактный бинарный формат.")
+    parser.add_argument("source", type=Path, help="исходный users.json")
+    parser.add_argument("target", type=Path, help="файл с бинарными записями")
+    args = parser.parse_args()
+    converted = convert_json_to_binary(args.source, args.target)
+    print(f"Сконвертировано пользователей: {converted}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+from migrate_users import ShardedTarget, iter_sharded_source
+
+
+def reshard(directory: Path, shards: int, batch_size: int = 1000) -> int:
+    staging_dir = directory.with_name(f"{directory.name}.resharding")
+    if staging_dir.exists():
+        shutil.rmtree(staging_dir)
+    target = ShardedTarget(staging_dir, shards)
+    target.open(None)
+
+    moved = 0
+    batch = {}
+    for user_id, record, _ in iter_sharded_source(directory, None):
+        batch[user_id] = record
+        moved += 1
+        if len(batch) >= batch_size:
+            target.write_batch(batch)
+            batch.clear()
+    target.write_batch(batch)
+    target.finish()
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    backup_dir = directory.with_name(f"{directory.name}.bak-{stamp}")
+    os.replace(directory, backup_dir)
+    os.replace(staging_dir, directory)
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Перераспределить пользователей по новому числу шардов (бот должен быть остановлен).")
+    parser.add_argument("--dir", type=Path, default=Path("data/users_shards"), help="каталог с шардами")
+    parser.add_argument("--shards", type=int, required=True, help="новое число шардов")
+    args = parser.parse_args()
+
+    moved = reshard(args.dir, args.shards)
+    print(f"Перенесено пользователей: {moved}, шардов: {args.shards}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,542 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from io_pool import IOExecutor
+from records import TIMESTAMP_FIELDS, UserRecord
+
+SQLITE_SCHEMA_VERSION = 1
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        handle.write(text)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def oldest_subscription_checks(
+    records: Iterable[Tuple[int, UserRecord]], checked_before: int, limit: int
+) -> List[int]:
+    stale = (
+        (record.subscription_checked_at, user_id)
+        for user_id, record in records
+        if record.subscription_checked_at is not None and record.subscription_checked_at < checked_before
+    )
+    return [user_id for _, user_id in heapq.nsmallest(limit, stale)]
+
+
+class UserStorage(ABC):
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        ...
+
+    @abstractmethod
+    def put_many(self, records: Dict[int, UserRecord]) -> None:
+        ...
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, UserRecord]:
+        found = {}
+        for user_id in user_ids:
+            record = self.get(user_id)
+            if record is not None:
+                found[user_id] = record
+        return found
+
+    @abstractmethod
+    def items(self) -> Iterator[Tuple[int, UserRecord]]:
+        ...
+
+    def put(self, user_id: int, record: UserRecord) -> None:
+        self.put_many({user_id: record})
+
+    def stale_subscriptions(self, checked_before: int, limit: int) -> List[int]:
+        return oldest_subscription_checks(self.items(), checked_before, limit)
+
+    def close(self) -> None:
+        return None
+
+
+class JsonUserStorage(UserStorage):
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._write_lock = threading.Lock()
+
+    def ensure_file(self) -> None:
+        if not self.path.exists():
+            atomic_write_text(self.path, "{}")
+
+    def load_all(self) -> Dict[str, Dict[str, Any]]:
+        self.ensure_file()
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+            backup_path = self.path.with_name(f"{self.path.name}.corrupt-{stamp}")
+            os.replace(self.path, backup_path)
+            logging.error("User data file is corrupted. Moved it to %s and started empty storage.", backup_path)
+            atomic_write_text(self.path, "{}")
+            return {}
+
+    def save_all(self, users: Dict[str, Dict[str, Any]]) -> None:
+        atomic_write_text(self.path, json.dumps(users, ensure_ascii=False, indent=2))
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        data = self.load_all().get(str(user_id))
+        return UserRecord.from_dict(data) if data is not None else None
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, UserRecord]:
+        users = self.load_all()
+        return {
+            user_id: UserRecord.from_dict(users[str(user_id)])
+            for user_id in user_ids
+            if str(user_id) in users
+        }
+
+    def put_many(self, records: Dict[int, UserRecord]) -> None:
+        with self._write_lock:
+            users = self.load_all()
+            for user_id, record in records.items():
+                users[str(user_id)] = record.to_dict()
+            self.save_all(users)
+
+    def items(self) -> Iterator[Tuple[int, UserRecord]]:
+        for key, data in self.load_all().items():
+            yield int(key), UserRecord.from_dict(data)
+
+
+def shard_index(user_id: int, shards: int) -> int:
+    return zlib.crc32(str(user_id).encode("ascii")) % shards
+
+
+class ShardedJsonUserStorage(UserStorage):
+    def __init__(self, directory: Path, shards: int) -> None:
+        if shards < 1:
+            raise ValueError("Number of shards must be positive")
+        self.directory = directory
+        self.shards = shards
+        self.manifest_path = directory / "manifest.json"
+        if self.manifest_path.exists():
+            stored_shards = json.loads(self.manifest_path.read_text(encoding="utf-8"))["shards"]
+            if stored_shards != shards:
+                raise ValueError(
+                    f"{directory} holds {stored_shards} shards, not {shards}. "
+                    "Run reshard_users.py to change the number of shards."
+                )
+        else:
+            atomic_write_text(self.manifest_path, json.dumps({"shards": shards}))
+        self.shard_files: List[JsonUserStorage] = [
+            JsonUserStorage(directory / f"users-{index:03d}.json") for index in range(shards)
+        ]
+
+    def shard_for(self, user_id: int) -> JsonUserStorage:
+        return self.shard_files[shard_index(user_id, self.shards)]
+
+    def is_empty(self) -> bool:
+        return not any(shard.path.exists() for shard in self.shard_files)
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        return self.shard_for(user_id).get(user_id)
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, UserRecord]:
+        grouped: Dict[int, List[int]] = {}
+        for user_id in user_ids:
+            grouped.setdefault(shard_index(user_id, self.shards), []).append(user_id)
+        found = {}
+        for index, shard_user_ids in grouped.items():
+            found.update(self.shard_files[index].get_many(shard_user_ids))
+        return found
+
+    def put_many(self, records: Dict[int, UserRecord]) -> None:
+        grouped: Dict[int, Dict[int, UserRecord]] = {}
+        for user_id, record in records.items():
+            grouped.setdefault(shard_index(user_id, self.shards), {})[user_id] = record
+        for index, shard_records in grouped.items():
+            self.shard_files[index].put_many(shard_records)
+
+    def items(self) -> Iterator[Tuple[int, UserRecord]]:
+        for shard in self.shard_files:
+            if shard.path.exists():
+                yield from shard.items()
+
+
+class SqliteUserStorage(UserStorage):
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        has_table = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+        ).fetchone()
+        timestamp_columns = "".join(f"    {field} INTEGER,\n" for field in TIMESTAMP_FIELDS)
+        with self.connection:
+            if has_table and version < SQLITE_SCHEMA_VERSION:
+                self.connection.execute("ALTER TABLE users RENAME TO users_legacy")
+                for field in ("referred_by", *TIMESTAMP_FIELDS):
+                    self.connection.execute(f"DROP INDEX IF EXISTS idx_users_{field}")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS users (\n"
+                "    user_id INTEGER PRIMARY KEY,\n"
+                "    referred_by INTEGER,\n"
+                f"{timestamp_columns}"
+                "    data BLOB NOT NULL\n"
+                ")"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by)"
+            )
+            for field in TIMESTAMP_FIELDS:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_users_{field} ON users({field})")
+            if has_table and version < SQLITE_SCHEMA_VERSION:
+                legacy_rows = self.connection.execute("SELECT user_id, data FROM users_legacy")
+                self.connection.executemany(
+                    self._upsert_sql(),
+                    (self._row(user_id, UserRecord.from_dict(json.loads(data))) for user_id, data in legacy_rows),
+                )
+                self.connection.execute("DROP TABLE users_legacy")
+                logging.info("Хранилище пользователей %s переведено на бинарный формат записей", self.path)
+        self.connection.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+
+    @staticmethod
+    def _upsert_sql() -> str:
+        columns = ("user_id", "referred_by", *TIMESTAMP_FIELDS, "data")
+        placeholders = ", ".join("?" for _ in columns)
+        return f"INSERT OR REPLACE INTO users ({', '.join(columns)}) VALUES ({placeholders})"
+
+    @staticmethod
+    def _row(user_id: int, record: UserRecord) -> Tuple[Any, ...]:
+        return (
+            int(user_id),
+            record.referred_by,
+            *(getattr(record, field) for field in TIMESTAMP_FIELDS),
+            record.pack(),
+        )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        with self._lock:
+            row = self.connection.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        return UserRecord.unpack(row[0])
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, UserRecord]:
+        user_ids = list(user_ids)
+        found = {}
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            with self._lock:
+                rows = self.connection.execute(
+                    f"SELECT user_id, data FROM users WHERE user_id IN ({placeholders})", chunk
+                ).fetchall()
+            found.update((user_id, UserRecord.unpack(data)) for user_id, data in rows)
+        return found
+
+    def put_many(self, records: Dict[int, UserRecord]) -> None:
+        rows = [self._row(user_id, record) for user_id, record in records.items()]
+        with self._lock, self.connection:
+            self.connection.executemany(self._upsert_sql(), rows)
+
+    def items(self, after_user_id: Optional[int] = None) -> Iterator[Tuple[int, UserRecord]]:
+        last_user_id = after_user_id
+        while True:
+            with self._lock:
+                if last_user_id is None:
+                    rows = self.connection.execute(
+                        "SELECT user_id, data FROM users ORDER BY user_id LIMIT 1000"
+                    ).fetchall()
+                else:
+                    rows = self.connection.execute(
+                        "SELECT user_id, data FROM users WHERE user_id > ? ORDER BY user_id LIMIT 1000",
+                        (last_user_id,),
+                    ).fetchall()
+            if not rows:
+                return
+            for user_id, data in rows:
+                yield user_id, UserRecord.unpack(data)
+            last_user_id = rows[-1][0]
+
+    def stale_subscriptions(self, checked_before: int, limit: int) -> List[int]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT user_id FROM users WHERE subscription_checked_at < ? "
+                "ORDER BY subscription_checked_at LIMIT ?",
+                (checked_before, limit),
+            ).fetchall()
+        return [user_id for (user_id,) in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+
+class CachedUserStorage(UserStorage):
+    def __init__(
+        self, backend: UserStorage, *, flush_threshold: int = 100, preload: bool = False, max_records: int = 0
+    ) -> None:
+        self.backend = backend
+        self.flush_threshold = flush_threshold
+        self.max_records = max_records
+        self.records: "OrderedDict[int, UserRecord]" = OrderedDict()
+        self.dirty: Set[int] = set()
+        self.flushing: Set[int] = set()
+        self.evicted = 0
+        self.generation = 0
+        self.loading: Dict[int, int] = {}
+        self.written: Dict[int, int] = {}
+        self.complete = False
+        self.flush_requested = asyncio.Event()
+        if preload:
+            self.records = OrderedDict(backend.items())
+            self.complete = True
+
+    def lookup(self, user_id: int) -> Tuple[bool, Optional[UserRecord]]:
+        record = self.records.get(user_id)
+        if record is not None:
+            self.records.move_to_end(user_id)
+            return True, record.copy()
+        return self.complete, None
+
+    def remember(self, records: Dict[int, UserRecord]) -> None:
+        for user_id, record in records.items():
+            self.records.setdefault(user_id, record)
+            self.records.move_to_end(user_id)
+        self.evict()
+
+    def evict(self) -> None:
+        if self.complete or self.max_records <= 0:
+            return
+        excess = len(self.records) - self.max_records
+        if excess <= 0:
+            return
+        victims = []
+        for user_id in self.records:
+            if len(victims) >= excess:
+                break
+            if user_id not in self.dirty and user_id not in self.flushing:
+                victims.append(user_id)
+        for user_id in victims:
+            del self.records[user_id]
+        self.evicted += len(victims)
+
+    def get(self, user_id: int) -> Optional[UserRecord]:
+        hit, record = self.lookup(user_id)
+        if hit:
+            return record
+        record = self.backend.get(user_id)
+        if record is not None:
+            self.remember({user_id: record})
+        return record.copy() if record is not None else None
+
+    def begin_load(self, user_ids: Iterable[int]) -> int:
+        for user_id in user_ids:
+            self.loading[user_id] = self.loading.get(user_id, 0) + 1
+        return self.generation
+
+    def written_since(self, user_id: int, generation: int) -> bool:
+        return self.written.get(user_id, 0) > generation
+
+    def end_load(self, user_ids: Iterable[int]) -> None:
+        for user_id in user_ids:
+            remaining = self.loading.pop(user_id) - 1
+            if remaining:
+                self.loading[user_id] = remaining
+            else:
+                self.written.pop(user_id, None)
+
+    def put_many(self, records: Dict[int, UserRecord]) -> None:
+        self.generation += 1
+        for user_id, record in records.items():
+            self.records[user_id] = record.copy()
+            self.records.move_to_end(user_id)
+            self.dirty.add(user_id)
+            if user_id in self.loading:
+                self.written[user_id] = self.generation
+        if len(self.dirty) >= self.flush_threshold:
+            self.flush_requested.set()
+        self.evict()
+
+    def items(self) -> Iterator[Tuple[int, UserRecord]]:
+        self.flush()
+        return self.backend.items()
+
+    def take_dirty(self) -> Dict[int, UserRecord]:
+        batch = {user_id: self.records[user_id] for user_id in self.dirty}
+        self.flushing.update(self.dirty)
+        self.dirty.clear()
+        return batch
+
+    def finish_flush(self, batch: Dict[int, UserRecord], failed: bool = False) -> None:
+        self.flushing.difference_update(batch)
+        if failed:
+            self.dirty.update(batch)
+        self.evict()
+
+    def flush(self) -> int:
+        batch = self.take_dirty()
+        if not batch:
+            return 0
+        try:
+            self.backend.put_many(batch)
+        except Exception:
+            self.finish_flush(batch, failed=True)
+            raise
+        self.finish_flush(batch)
+        return len(batch)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "records": len(self.records),
+            "dirty": len(self.dirty),
+            "flushing": len(self.flushing),
+            "evicted": self.evicted,
+        }
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.backend.close()
+
+
+class AsyncUserStorage:
+    def __init__(self, cache: CachedUserStorage, executor: IOExecutor) -> None:
+        self.cache = cache
+        self.executor = executor
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    async def get(self, user_id: int) -> Optional[UserRecord]:
+        hit, record = self.cache.lookup(user_id)
+        if hit:
+            return record
+        future = self._pending.get(user_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self._pending:
+                loop.call_soon(self._start_batch)
+            future = self._pending[user_id] = loop.create_future()
+        record = await asyncio.shield(future)
+        return record.copy() if record is not None else None
+
+    def _start_batch(self) -> None:
+        pending, self._pending = self._pending, {}
+        asyncio.ensure_future(self._load_batch(pending))
+
+    async def _load_batch(self, pending: Dict[int, asyncio.Future]) -> None:
+        results: Dict[int, Optional[UserRecord]] = {}
+        user_ids = list(pending)
+        try:
+            while user_ids:
+                generation = self.cache.begin_load(user_ids)
+                try:
+                    records = await self.executor.run(self.cache.backend.get_many, user_ids)
+                    stale = {user_id for user_id in user_ids if self.cache.written_since(user_id, generation)}
+                finally:
+                    self.cache.end_load(user_ids)
+                self.cache.remember({user_id: record for user_id, record in records.items() if user_id not in stale})
+                retry = []
+                for user_id in user_ids:
+                    cached = self.cache.records.get(user_id)
+                    if user_id not in stale:
+                        results[user_id] = cached if cached is not None else records.get(user_id)
+                    elif cached is not None:
+                        results[user_id] = cached
+                    else:
+                        retry.append(user_id)
+                user_ids = retry
+        except Exception as exc:  # noqa: BLE001
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for user_id, future in pending.items():
+            if not future.done():
+                future.set_result(results.get(user_id))
+
+    def put(self, user_id: int, record: UserRecord) -> None:
+        self.cache.put(user_id, record)
+
+    def put_many(self, records: Dict[int, UserRecord]) -> None:
+        self.cache.put_many(records)
+
+    async def stale_subscriptions(self, checked_before: int, limit: int) -> List[int]:
+        if self.cache.complete:
+            return oldest_subscription_checks(self.cache.records.items(), checked_before, limit)
+        return await self.executor.run(self.cache.backend.stale_subscriptions, checked_before, limit)
+
+    async def flush(self) -> int:
+        batch = self.cache.take_dirty()
+        if not batch:
+            return 0
+        try:
+            await self.executor.run(self.cache.backend.put_many, batch)
+        except Exception:
+            self.cache.finish_flush(batch, failed=True)
+            raise
+        self.cache.finish_flush(batch)
+        return len(batch)
+
+    async def run_flusher(self, interval: float) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.cache.flush_requested.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self.cache.flush_requested.clear()
+            try:
+                flushed = await self.flush()
+            except Exception as exc:  # noqa: BLE001
+                logging.error("Не удалось сохранить пользователей: %s", exc)
+                continue
+            if flushed:
+                logging.debug("Сохранено пользователей: %s", flushed)
+
+    def close(self) -> None:
+        self.cache.close()
+
+
+def create_user_storage(backend: str, data_file: Path, *, shards: int = 16) -> UserStorage:
+    if backend == "json":
+        return JsonUserStorage(data_file)
+    if backend == "sqlite":
+        storage = SqliteUserStorage(data_file.with_suffix(".db"))
+    elif backend == "sharded":
+        storage = ShardedJsonUserStorage(data_file.parent / "users_shards", shards)
+    else:
+        raise ValueError(f"Unknown user storage backend: {backend}")
+
+    if storage.is_empty() and data_file.exists():
+        legacy = JsonUserStorage(data_file)
+        storage.put_many(dict(legacy.items()))
+        logging.info("Импортированы пользователи из %s в %s", data_file, backend)
+    return storage
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Optional
+
+from aiogram.enums import ParseMode
+from aiogram.types import InlineKeyboardMarkup, Message, ReplyKeyboardMarkup
+
+TELEGRAM_TEXT_LIMIT = 4096
+_PARTIAL_MARKERS = ("[/B", "[/", "[B", "[")
+
+
+def close_open_markers(text: str) -> str:
+    for suffix in _PARTIAL_MARKERS:
+        if text.endswith(suffix):
+            text = text[: -len(suffix)]
+            break
+    opened = text.count("[B]") - text.count("[/B]")
+    if opened > 0:
+        text += "[/B]" * opened
+    return text
+
+
+class StreamingReply:
+    def __init__(
+        self,
+        message: Message,
+        render: Callable[[str], str],
+        *,
+        placeholder: str,
+        reply_markup: Optional[Any] = None,
+        min_interval: float = 1.0,
+    ) -> None:
+        self.message = message
+        self.render = render
+        self.placeholder = placeholder
+        self.reply_markup = reply_markup
+        self.min_interval = min_interval
+        self.sent: Optional[Message] = None
+        self.text = ""
+        self.shown: Optional[str] = None
+        self.last_edit = 0.0
+        self.edits = 0
+        self._pending: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self.sent is not None
+
+    async def start(self) -> None:
+        if self.sent is not None:
+            return
+        keyboard = self.reply_markup if isinstance(self.reply_markup, ReplyKeyboardMarkup) else None
+        self.sent = await self.message.answer(self.placeholder, reply_markup=keyboard)
+        self.last_edit = time.monotonic()
+
+    async def update(self, text: str) -> None:
+        self.text = text
+        if self.sent is None or self._pending is not None:
+            return
+        delay = self.last_edit + self.min_interval - time.monotonic()
+        if delay <= 0:
+            await self._edit(close_open_markers(text[:TELEGRAM_TEXT_LIMIT]))
+        else:
+            self._pending = asyncio.create_task(self._edit_later(delay))
+
+    async def _edit_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._pending = None
+        await self._edit(close_open_markers(self.text[:TELEGRAM_TEXT_LIMIT]))
+
+    async def _edit(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None, *, final: bool = False) -> None:
+        if not text.strip():
+            return
+        rendered = self.render(text)
+        if rendered == self.shown and reply_markup is None:
+            return
+        self.last_edit = time.monotonic()
+        try:
+            await self.sent.edit_text(rendered, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
+        except Exception as exc:  # noqa: BLE001
+            if not final:
+                logging.debug("Не удалось обновить сообщение во время генерации: %s", exc)
+                return
+            logging.warning("Не удалось отправить сообщение с HTML-разметкой: %s", exc)
+            await self.sent.edit_text(text, parse_mode=None, reply_markup=reply_markup)
+        self.shown = rendered
+        self.edits += 1
+
+    async def finish(self, text: str) -> bool:
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self.sent is None:
+            return False
+        self.text = text
+        inline = self.reply_markup if isinstance(self.reply_markup, InlineKeyboardMarkup) else None
+        await self._edit(close_open_markers(text[:TELEGRAM_TEXT_LIMIT]), inline, final=True)
+        return True
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram.enums import ChatMemberStatus
+
+from records import timestamp_now
+
+UNSUBSCRIBED_STATUSES = {ChatMemberStatus.LEFT, ChatMemberStatus.KICKED}
+
+
+class SubscriptionCache:
+    def __init__(self, *, positive_ttl: float = 600, negative_ttl: float = 60, max_entries: int = 100_000) -> None:
+        self.positive_ttl = int(positive_ttl * 1_000_000)
+        self.negative_ttl = int(negative_ttl * 1_000_000)
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[int, Tuple[str, int]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.seeded = 0
+
+    def _is_fresh(self, status: str, checked_at: int, now: int) -> bool:
+        ttl = self.negative_ttl if status in UNSUBSCRIBED_STATUSES else self.positive_ttl
+        return now - checked_at < ttl
+
+    def get(self, user_id: int, now: Optional[int] = None) -> Optional[str]:
+        entry = self.entries.get(user_id)
+        if entry is not None and self._is_fresh(*entry, timestamp_now() if now is None else now):
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            del self.entries[user_id]
+        self.misses += 1
+        return None
+
+    def put(self, user_id: int, status: str, checked_at: Optional[int] = None) -> None:
+        self.entries[user_id] = (status, timestamp_now() if checked_at is None else checked_at)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def seed(self, user_id: int, status: Optional[str], checked_at: Optional[int], now: Optional[int] = None) -> Optional[str]:
+        if status is None or checked_at is None:
+            return None
+        if not self._is_fresh(status, checked_at, timestamp_now() if now is None else now):
+            return None
+        self.put(user_id, status, checked_at)
+        self.seeded += 1
+        return status
+
+    def invalidate(self, user_id: int) -> None:
+        self.entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "seeded": self.seeded,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SubscriptionSweeper:
+    def __init__(
+        self,
+        find_stale: Callable[[int, int], Awaitable[List[int]]],
+        recheck: Callable[[int, int], Awaitable[bool]],
+        *,
+        max_age: float,
+        rate: float,
+        interval: float,
+    ) -> None:
+        self.find_stale = find_stale
+        self.recheck = recheck
+        self.max_age = int(max_age * 1_000_000)
+        self.rate = rate
+        self.interval = interval
+        self.rechecked = 0
+
+    async def sweep_once(self) -> int:
+        budget = max(1, int(self.rate * self.interval))
+        checked_before = timestamp_now() - self.max_age
+        rechecked = 0
+        for user_id in await self.find_stale(checked_before, budget):
+            if not await self.recheck(user_id, checked_before):
+                continue
+            rechecked += 1
+            await asyncio.sleep(1 / self.rate)
+        self.rechecked += rechecked
+        return rechecked
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                rechecked = await self.sweep_once()
+            except Exception as exc:  # noqa: BLE001
+                logging.error("Не удалось перепроверить подписки: %s", exc)
+                continue
+            if rechecked:
+                logging.debug("Перепроверено подписок: %s", rechecked)
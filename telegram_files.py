@@ -0,0 +1,90 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TelegramFileCache:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids (\n"
+                "    bot_id INTEGER NOT NULL,\n"
+                "    key TEXT NOT NULL,\n"
+                "    file_id TEXT NOT NULL,\n"
+                "    created_at INTEGER NOT NULL,\n"
+                "    PRIMARY KEY (bot_id, key)\n"
+                ")"
+            )
+        rows = self.connection.execute("SELECT bot_id, key, file_id FROM file_ids").fetchall()
+        self._file_ids: Dict[Tuple[int, str], str] = {(bot_id, key): file_id for bot_id, key, file_id in rows}
+        self._digests: Dict[Path, Tuple[int, int, str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.invalidated = 0
+
+    def content_key(self, path: Path) -> str:
+        stat = path.stat()
+        known = self._digests.get(path)
+        if known is None or known[:2] != (stat.st_mtime_ns, stat.st_size):
+            known = (stat.st_mtime_ns, stat.st_size, file_digest(path)[:20])
+            self._digests[path] = known
+        return f"card:{path.name}:{known[2]}"
+
+    def collage_key(self, paths: List[Path], height: int) -> str:
+        return f"collage:{height}:" + "|".join(self.content_key(path) for path in paths)
+
+    def get(self, bot_id: int, key: str) -> Optional[str]:
+        file_id = self._file_ids.get((bot_id, key))
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+
+    def put(self, bot_id: int, key: str, file_id: str) -> None:
+        self._file_ids[(bot_id, key)] = file_id
+        self.stored += 1
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO file_ids (bot_id, key, file_id, created_at) VALUES (?, ?, ?, ?)",
+                (bot_id, key, file_id, int(time.time())),
+            )
+
+    def forget(self, bot_id: int, key: str) -> None:
+        if self._file_ids.pop((bot_id, key), None) is not None:
+            self.invalidated += 1
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM file_ids WHERE bot_id = ? AND key = ?", (bot_id, key))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._file_ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "invalidated": self.invalidated,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,83 @@
+import asyncio
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("CHANNEL_USERNAME", "@test_channel")
+
+import main  # noqa: E402
+from card_images import CardImageCache, image_bytes  # noqa: E402
+
+
+@pytest.fixture
+def deck(tmp_path):
+    paths = []
+    for index, (size, color) in enumerate([((60, 100), "red"), ((120, 200), "green"), ((30, 50), "blue"), ((60, 100), "white")]):
+        path = tmp_path / f"card{index}.{'png' if index % 2 else 'jpg'}"
+        Image.new("RGB", size, color).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_cards_are_normalized_to_common_height(deck):
+    cache = CardImageCache(height=80)
+
+    assert cache.warm(deck) == 4
+    assert {cache.card(path).size for path in deck} == {(48, 80)}
+    assert cache.stats()["card_misses"] == 4
+    assert cache.stats()["card_hits"] == 4
+
+
+def test_collages_are_served_from_memory(deck):
+    cache = CardImageCache(height=80)
+    first = cache.collage(deck[:3])
+
+    with Image.open(BytesIO(first)) as collage:
+        assert collage.size == (144, 80)
+    for path in deck:
+        path.unlink()
+    assert cache.collage(deck[:3]) is first
+    stats = cache.stats()
+    assert (stats["collage_hits"], stats["collage_misses"], stats["collages"]) == (1, 1, 1)
+
+
+def test_ordered_triples_are_distinct_keys(deck):
+    cache = CardImageCache(height=40)
+
+    forward = cache.collage(deck[:3])
+    backward = cache.collage(list(reversed(deck[:3])))
+
+    assert forward != backward
+    assert cache.stats()["collages"] == 2
+
+
+def test_memory_budgets_are_enforced(deck):
+    card_size = 48 * 80 * 3
+    cache = CardImageCache(height=80, max_bytes=card_size * 2, collage_max_bytes=1)
+
+    assert cache.warm(deck) == 2
+    cache.collage(deck[:3])
+
+    stats = cache.stats()
+    assert stats["card_bytes"] <= card_size * 2
+    assert stats["card_evictions"] >= 1
+    assert stats["collages"] == 0
+    assert sum(image_bytes(cache.card(path)) for path in deck[:2]) == card_size * 2
+
+
+def test_main_collage_uses_shared_cache(deck, monkeypatch):
+    monkeypatch.setattr(main, "_card_images", None)
+    monkeypatch.setattr(main, "_collage_renderer", None)
+    monkeypatch.setattr(main, "COLLAGE_EXECUTOR", "thread")
+
+    async def scenario():
+        return [await main.create_three_card_collage(deck[:3]) for _ in range(2)]
+
+    first, second = asyncio.run(scenario())
+    main.close_collage_renderer()
+
+    assert first.data == second.data
+    assert main.get_card_images().stats()["collage_hits"] == 1
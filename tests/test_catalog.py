@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("CHANNEL_USERNAME", "@test_channel")
+
+import main  # noqa: E402
+import precompute_catalog  # noqa: E402
+from catalog import InterpretationCatalog  # noqa: E402
+
+CARDS = ["Шут", "Маг", "Жрица", "Императрица"]
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATA_FILE", tmp_path / "users.json")
+    monkeypatch.setattr(main, "_interpretation_catalog", None)
+    monkeypatch.setattr(main, "_interpretation_cache", None)
+    monkeypatch.setattr(main, "_io_executor", None)
+    monkeypatch.setattr(main, "_prompt_registry", None)
+    catalog = InterpretationCatalog(tmp_path / "catalog.db")
+    yield catalog
+    catalog.close()
+    main.close_interpretation_catalog()
+    main.get_io_executor().shutdown()
+
+
+def fake_llm(monkeypatch, fail_on=()):
+    calls = []
+
+    async def call_llm(messages, max_tokens, mode, **kwargs):
+        calls.append(messages[-1]["content"])
+        if len(calls) in fail_on:
+            return None
+        return f"Текст {len(calls)}"
+
+    monkeypatch.setattr(main, "call_llm", call_llm)
+    return calls
+
+
+def test_tools_import_main_without_bot_settings(tmp_path):
+    env = {key: value for key, value in os.environ.items() if key not in ("BOT_TOKEN", "CHANNEL_USERNAME")}
+    env["OPENAI_API_KEY"] = "sk-test"
+    code = "import precompute_catalog, main; assert main._llm_pool is None; print(len(precompute_catalog.catalog_prompt_keys()))"
+
+    env["PYTHONPATH"] = str(Path(main.__file__).parent)
+
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert int(result.stdout) > 0
+
+
+def test_catalog_keys_skip_free_text_prompts():
+    keys = precompute_catalog.catalog_prompt_keys()
+
+    assert "card_day" in keys
+    assert "REL_HAS_OTHER" in keys
+    assert "three_cards" not in keys
+    assert "clarify" not in keys
+
+
+def test_precompute_is_resumable(catalog, monkeypatch):
+    calls = fake_llm(monkeypatch, fail_on={2})
+
+    first = asyncio.run(precompute_catalog.precompute(catalog, ["card_day"], CARDS, concurrency=2))
+    second = asyncio.run(precompute_catalog.precompute(catalog, ["card_day"], CARDS, concurrency=2))
+
+    assert (first["generated"], first["failed"]) == (3, 1)
+    assert (second["fresh"], second["generated"]) == (3, 1)
+    assert len(calls) == 5
+    assert catalog.stats() == {"card_day": 4}
+
+
+def test_triples_are_sampled_without_materializing_permutations():
+    deck = [f"card{index}" for index in range(78)]
+    permutations = list(itertools.permutations(deck[:6], 3))
+
+    assert [precompute_catalog.nth_triple(deck[:6], index) for index in range(len(permutations))] == permutations
+    subjects = [subject for subject, _ in precompute_catalog.iter_subjects("SELF_LIE", deck, 2000, 1)]
+    assert len(subjects) == len(set(subjects)) == 2000
+    assert subjects == [subject for subject, _ in precompute_catalog.iter_subjects("SELF_LIE", deck, 2000, 1)]
+    assert all(len(set(subject.split(", "))) == 3 for subject in subjects)
+
+
+def test_triples_are_capped_and_served(catalog, monkeypatch):
+    fake_llm(monkeypatch)
+
+    counters = asyncio.run(
+        precompute_catalog.precompute(catalog, ["SELF_LIE"], CARDS, max_triples=5, seed=1)
+    )
+    assert counters["generated"] == 5
+    subjects = [subject for subject, _ in precompute_catalog.iter_subjects("SELF_LIE", CARDS, 5, 1)]
+
+    async def calls_should_not_happen(messages, max_tokens, mode, **kwargs):
+        raise AssertionError("LLM should not be called")
+
+    monkeypatch.setattr(main, "call_llm", calls_should_not_happen)
+    text = asyncio.run(main.generate_prompt_interpretation("SELF_LIE", card_names=subjects[0].split(", ")))
+    assert text.startswith("Текст")
+
+
+def test_override_change_invalidates_entries(catalog, monkeypatch):
+    calls = fake_llm(monkeypatch)
+    asyncio.run(precompute_catalog.precompute(catalog, ["card_day"], CARDS[:1]))
+    assert asyncio.run(main.generate_card_day_interpretation("Шут")) == "Текст 1"
+
+    monkeypatch.setenv("SPREAD_PROMPT_CARD_DAY", "Новый текст для {card_name}")
+    main.get_prompt_registry().reload()
+    assert asyncio.run(main.generate_card_day_interpretation("Шут")) == "Текст 2"
+
+    counters = asyncio.run(precompute_catalog.precompute(catalog, ["card_day"], CARDS[:1], prune=True))
+    assert counters["generated"] == 1
+    assert calls[-1] == "Новый текст для Шут"
+    assert catalog.stats() == {"card_day": 1}
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from card_images import CardImageCache, compose_collage
+from collage_pool import CollageRenderer
+
+
+@pytest.fixture
+def deck(tmp_path):
+    paths = []
+    for index, color in enumerate(["red", "green", "blue", "white"]):
+        path = tmp_path / f"card{index}.png"
+        Image.new("RGB", (60, 100), color).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_process_pool_matches_local_rendering(deck):
+    cards = CardImageCache(height=50)
+    renderer = CollageRenderer(cards, mode="process", workers=1)
+
+    async def scenario():
+        loaded = await renderer.start(deck)
+        return loaded, [await renderer.render(deck[:3]) for _ in range(2)]
+
+    try:
+        loaded, (first, second) = asyncio.run(scenario())
+    finally:
+        renderer.shutdown()
+
+    assert loaded == len(deck)
+
+    assert first == second == compose_collage([CardImageCache(height=50).card(path) for path in deck[:3]])
+    stats = renderer.stats()
+    assert (stats["rendered"], stats["cached"], stats["failed"]) == (1, 1, 0)
+    assert stats["max_render_ms"] > 0
+    assert cards.stats()["cards"] == 0
+
+
+def test_broken_pool_is_restarted_once(tmp_path):
+    deck = []
+    for index, color in enumerate(["red", "green", "blue", "white"]):
+        path = tmp_path / f"big{index}.png"
+        Image.new("RGB", (1600, 2400), color).save(path)
+        deck.append(path)
+    triples = [deck[:3], deck[1:], deck[::-1][:3], [deck[0], deck[2], deck[3]]]
+    renderer = CollageRenderer(CardImageCache(height=2400), mode="process", workers=2)
+
+    async def scenario():
+        await renderer.start(deck)
+        renders = [asyncio.create_task(renderer.render(triple)) for triple in triples]
+        await asyncio.sleep(0)
+        next(iter(renderer._executor._processes.values())).kill()
+        return await asyncio.gather(*renders)
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        renderer.shutdown()
+
+    assert len(set(results)) == 4
+    stats = renderer.stats()
+    assert (stats["restarts"], stats["failed"], stats["rendered"]) == (1, 0, 4)
+
+
+def test_submissions_are_bounded(deck, monkeypatch):
+    cards = CardImageCache(height=50)
+    renderer = CollageRenderer(cards, mode="thread", workers=4, max_pending=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+    render_collage = cards.render_collage
+
+    def slow_render(paths):
+        with lock:
+            active.append(paths)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(paths)
+        return render_collage(paths)
+
+    monkeypatch.setattr(cards, "render_collage", slow_render)
+    triples = [deck[:3], deck[1:], deck[::-1][:3], [deck[0], deck[2], deck[3]]]
+
+    async def scenario():
+        return await asyncio.gather(*(renderer.render(triple) for triple in triples))
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        renderer.shutdown()
+
+    assert len(set(results)) == 4
+    assert max(peak) == 2
+    stats = renderer.stats()
+    assert stats["rendered"] == 4
+    assert stats["peak_waiting"] == 2
+    assert (stats["waiting"], stats["in_flight"]) == (0, 0)
+    assert cards.stats()["collages"] == 4
+
+
+def test_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        CollageRenderer(CardImageCache(), mode="gpu")
@@ -0,0 +1,72 @@
+import asyncio
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+import fsm_storage
+from fsm_storage import SqliteFSMStorage
+from io_pool import IOExecutor
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+class Form(StatesGroup):
+    waiting = State()
+
+
+def test_state_and_data_survive_reopen(tmp_path):
+    async def scenario():
+        executor = IOExecutor(max_workers=1)
+        storage = SqliteFSMStorage(tmp_path / "fsm.db", executor)
+        await storage.set_state(KEY, Form.waiting)
+        await storage.update_data(KEY, {"card_name": "Шут"})
+        await storage.close()
+
+        reopened = SqliteFSMStorage(tmp_path / "fsm.db", executor)
+        state = await reopened.get_state(KEY)
+        data = await reopened.get_data(KEY)
+        other = await reopened.get_state(StorageKey(bot_id=1, chat_id=11, user_id=11))
+        await reopened.close()
+        executor.shutdown()
+        return state, data, other
+
+    assert asyncio.run(scenario()) == (Form.waiting.state, {"card_name": "Шут"}, None)
+
+
+def test_clear_removes_row(tmp_path):
+    async def scenario():
+        executor = IOExecutor(max_workers=1)
+        storage = SqliteFSMStorage(tmp_path / "fsm.db", executor)
+        await storage.set_state(KEY, Form.waiting)
+        await storage.set_data(KEY, {"card_name": "Маг"})
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        count = storage.count()
+        await storage.close()
+        executor.shutdown()
+        return count
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_expired_states_are_hidden_and_swept(tmp_path, monkeypatch):
+    clock = [1_000_000]
+    monkeypatch.setattr(fsm_storage, "_now_ms", lambda: clock[0])
+
+    async def scenario():
+        executor = IOExecutor(max_workers=1)
+        storage = SqliteFSMStorage(tmp_path / "fsm.db", executor, ttl=60)
+        await storage.set_state(KEY, Form.waiting)
+        await storage.set_data(KEY, {"card_name": "Луна"})
+        clock[0] += 61_000
+        expired = (await storage.get_state(KEY), await storage.get_data(KEY))
+        await storage.set_state(KEY, Form.waiting)
+        fresh_data = await storage.get_data(KEY)
+        clock[0] += 61_000
+        removed = storage.sweep()
+        remaining = storage.count()
+        await storage.close()
+        executor.shutdown()
+        return expired, fresh_data, removed, remaining
+
+    assert asyncio.run(scenario()) == ((None, {}), {}, 1, 0)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+
+from ledger import DiamondLedger
+
+
+def make_ledger(tmp_path) -> DiamondLedger:
+    ledger = DiamondLedger(tmp_path / "diamonds.log", tmp_path / "diamonds.snapshot.json")
+    ledger.load()
+    return ledger
+
+
+def test_apply_appends_entries_and_clamps_at_zero(tmp_path):
+    ledger = make_ledger(tmp_path)
+
+    assert ledger.apply(1, 10, "subscription") == 10
+    assert ledger.apply(1, -15, "spread") == 0
+    assert ledger.apply(2, 5, "daily_gift", opening_balance=20) == 25
+
+    entries = [json.loads(line) for line in (tmp_path / "diamonds.log").read_text().splitlines()]
+    assert [(entry["user"], entry["delta"], entry["reason"]) for entry in entries] == [
+        (1, 10, "subscription"),
+        (1, -10, "spread"),
+        (2, 20, "opening"),
+        (2, 5, "daily_gift"),
+    ]
+
+
+def test_replay_after_compaction_restores_balances(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.apply(1, 10, "subscription")
+    ledger.compact()
+    ledger.apply(1, -5, "spread")
+    ledger._log.close()
+
+    assert (tmp_path / "diamonds.log").read_text().count("\n") == 1
+    restored = make_ledger(tmp_path)
+    assert restored.balance(1) == 5
+    assert restored.seq == 2
+
+
+def test_replay_skips_entries_already_in_snapshot(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.apply(1, 10, "subscription")
+    stale_log = (tmp_path / "diamonds.log").read_text()
+    ledger.close()
+    (tmp_path / "diamonds.log").write_text(stale_log + "{broken", encoding="utf-8")
+
+    restored = make_ledger(tmp_path)
+    assert restored.balance(1) == 10
+    restored.apply(1, 1, "daily_gift")
+    restored._log.close()
+    assert make_ledger(tmp_path).balance(1) == 11
+
+
+def test_background_compaction_keeps_entries_appended_meanwhile(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.apply(1, 10, "subscription")
+    ledger.apply(2, 3, "subscription")
+
+    async def run_io(func, *args):
+        ledger.apply(1, -4, "spread")
+        return func(*args)
+
+    asyncio.run(ledger.compact_in(run_io))
+
+    entries = [json.loads(line) for line in (tmp_path / "diamonds.log").read_text().splitlines()]
+    assert [(entry["seq"], entry["reason"]) for entry in entries] == [(3, "spread")]
+    assert json.loads((tmp_path / "diamonds.snapshot.json").read_text())["seq"] == 2
+    assert ledger.entries_since_snapshot == 1
+    ledger.apply(2, 1, "daily_gift")
+    ledger._log.close()
+    restored = make_ledger(tmp_path)
+    assert (restored.balance(1), restored.balance(2), restored.seq) == (6, 4, 4)
+
+
+def test_stale_snapshot_never_overwrites_newer_one(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.apply(1, 10, "subscription")
+    seq, balances, _, _ = ledger.capture()
+    ledger.apply(1, 5, "daily_gift")
+    ledger.close()
+
+    assert not ledger.write_snapshot(seq, balances)
+    assert make_ledger(tmp_path).balance(1) == 15
+
+
+def test_compaction_offset_counts_bytes_of_non_ascii_reasons(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.apply(1, 10, "подписка")
+    ledger.apply(2, 3, "расклад")
+
+    async def run_io(func, *args):
+        ledger.apply(1, -4, "расклад:три карты")
+        return func(*args)
+
+    asyncio.run(ledger.compact_in(run_io))
+
+    entries = [json.loads(line) for line in (tmp_path / "diamonds.log").read_text(encoding="utf-8").splitlines()]
+    assert [(entry["seq"], entry["reason"]) for entry in entries] == [(3, "расклад:три карты")]
+    assert not (tmp_path / ".diamonds.log.tmp").exists()
+    ledger._log.close()
+    assert make_ledger(tmp_path).balance(1) == 6
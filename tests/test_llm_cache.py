@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("CHANNEL_USERNAME", "@test_channel")
+
+import llm_cache  # noqa: E402
+import main  # noqa: E402
+from llm_cache import FrequencySketch, InterpretationCache, TinyLFUCache, interpretation_key  # noqa: E402
+
+MESSAGES = [{"role": "system", "content": "sys"}, {"role": "user", "content": "Карта: Шут"}]
+
+
+def test_key_depends_on_prompt_model_and_params():
+    base = interpretation_key("card_day", "Шут", MESSAGES, "gpt", {"temperature": 0.4})
+
+    assert base == interpretation_key("card_day", "Шут", MESSAGES, "gpt", {"temperature": 0.4})
+    assert base != interpretation_key("card_day", "Маг", MESSAGES, "gpt", {"temperature": 0.4})
+    assert base != interpretation_key("card_day", "Шут", [{"role": "system", "content": "new"}], "gpt", {"temperature": 0.4})
+    assert base != interpretation_key("card_day", "Шут", MESSAGES, "other", {"temperature": 0.4})
+    assert base != interpretation_key("card_day", "Шут", MESSAGES, "gpt", {"temperature": 0.9})
+
+
+def test_cache_fills_variants_before_serving():
+    cache = InterpretationCache(variants=2)
+
+    assert cache.get("k") is None
+    cache.add("k", "first")
+    assert cache.get("k") is None
+    assert cache.any("k") == "first"
+    cache.add("k", "second")
+    cache.add("k", "third")
+
+    assert cache.get("k") in {"second", "third"}
+    assert [variant[0] for variant in cache.entries["k"]] == ["second", "third"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_expires_and_evicts(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: clock[0])
+    cache = InterpretationCache(variants=1, ttl=60, max_keys=2)
+    cache.add("a", "A")
+    cache.add("b", "B")
+    cache.get("a")
+    cache.add("c", "C")
+
+    assert set(cache.entries) == {"a", "c"}
+    clock[0] += 61
+    assert cache.get("a") is None
+    assert "a" not in cache.entries
+
+
+def test_cache_persists_between_runs(tmp_path):
+    path = tmp_path / "interpretations.json"
+    cache = InterpretationCache(variants=1, path=path)
+    cache.add("k", "Текст")
+    cache.save()
+
+    restored = InterpretationCache(variants=1, path=path)
+    restored.load()
+
+    assert restored.get("k") == "Текст"
+    assert "Текст" in json.loads(path.read_text(encoding="utf-8"))["k"][0]
+
+
+def test_tinylfu_respects_byte_cap_and_frequency():
+    cache = TinyLFUCache(max_bytes=30)
+    for _ in range(3):
+        cache.get("hot")
+    assert cache.put("hot", "x" * 10)
+    assert cache.put("warm", "y" * 10)
+    assert cache.total_bytes == 27
+
+    assert not cache.put("cold", "z" * 10)
+    assert cache.get("hot") == "x" * 10
+
+    for _ in range(5):
+        cache.get("new")
+    assert cache.put("new", "n" * 10)
+    assert "warm" not in cache.entries
+    assert set(cache.entries) == {"hot", "new"}
+    assert cache.total_bytes <= 30
+    assert cache.stats()["rejected"] == 1
+    assert cache.stats()["evicted"] == 1
+
+
+def test_tinylfu_refresh_keeps_resident_entry():
+    cache = TinyLFUCache(max_bytes=30)
+    assert cache.put("old", "x" * 10)
+    for _ in range(5):
+        cache.get("busy")
+    assert cache.put("busy", "y" * 10)
+
+    assert cache.put("old", "z" * 15)
+    assert cache.get("old") == "z" * 15
+    assert "busy" not in cache.entries
+    assert cache.total_bytes == 18
+    assert not cache.put("old", "z" * 40)
+    assert cache.get("old") == "z" * 15
+    assert cache.stats()["evicted"] == 1
+
+
+def test_tinylfu_rejects_oversized_entries():
+    cache = TinyLFUCache(max_bytes=10)
+
+    assert not cache.put("k", "текст длиннее лимита")
+    assert cache.total_bytes == 0
+
+
+def test_frequency_sketch_ages_counters():
+    sketch = FrequencySketch(width=64, sample_size=20)
+    for _ in range(10):
+        sketch.increment("a")
+    assert sketch.estimate("a") >= 10
+    for index in range(10):
+        sketch.increment(f"other-{index}")
+    assert sketch.estimate("a") <= 5
+
+
+@pytest.fixture
+def main_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATA_FILE", tmp_path / "users.json")
+    monkeypatch.setattr(main, "_interpretation_cache", None)
+    monkeypatch.setattr(main, "_spread_cache", None)
+    monkeypatch.setattr(main, "_prompt_registry", None)
+    yield
+    main.close_interpretation_cache()
+
+
+def test_card_of_day_interpretations_are_cached(main_caches, monkeypatch):
+    monkeypatch.setattr(main, "LLM_CACHE_VARIANTS", 2)
+    calls = []
+
+    async def fake_llm(messages, max_tokens, mode, **kwargs):
+        calls.append(messages)
+        return f"Вариант {len(calls)}"
+
+    monkeypatch.setattr(main, "call_llm", fake_llm)
+
+    texts = [asyncio.run(main.generate_card_day_interpretation("Шут")) for _ in range(5)]
+
+    assert len(calls) == 2
+    assert texts[:2] == ["Вариант 1", "Вариант 2"]
+    assert set(texts[2:]) <= {"Вариант 1", "Вариант 2"}
+    main.close_interpretation_cache()
+    assert (main.DATA_FILE.parent / "interpretations.json").exists()
+
+
+def test_leaf_spread_results_are_cached(main_caches, monkeypatch):
+    calls = []
+
+    async def fake_llm(messages, max_tokens, mode, **kwargs):
+        calls.append(messages)
+        return "Разбор"
+
+    monkeypatch.setattr(main, "call_llm", fake_llm)
+    cards = ["Шут", "Маг", "Луна"]
+
+    first = asyncio.run(main.generate_prompt_interpretation("SELF_LIE", card_names=cards))
+    second = asyncio.run(main.generate_prompt_interpretation("SELF_LIE", card_names=cards))
+    asyncio.run(main.generate_prompt_interpretation("SELF_LIE", card_names=list(reversed(cards))))
+    asyncio.run(main.generate_prompt_interpretation("three_cards", question="Что будет?", card_names=cards))
+    asyncio.run(main.generate_prompt_interpretation("three_cards", question="Что будет?", card_names=cards))
+
+    assert first == second == "Разбор"
+    assert len(calls) == 4
+    assert main.get_spread_cache().stats()["hits"] == 1
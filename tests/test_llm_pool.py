@@ -0,0 +1,94 @@
+import asyncio
+
+import openai
+import pytest
+
+from llm_pool import (
+    LLMClientPool,
+    LLMEndpoint,
+    PooledKey,
+    PoolExhausted,
+    build_pooled_key,
+    parse_duration,
+    parse_endpoints,
+)
+from mock_llm_server import MockLLMConfig, MockLLMServer
+
+
+def test_parse_endpoints_and_durations():
+    endpoints = parse_endpoints("sk-a, sk-b@http://proxy:8080/v1,,", "https://api.example/v1")
+
+    assert [(endpoint.name, endpoint.api_key, endpoint.base_url) for endpoint in endpoints] == [
+        ("key1", "sk-a", "https://api.example/v1"),
+        ("key2", "sk-b", "http://proxy:8080/v1"),
+    ]
+    assert parse_duration("6m0s") == 360.0
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1.5") == 1.5
+    assert parse_duration("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+
+def test_routes_to_key_with_most_headroom():
+    busy, spare = PooledKey("busy", "busy-client"), PooledKey("spare", "spare-client")
+    busy.observe(200, {"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "10", "x-ratelimit-reset-requests": "30s"}, 10)
+    spare.observe(200, {"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "60", "x-ratelimit-reset-requests": "30s"}, 10)
+    pool = LLMClientPool([busy, spare])
+
+    async def scenario():
+        async with pool.client() as client:
+            return client
+
+    assert asyncio.run(scenario()) == "spare-client"
+    assert spare.headroom(spare.reset_at - 1) == pytest.approx(0.59)
+    assert spare.headroom(spare.reset_at) == 1.0
+
+
+def test_rate_limited_keys_cool_down():
+    first, second = PooledKey("first", "first-client"), PooledKey("second", "second-client")
+    first.observe(429, {"retry-after-ms": "60000"}, 10)
+    pool = LLMClientPool([first, second])
+
+    assert pool.choose() is second
+    second.observe(429, {}, 10)
+    with pytest.raises(PoolExhausted):
+        pool.choose()
+    assert (first.rate_limited, second.rate_limited) == (1, 1)
+
+
+def test_pool_spreads_load_using_response_headers():
+    async def scenario():
+        server = MockLLMServer(MockLLMConfig(latency="fixed", latency_ms=0, requests_per_minute=1))
+        base_url = await server.start()
+        pool = LLMClientPool(
+            [
+                build_pooled_key(
+                    LLMEndpoint(f"key{index}", f"sk-{index}", base_url),
+                    max_connections=2,
+                    max_keepalive=1,
+                    keepalive_expiry=5,
+                    default_cooldown=30,
+                )
+                for index in (1, 2)
+            ]
+        )
+        outcomes = []
+        try:
+            for _ in range(5):
+                try:
+                    async with pool.client() as client:
+                        await client.chat.completions.create(model="mock", messages=[{"role": "user", "content": "?"}])
+                    outcomes.append("ok")
+                except openai.RateLimitError:
+                    outcomes.append("429")
+                except PoolExhausted:
+                    outcomes.append("exhausted")
+            return outcomes, pool.stats()
+        finally:
+            await pool.close()
+            await server.stop()
+
+    outcomes, stats = asyncio.run(scenario())
+
+    assert outcomes == ["ok", "ok", "429", "429", "exhausted"]
+    assert stats["key1"]["requests"] == stats["key2"]["requests"] == 2
+    assert stats["key1"]["cooldown"] > 50
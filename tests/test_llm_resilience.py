@@ -0,0 +1,171 @@
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from llm_resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, is_retryable
+from llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_DAY, LLMScheduler
+
+
+def connection_error():
+    return openai.APIConnectionError(request=None)
+
+
+def status_error(error_class, status_code):
+    response = SimpleNamespace(request=None, status_code=status_code, headers={})
+    return error_class("error", response=response, body=None)
+
+
+def make_caller(**kwargs):
+    options = {"retries": 2, "base_delay": 0.001, "max_delay": 0.002}
+    options.update(kwargs)
+    return ResilientCaller(CircuitBreaker(failure_threshold=2, reset_timeout=60), **options)
+
+
+def test_is_retryable_classifies_errors():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(connection_error())
+    assert is_retryable(status_error(openai.RateLimitError, 429))
+    assert is_retryable(status_error(openai.InternalServerError, 503))
+    assert not is_retryable(status_error(openai.BadRequestError, 400))
+    assert not is_retryable(ValueError("bad"))
+
+
+def test_retryable_errors_are_retried():
+    caller = make_caller()
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise connection_error()
+        return "ok"
+
+    assert asyncio.run(caller.call(flaky, deadline=5)) == "ok"
+    assert len(attempts) == 3
+    stats = caller.stats()
+    assert stats["retries"] == 2
+    assert stats["successes"] == 1
+    assert stats["breaker"] == "closed"
+
+
+def test_non_retryable_errors_fail_fast():
+    caller = make_caller()
+    attempts = []
+
+    async def broken():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(caller.call(broken, deadline=5))
+    assert len(attempts) == 1
+    assert caller.breaker.failures == 0
+
+
+def test_breaker_opens_and_short_circuits():
+    caller = make_caller(retries=0)
+
+    async def down():
+        raise connection_error()
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(openai.APIConnectionError):
+                await caller.call(down, deadline=5)
+        with pytest.raises(CircuitOpenError):
+            await caller.call(down, deadline=5)
+
+    asyncio.run(scenario())
+    stats = caller.stats()
+    assert stats["breaker"] == "open"
+    assert stats["breaker_opened"] == 1
+    assert stats["short_circuited"] == 1
+    assert caller.breaker.is_open
+
+
+def test_half_open_probe_closes_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_deadline_covers_slow_calls():
+    caller = make_caller(retries=0)
+
+    async def slow():
+        await asyncio.sleep(1)
+        return "late"
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(caller.call(slow, deadline=0.05))
+    assert caller.stats()["timeouts"] == 1
+
+
+def test_hedged_request_wins_when_primary_stalls():
+    caller = make_caller(hedge_percentile=50, hedge_min_samples=1)
+    caller.latency.add(0.01)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+            return "primary"
+        return "backup"
+
+    assert asyncio.run(caller.call(request, deadline=0.5)) == "backup"
+    stats = caller.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_hedge_needs_a_free_scheduler_slot():
+    scheduler = LLMScheduler(2, max_queue=5, max_wait=1)
+    caller = make_caller(
+        hedge_percentile=50, hedge_min_samples=1, hedge_limiter=scheduler, hedge_priority=PRIORITY_BACKGROUND
+    )
+    caller.latency.add(0.01)
+    calls = []
+
+    async def request():
+        calls.append(scheduler.in_flight)
+        await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+        return len(calls)
+
+    async def scenario():
+        async with scheduler.slot(PRIORITY_DAY):
+            hedged = await caller.call(request, deadline=1)
+            in_flight = scheduler.in_flight
+            async with scheduler.slot(PRIORITY_DAY):
+                calls.clear()
+                unhedged = await caller.call(request, deadline=1)
+        return hedged, in_flight, unhedged
+
+    hedged, in_flight, unhedged = asyncio.run(scenario())
+
+    assert hedged == 2
+    assert in_flight == 1
+    assert unhedged == 1
+    stats = caller.stats()
+    assert (stats["hedges"], stats["hedges_skipped"]) == (1, 1)
+
+
+def test_streaming_calls_are_not_hedged():
+    caller = make_caller(hedge_percentile=50, hedge_min_samples=1)
+    caller.latency.add(0.001)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "streamed"
+
+    assert asyncio.run(caller.call(request, deadline=1, hedge=False)) == "streamed"
+    assert len(calls) == 1
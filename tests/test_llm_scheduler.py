@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from llm_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_CLARIFY,
+    PRIORITY_DAY,
+    PRIORITY_THREE,
+    LLMScheduler,
+    SchedulerOverloaded,
+    SchedulerTimeout,
+)
+
+
+def test_waiters_are_served_by_priority():
+    scheduler = LLMScheduler(1, max_queue=10, max_wait=1)
+    order = []
+
+    async def job(name, priority):
+        async with scheduler.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        first = asyncio.create_task(job("first", PRIORITY_DAY))
+        await asyncio.sleep(0)
+        waiting = [
+            asyncio.create_task(job("day", PRIORITY_DAY)),
+            asyncio.create_task(job("three", PRIORITY_THREE)),
+            asyncio.create_task(job("clarify", PRIORITY_CLARIFY)),
+        ]
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(scenario())
+
+    assert order == ["first", "clarify", "three", "day"]
+    assert scheduler.available == 1
+    assert scheduler.stats()["peak_depth"] == 3
+
+
+def test_full_queue_sheds_lowest_priority():
+    scheduler = LLMScheduler(1, max_queue=1, max_wait=1)
+
+    async def scenario():
+        await scheduler.acquire(PRIORITY_DAY)
+        day = asyncio.create_task(scheduler.acquire(PRIORITY_DAY))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.acquire(PRIORITY_DAY)
+        clarify = asyncio.create_task(scheduler.acquire(PRIORITY_CLARIFY))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerOverloaded):
+            await day
+        scheduler.release()
+        await clarify
+        scheduler.release()
+
+    asyncio.run(scenario())
+
+    stats = scheduler.stats()["priorities"]
+    assert stats["day"]["shed"] == 2
+    assert stats["clarify"]["granted"] == 1
+    assert scheduler.available == 1
+
+
+def test_waiting_past_deadline_times_out_but_background_waits():
+    scheduler = LLMScheduler(1, max_queue=5, max_wait=0.02)
+
+    async def scenario():
+        await scheduler.acquire(PRIORITY_THREE)
+        background = asyncio.create_task(scheduler.acquire(PRIORITY_BACKGROUND))
+        with pytest.raises(SchedulerTimeout):
+            await scheduler.acquire(PRIORITY_THREE)
+        assert not background.done()
+        scheduler.release()
+        await background
+        scheduler.release()
+
+    asyncio.run(scenario())
+
+    assert scheduler.stats()["priorities"]["three"]["timed_out"] == 1
+    assert scheduler.depth == 0
+    assert scheduler.available == 1
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    scheduler = LLMScheduler(1, max_queue=5, max_wait=1)
+
+    async def scenario():
+        await scheduler.acquire(PRIORITY_DAY)
+        waiter = asyncio.create_task(scheduler.acquire(PRIORITY_DAY))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        scheduler.release()
+
+    asyncio.run(scenario())
+
+    assert scheduler.available == 1
+    assert scheduler.depth == 0
+
+
+def test_slot_handed_off_at_timeout_is_returned(monkeypatch):
+    scheduler = LLMScheduler(1, max_queue=5, max_wait=1)
+
+    async def handed_off_then_timed_out(future, timeout):
+        scheduler.release()
+        assert future.done()
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        await scheduler.acquire(PRIORITY_DAY)
+        monkeypatch.setattr(asyncio, "wait_for", handed_off_then_timed_out)
+        with pytest.raises(SchedulerTimeout):
+            await scheduler.acquire(PRIORITY_DAY)
+
+    asyncio.run(scenario())
+
+    assert scheduler.available == 1
+    assert scheduler.depth == 0
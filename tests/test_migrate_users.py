@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+
+import migrate_users
+from migrate_users import JsonObjectStream, migrate
+from records import DEFAULT_USER
+from storage import JsonUserStorage, ShardedJsonUserStorage, SqliteUserStorage
+
+USERS = {
+    str(user_id): {**DEFAULT_USER, "diamonds": user_id, "last_daily_card": f"Карта «{user_id}»"}
+    for user_id in range(1, 26)
+}
+
+
+def write_users(path):
+    path.write_text(json.dumps(USERS, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def test_stream_parser_handles_tiny_chunks_and_reports_offsets():
+    payload = json.dumps({"1": {"a": "ё"}, "2": {"b": [1, 2]}}, ensure_ascii=False).encode("utf-8")
+    entries = list(JsonObjectStream(io.BytesIO(payload), chunk_size=3))
+
+    assert [(key, value) for key, value, _ in entries] == [("1", {"a": "ё"}), ("2", {"b": [1, 2]})]
+    offset = entries[0][2]
+    resumed = list(JsonObjectStream(io.BytesIO(payload), start_offset=offset, chunk_size=5))
+    assert [key for key, _, _ in resumed] == ["2"]
+
+
+def test_stream_parser_rejects_truncated_input():
+    with pytest.raises(ValueError):
+        list(JsonObjectStream(io.BytesIO(b'{"1": {"a": 1}, "2": {"b"'), chunk_size=4))
+
+
+def test_roundtrip_through_every_format(tmp_path):
+    source = tmp_path / "users.json"
+    write_users(source)
+    out = io.StringIO()
+
+    assert migrate("json", source, "sqlite", tmp_path / "users.db", batch_size=4, out=out) == 25
+    assert migrate("sqlite", tmp_path / "users.db", "sharded", tmp_path / "shards", shards=3, batch_size=4, out=out) == 25
+    assert migrate("sharded", tmp_path / "shards", "binary", tmp_path / "users.bin", batch_size=4, out=out) == 25
+    assert migrate("binary", tmp_path / "users.bin", "json", tmp_path / "export.json", batch_size=4, out=out) == 25
+
+    exported = json.loads((tmp_path / "export.json").read_text(encoding="utf-8"))
+    assert exported == USERS
+    assert ShardedJsonUserStorage(tmp_path / "shards", 3).get(7).diamonds == 7
+    assert JsonUserStorage(tmp_path / "export.json").get(25).last_daily_card == "Карта «25»"
+    assert "зап/с" in out.getvalue()
+    assert not list(tmp_path.glob("*.checkpoint.json"))
+
+
+@pytest.mark.parametrize("target_kind", ["binary", "sqlite", "sharded", "json"])
+def test_interrupted_migration_resumes_without_duplicates(tmp_path, monkeypatch, target_kind):
+    source = tmp_path / "users.json"
+    write_users(source)
+    target = tmp_path / f"target.{target_kind}"
+    target_class = type(migrate_users.create_target(target_kind, target, 2))
+    original_write_batch = target_class.write_batch
+    calls = []
+
+    def failing_write_batch(self, batch):
+        calls.append(len(batch))
+        if len(calls) == 3:
+            raise RuntimeError("disk full")
+        original_write_batch(self, batch)
+
+    monkeypatch.setattr(target_class, "write_batch", failing_write_batch)
+    with pytest.raises(RuntimeError):
+        migrate("json", source, target_kind, target, shards=2, batch_size=4, out=io.StringIO())
+    monkeypatch.setattr(target_class, "write_batch", original_write_batch)
+
+    with pytest.raises(FileExistsError):
+        migrate("json", source, target_kind, target, shards=2, batch_size=4, out=io.StringIO())
+    assert migrate("json", source, target_kind, target, shards=2, batch_size=4, resume=True, out=io.StringIO()) == 25
+
+    export = tmp_path / "export.json"
+    migrate(target_kind, target, "json", export, shards=2, out=io.StringIO())
+    assert json.loads(export.read_text(encoding="utf-8")) == USERS
+    if target_kind == "sqlite":
+        storage = SqliteUserStorage(target)
+        assert sum(1 for _ in storage.items()) == 25
+        storage.close()
@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+import openai
+import pytest
+from openai import AsyncOpenAI
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("CHANNEL_USERNAME", "@test_channel")
+
+import load_test_llm  # noqa: E402
+from mock_llm_server import MockLLMConfig, MockLLMServer  # noqa: E402
+
+MESSAGES = [{"role": "system", "content": "Система"}, {"role": "user", "content": "Карты: Шут, Маг, Мир"}]
+
+
+def with_server(config, scenario):
+    async def runner():
+        server = MockLLMServer(config)
+        client = AsyncOpenAI(api_key="mock", base_url=await server.start(), max_retries=0)
+        try:
+            return await scenario(client), server.counters
+        finally:
+            await client.close()
+            await server.stop()
+
+    return asyncio.run(runner())
+
+
+def test_completion_reports_usage():
+    async def scenario(client):
+        return await client.chat.completions.create(model="mock", messages=MESSAGES, max_tokens=20)
+
+    response, counters = with_server(MockLLMConfig(latency="fixed", latency_ms=0), scenario)
+
+    assert response.choices[0].message.content
+    assert len(response.choices[0].message.content) <= 80
+    assert response.usage.completion_tokens == 20
+    assert response.usage.total_tokens == response.usage.prompt_tokens + 20
+    assert counters["requests"] == 1
+
+
+def test_streaming_sends_deltas_and_usage():
+    async def scenario(client):
+        stream = await client.chat.completions.create(
+            model="mock", messages=MESSAGES, max_tokens=10, stream=True, stream_options={"include_usage": True}
+        )
+        text = ""
+        usage = None
+        async for chunk in stream:
+            usage = chunk.usage or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+        return text, usage
+
+    (text, usage), counters = with_server(MockLLMConfig(latency="fixed", latency_ms=0, tokens_per_second=0), scenario)
+
+    assert len(text) == 40
+    assert usage.completion_tokens == 10
+    assert counters["streams"] == 1
+
+
+@pytest.mark.parametrize(
+    "config, error",
+    [
+        (MockLLMConfig(latency="fixed", latency_ms=0, rate_limit_rate=1.0), openai.RateLimitError),
+        (MockLLMConfig(latency="fixed", latency_ms=0, error_rate=1.0), openai.InternalServerError),
+    ],
+)
+def test_injected_failures(config, error):
+    async def scenario(client):
+        with pytest.raises(error):
+            await client.chat.completions.create(model="mock", messages=MESSAGES)
+
+    _, counters = with_server(config, scenario)
+
+    assert counters["rate_limited"] + counters["errors"] == 1
+
+
+def test_latency_distributions_are_centered_on_median():
+    for latency in ("fixed", "uniform", "exponential", "lognormal"):
+        server = MockLLMServer(MockLLMConfig(latency=latency, latency_ms=100, seed=1))
+        samples = sorted(server.sample_latency() for _ in range(2000))
+        assert 0.05 < samples[len(samples) // 2] < 0.15
+
+
+def test_summary_reports_percentiles_per_kind():
+    results = [("spread", float(index), None) for index in range(1, 101)] + [("clarify", 0.5, 0.1)]
+
+    report = load_test_llm.summarize(results, elapsed=10.0)
+
+    assert report["spread"]["p50"] == 51.0
+    assert report["spread"]["p99"] == 100.0
+    assert report["all"]["throughput"] == pytest.approx(10.1)
+    assert report["clarify"]["ttft_p50"] == 0.1
+    assert "ttft_p50" not in report["spread"]
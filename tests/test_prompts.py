@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from prompts import PROMPT_REGISTRY, PromptRegistry, PromptTemplateError, validate_template
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    for key in PROMPT_REGISTRY:
+        monkeypatch.delenv(f"SPREAD_PROMPT_{key.upper()}", raising=False)
+    prompts_dir = tmp_path / "prompts"
+    prompts_dir.mkdir()
+    return prompts_dir, tmp_path / ".env.spreads"
+
+
+def make_registry(sources):
+    prompts_dir, spreads_file = sources
+    return PromptRegistry("Базовый", "Дневной", None, prompts_dir=prompts_dir, spreads_file=spreads_file)
+
+
+def touch_later(path, text):
+    previous = path.stat().st_mtime_ns if path.exists() else 0
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(previous + 10**9, previous + 10**9))
+
+
+def test_system_prompts_are_resolved_per_mode(sources):
+    registry = make_registry(sources)
+
+    day = registry.build("card_day", card_name="Шут")
+    three = registry.build("three_cards", cards="Шут, Маг, Жрица", question="Что ждёт?")
+
+    assert day[0]["content"] == "Дневной"
+    assert "Шут" in day[1]["content"]
+    assert three[0]["content"] == "Базовый"
+    assert "Что ждёт?" in three[1]["content"]
+    with pytest.raises(KeyError):
+        registry.build("missing")
+
+
+def test_overrides_prefer_spreads_file_over_prompt_files(sources):
+    prompts_dir, spreads_file = sources
+    (prompts_dir / "REL_HAS_OTHER.txt").write_text("Из файла: {cards}", encoding="utf-8")
+    (prompts_dir / "FIN_NO_STICK.txt").write_text("Из файла: {cards}", encoding="utf-8")
+    spreads_file.write_text('SPREAD_PROMPT_REL_HAS_OTHER="Из spreads: {cards}"\n', encoding="utf-8")
+
+    registry = make_registry(sources)
+
+    assert registry.build("REL_HAS_OTHER", cards="Маг")[1]["content"] == "Из spreads: Маг"
+    assert registry.build("FIN_NO_STICK", cards="Маг")[1]["content"] == "Из файла: Маг"
+    assert registry.get("card_day").source == "default"
+
+
+def test_invalid_templates_are_rejected_at_load(sources):
+    prompts_dir, _ = sources
+    (prompts_dir / "REL_HAS_OTHER.txt").write_text("Без карт", encoding="utf-8")
+    (prompts_dir / "FIN_NO_STICK.txt").write_text("Карты {cards} и {unknown}", encoding="utf-8")
+
+    registry = make_registry(sources)
+
+    assert registry.get("REL_HAS_OTHER").template == PROMPT_REGISTRY["REL_HAS_OTHER"].user_template
+    assert registry.get("FIN_NO_STICK").source == "default"
+    with pytest.raises(PromptTemplateError):
+        validate_template(PROMPT_REGISTRY["REL_HAS_OTHER"], "Карты {cards")
+
+
+def test_placeholders_are_checked_per_mode(sources):
+    prompts_dir, _ = sources
+    (prompts_dir / "REL_HAS_OTHER.txt").write_text("Карта {card_name}, карты {cards}", encoding="utf-8")
+    (prompts_dir / "card_day.txt").write_text("Карты {cards}", encoding="utf-8")
+    (prompts_dir / "clarify.txt").write_text("{card_name}: {question}", encoding="utf-8")
+
+    registry = make_registry(sources)
+
+    assert registry.get("REL_HAS_OTHER").source == "default"
+    assert "Карты: Маг." in registry.build("REL_HAS_OTHER", question="?", cards="Маг")[1]["content"]
+    assert registry.get("card_day").source == "default"
+    assert registry.build("clarify", card_name="Маг")[1]["content"] == "Маг: "
+
+
+def test_reload_picks_up_changes_and_keeps_last_good_template(sources):
+    prompts_dir, spreads_file = sources
+    template_file = prompts_dir / "REL_HAS_OTHER.txt"
+    touch_later(template_file, "Первая версия: {cards}")
+    registry = make_registry(sources)
+    compiled = registry.compiled
+
+    assert not registry.reload_if_changed()
+
+    touch_later(template_file, "Вторая версия: {cards}")
+    assert registry.reload_if_changed()
+    assert registry.compiled is not compiled
+    assert registry.build("REL_HAS_OTHER", cards="Маг")[1]["content"] == "Вторая версия: Маг"
+
+    touch_later(template_file, "Сломанная версия")
+    assert registry.reload_if_changed()
+    assert registry.build("REL_HAS_OTHER", cards="Маг")[1]["content"] == "Вторая версия: Маг"
+
+    touch_later(spreads_file, 'SPREAD_PROMPT_REL_HAS_OTHER="Из spreads: {cards}"\n')
+    assert registry.reload_if_changed()
+    assert registry.build("REL_HAS_OTHER", cards="Маг")[1]["content"] == "Из spreads: Маг"
+    assert registry.reloads == 3
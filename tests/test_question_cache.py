@@ -0,0 +1,77 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("CHANNEL_USERNAME", "@test_channel")
+
+import main  # noqa: E402
+from question_cache import QuestionSimilarityCache, normalize_question, vectorize_question  # noqa: E402
+
+
+def test_normalization_ignores_case_punctuation_and_filler_words():
+    assert normalize_question("А что насчёт ЛЮБВИ?!") == ["любви"]
+    assert normalize_question("а что?") == ["а", "что"]
+    assert vectorize_question("?!") is None
+
+
+def test_similar_questions_share_answers_per_card():
+    cache = QuestionSimilarityCache(threshold=0.8)
+    cache.put("Шут", "Что насчёт любви?", "Про любовь")
+
+    assert cache.get("Шут", "а что насчет любви") == "Про любовь"
+    assert cache.get("Шут", "Что насчёт работы?") is None
+    assert cache.get("Маг", "Что насчёт любви?") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_answers_are_evicted():
+    cache = QuestionSimilarityCache(threshold=0.95, per_card=2, max_cards=1)
+    cache.put("Шут", "любовь", "1")
+    cache.put("Шут", "работа", "2")
+    assert cache.get("Шут", "любовь") == "1"
+    cache.put("Шут", "деньги", "3")
+
+    assert cache.get("Шут", "работа") is None
+    assert cache.get("Шут", "деньги") == "3"
+
+    cache.put("Маг", "здоровье", "4")
+    assert cache.get("Шут", "любовь") is None
+    stats = cache.stats()
+    assert (stats["cards"], stats["entries"], stats["evictions"]) == (1, 1, 3)
+
+
+def test_card_capacity_grows_on_demand():
+    cache = QuestionSimilarityCache(threshold=0.95, per_card=10)
+    questions = ["любовь", "работа", "деньги", "здоровье", "семья", "дети", "переезд", "учеба", "дружба", "отпуск"]
+    for index, question in enumerate(questions):
+        cache.put("Шут", question, str(index))
+
+    assert [cache.get("Шут", question) for question in questions] == [str(index) for index in range(10)]
+
+
+@pytest.fixture
+def clarify_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATA_FILE", tmp_path / "users.json")
+    monkeypatch.setattr(main, "_clarify_cache", None)
+    monkeypatch.setattr(main, "_prompt_registry", None)
+    calls = []
+
+    async def call_llm(messages, max_tokens, mode, **kwargs):
+        calls.append(messages[-1]["content"])
+        return f"Ответ {len(calls)}"
+
+    monkeypatch.setattr(main, "call_llm", call_llm)
+    return calls
+
+
+def test_clarify_reuses_answers_for_similar_questions(clarify_env):
+    first = asyncio.run(main.generate_clarify_interpretation("Шут", "Что насчёт любви?"))
+    second = asyncio.run(main.generate_clarify_interpretation("Шут", "а что насчет любви"))
+    other = asyncio.run(main.generate_clarify_interpretation("Шут", "Что с работой?"))
+
+    assert first == second == "Ответ 1"
+    assert other == "Ответ 2"
+    assert len(clarify_env) == 2
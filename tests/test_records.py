@@ -0,0 +1,75 @@
+import io
+import json
+import sys
+
+from records import (
+    DEFAULT_USER,
+    UserRecord,
+    convert_json_to_binary,
+    iter_record_file,
+    timestamp_to_iso,
+    write_record_entry,
+)
+
+LEGACY_USER = {
+    "free_granted": True,
+    "invited_count": 2,
+    "referred_by": 77,
+    "registration_date": "2024-05-01T10:20:30.123456+00:00",
+    "diamonds": 15,
+    "last_daily_spread_at": "2024-05-02T00:00:00+00:00",
+    "last_daily_gift_at": None,
+    "daily_spread_count": 3,
+    "last_daily_card": "Аркан_Сила",
+    "subscription_status": "member",
+    "subscription_checked_at": "2024-05-03T08:00:00.500000+00:00",
+}
+
+
+def test_json_schema_roundtrips_losslessly():
+    record = UserRecord.from_dict(LEGACY_USER)
+
+    assert record.extra is None
+    assert isinstance(record["registration_date"], int)
+    assert record.to_dict() == LEGACY_USER
+    assert UserRecord.unpack(record.pack()) == record
+
+
+def test_non_canonical_values_are_preserved_verbatim():
+    legacy = {**LEGACY_USER, "last_daily_gift_at": "2024-05-02T03:00:00+03:00", "diamonds": "lots", "note": [1]}
+    record = UserRecord.from_dict(legacy)
+
+    assert record["last_daily_gift_at"] == UserRecord.from_dict({"last_daily_gift_at": "2024-05-02T00:00:00+00:00"})["last_daily_gift_at"]
+    assert record.diamonds == 0
+    assert record.to_dict() == legacy
+    assert UserRecord.unpack(record.pack()).to_dict() == legacy
+
+    record["last_daily_gift_at"] = 0
+    assert record.to_dict()["last_daily_gift_at"] == timestamp_to_iso(0)
+
+
+def test_record_is_smaller_than_dict():
+    record = UserRecord.from_dict(LEGACY_USER)
+    assert not hasattr(record, "__dict__")
+    assert sys.getsizeof(record) < sys.getsizeof(dict(LEGACY_USER))
+    assert len(record.pack()) < len(json.dumps(LEGACY_USER, ensure_ascii=False).encode("utf-8"))
+
+
+def test_binary_file_conversion(tmp_path):
+    source = tmp_path / "users.json"
+    source.write_text(json.dumps({"1": LEGACY_USER, "2": {"diamonds": 4}}), encoding="utf-8")
+    target = tmp_path / "users.bin"
+
+    assert convert_json_to_binary(source, target) == 2
+    with open(target, "rb") as handle:
+        converted = dict(iter_record_file(handle))
+    assert converted[1].to_dict() == LEGACY_USER
+    assert converted[2].to_dict() == {**DEFAULT_USER, "diamonds": 4}
+
+
+def test_truncated_binary_entry_is_ignored():
+    buffer = io.BytesIO()
+    write_record_entry(buffer, 1, UserRecord.from_dict(LEGACY_USER))
+    write_record_entry(buffer, 2, UserRecord())
+    truncated = io.BytesIO(buffer.getvalue()[:-3])
+    assert [user_id for user_id, _ in iter_record_file(truncated)] == [1]
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from io_pool import IOExecutor
+from migrate_users import StreamingJsonWriter
+from records import UserRecord
+from reshard_users import reshard
+from storage import (
+    AsyncUserStorage,
+    CachedUserStorage,
+    JsonUserStorage,
+    ShardedJsonUserStorage,
+    SqliteUserStorage,
+    create_user_storage,
+    shard_index,
+)
+
+
+def user(**fields) -> UserRecord:
+    return UserRecord.from_dict(fields)
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "sharded"])
+def test_storage_roundtrip(tmp_path, backend):
+    storage = create_user_storage(backend, tmp_path / "users.json")
+    assert storage.get(1) is None
+
+    storage.put(1, user(diamonds=5, referred_by=None))
+    storage.put_many({2: user(diamonds=7, referred_by=1), 1: user(diamonds=6, referred_by=None)})
+
+    assert storage.get(1) == user(diamonds=6, referred_by=None)
+    assert dict(storage.items()) == {
+        1: user(diamonds=6, referred_by=None),
+        2: user(diamonds=7, referred_by=1),
+    }
+    storage.close()
+
+
+def test_sqlite_imports_legacy_json_once(tmp_path):
+    data_file = tmp_path / "users.json"
+    data_file.write_text(json.dumps({"42": {"diamonds": 3, "legacy_flag": "kept"}}), encoding="utf-8")
+
+    storage = create_user_storage("sqlite", data_file)
+    assert isinstance(storage, SqliteUserStorage)
+    assert storage.get(42) == user(diamonds=3, legacy_flag="kept")
+    storage.put(42, user(diamonds=4))
+    storage.close()
+
+    reopened = create_user_storage("sqlite", data_file)
+    assert reopened.get(42).diamonds == 4
+    reopened.close()
+
+
+def test_sharded_storage_touches_only_owning_shard(tmp_path):
+    storage = ShardedJsonUserStorage(tmp_path / "shards", 4)
+    storage.put(7, user(diamonds=1))
+
+    written = [shard.path for shard in storage.shard_files if shard.path.exists()]
+    assert written == [storage.shard_files[shard_index(7, 4)].path]
+
+    with pytest.raises(ValueError):
+        ShardedJsonUserStorage(tmp_path / "shards", 8)
+
+
+def test_reshard_preserves_all_users(tmp_path, monkeypatch):
+    directory = tmp_path / "shards"
+    storage = ShardedJsonUserStorage(directory, 2)
+    records = {user_id: user(diamonds=user_id) for user_id in range(50)}
+    storage.put_many(records)
+    opened = []
+    original_open = StreamingJsonWriter.open
+
+    def recording_open(writer, *args):
+        opened.append(writer.path.name)
+        original_open(writer, *args)
+
+    monkeypatch.setattr(StreamingJsonWriter, "open", recording_open)
+
+    assert reshard(directory, 5, batch_size=7) == 50
+    assert sorted(opened) == [f"users-{index:03d}.json" for index in range(5)]
+
+    resharded = ShardedJsonUserStorage(directory, 5)
+    assert dict(resharded.items()) == records
+    assert resharded.get(33) == user(diamonds=33)
+    assert list(tmp_path.glob("shards.bak-*"))
+
+
+def test_sqlite_indexes_referrals_and_timestamps(tmp_path):
+    storage = SqliteUserStorage(tmp_path / "users.db")
+    indexes = {
+        row[1]
+        for row in storage.connection.execute("PRAGMA index_list(users)").fetchall()
+    }
+    assert "idx_users_referred_by" in indexes
+    assert "idx_users_last_daily_gift_at" in indexes
+    mode = storage.connection.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+    storage.close()
+
+
+def test_json_storage_keeps_corrupted_file_aside(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert JsonUserStorage(path).get(1) is None
+    backups = list(tmp_path.glob("users.json.corrupt-*"))
+    assert len(backups) == 1
+    assert backups[0].read_text(encoding="utf-8") == "{not json"
+
+
+def test_cached_storage_writes_behind(tmp_path):
+    backend = JsonUserStorage(tmp_path / "users.json")
+    cache = CachedUserStorage(backend, flush_threshold=10, preload=True)
+
+    cache.put(1, user(diamonds=1))
+    record = cache.get(1)
+    record["diamonds"] = 100
+
+    assert cache.get(1) == user(diamonds=1)
+    assert backend.get(1) is None
+    assert cache.flush() == 1
+    assert backend.get(1) == user(diamonds=1)
+    assert cache.flush() == 0
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_cached_storage_evicts_only_clean_records(tmp_path):
+    backend = SqliteUserStorage(tmp_path / "users.db")
+    backend.put_many({user_id: user(diamonds=user_id) for user_id in range(1, 4)})
+    cache = CachedUserStorage(backend, flush_threshold=100, max_records=2)
+
+    cache.put(10, user(diamonds=10))
+    cache.put(11, user(diamonds=11))
+    for user_id in range(1, 4):
+        assert cache.get(user_id) == user(diamonds=user_id)
+
+    assert list(cache.records) == [10, 11]
+    batch = cache.take_dirty()
+    assert cache.get(1) == user(diamonds=1)
+    assert list(cache.records) == [10, 11]
+    backend.put_many(batch)
+    cache.finish_flush(batch)
+    cache.get(2)
+    assert list(cache.records) == [11, 2]
+    assert cache.get(10) == user(diamonds=10)
+    assert cache.stats() == {"records": 2, "dirty": 0, "flushing": 0, "evicted": 6}
+    cache.close()
+
+
+def test_async_storage_flushes_at_threshold_off_the_loop(tmp_path):
+    cache = CachedUserStorage(SqliteUserStorage(tmp_path / "users.db"), flush_threshold=2)
+    storage = AsyncUserStorage(cache, IOExecutor(max_workers=1))
+
+    async def scenario():
+        flusher = asyncio.create_task(storage.run_flusher(interval=60))
+        storage.put_many({1: user(diamonds=1), 2: user(diamonds=2)})
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not cache.dirty and cache.backend.get(2):
+                break
+        flusher.cancel()
+
+    asyncio.run(scenario())
+    assert not cache.dirty
+    assert cache.backend.get(2) == user(diamonds=2)
+    storage.close()
+
+
+def test_async_storage_batches_concurrent_misses(tmp_path):
+    backend = SqliteUserStorage(tmp_path / "users.db")
+    backend.put_many({1: user(diamonds=1), 2: user(diamonds=2)})
+    batches = []
+    original_get_many = backend.get_many
+
+    def recording_get_many(user_ids):
+        batches.append(sorted(user_ids))
+        return original_get_many(user_ids)
+
+    backend.get_many = recording_get_many
+    storage = AsyncUserStorage(CachedUserStorage(backend), IOExecutor(max_workers=1))
+
+    async def scenario():
+        return await asyncio.gather(storage.get(1), storage.get(2), storage.get(1), storage.get(3))
+
+    first, second, first_again, missing = asyncio.run(scenario())
+    assert batches == [[1, 2, 3]]
+    assert first == first_again == user(diamonds=1)
+    assert first is not first_again
+    assert second == user(diamonds=2)
+    assert missing is None
+    assert asyncio.run(storage.get(2)) == user(diamonds=2)
+    assert batches == [[1, 2, 3]]
+    storage.close()
+
+
+def test_load_racing_a_write_never_returns_stale_record(tmp_path):
+    backend = SqliteUserStorage(tmp_path / "users.db")
+    backend.put_many({1: user(diamonds=1)})
+    cache = CachedUserStorage(backend, max_records=1)
+    storage = AsyncUserStorage(cache, IOExecutor(max_workers=2))
+    loads = []
+    release = threading.Event()
+    original_get_many = backend.get_many
+
+    def slow_get_many(user_ids):
+        records = original_get_many(user_ids)
+        loads.append(sorted(user_ids))
+        if len(loads) == 1:
+            release.wait(1)
+        return records
+
+    backend.get_many = slow_get_many
+
+    async def scenario():
+        reader = asyncio.create_task(storage.get(1))
+        while not loads:
+            await asyncio.sleep(0.001)
+        storage.put(1, user(diamonds=50))
+        await storage.flush()
+        storage.put(2, user(diamonds=2))
+        assert 1 not in cache.records
+        release.set()
+        return await reader
+
+    assert asyncio.run(scenario()) == user(diamonds=50)
+    assert loads == [[1], [1]]
+    assert asyncio.run(storage.get(1)) == user(diamonds=50)
+    assert (cache.loading, cache.written) == ({}, {})
+    storage.close()
+
+
+def test_sqlite_migrates_json_rows_to_binary_records(tmp_path):
+    path = tmp_path / "users.db"
+    legacy = sqlite3.connect(str(path))
+    legacy.execute(
+        "CREATE TABLE users (user_id INTEGER PRIMARY KEY, referred_by INTEGER, registration_date TEXT, "
+        "last_daily_spread_at TEXT, last_daily_gift_at TEXT, subscription_checked_at TEXT, data TEXT NOT NULL)"
+    )
+    legacy.execute(
+        "INSERT INTO users (user_id, registration_date, data) VALUES (?, ?, ?)",
+        (5, "2024-01-02T03:04:05.000006+00:00", json.dumps({"diamonds": 9, "registration_date": "2024-01-02T03:04:05.000006+00:00"})),
+    )
+    legacy.commit()
+    legacy.close()
+
+    storage = SqliteUserStorage(path)
+    record = storage.get(5)
+    assert record.diamonds == 9
+    assert record.to_dict()["registration_date"] == "2024-01-02T03:04:05.000006+00:00"
+    stored_type, ts_type = storage.connection.execute(
+        "SELECT typeof(data), typeof(registration_date) FROM users WHERE user_id = 5"
+    ).fetchone()
+    assert (stored_type, ts_type) == ("blob", "integer")
+    storage.close()
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "sharded"])
+def test_stale_subscriptions_are_oldest_first(tmp_path, backend):
+    storage = create_user_storage(backend, tmp_path / "users.json")
+    storage.put_many({
+        1: user(subscription_checked_at=300),
+        2: user(subscription_checked_at=100),
+        3: user(subscription_checked_at=None),
+        4: user(subscription_checked_at=200),
+        5: user(subscription_checked_at=900),
+    })
+
+    assert storage.stale_subscriptions(checked_before=500, limit=2) == [2, 4]
+    assert storage.stale_subscriptions(checked_before=500, limit=10) == [2, 4, 1]
+    storage.close()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import types
+
+import pytest
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("CHANNEL_USERNAME", "@test_channel")
+
+import main  # noqa: E402
+from llm_pool import LLMClientPool, PooledKey  # noqa: E402
+from streaming import StreamingReply, close_open_markers  # noqa: E402
+
+
+class SentMessage:
+    def __init__(self, log):
+        self.log = log
+
+    async def edit_text(self, text, parse_mode=None, reply_markup=None):
+        self.log.append(("edit", text))
+
+
+class ChatMessage:
+    def __init__(self):
+        self.log = []
+
+    async def answer(self, text, reply_markup=None, parse_mode=None):
+        self.log.append(("answer", text, reply_markup))
+        return SentMessage(self.log)
+
+
+@pytest.mark.parametrize(
+    "partial, closed",
+    [
+        ("Итог: [B]важно", "Итог: [B]важно[/B]"),
+        ("Итог: [B]важно[/", "Итог: [B]важно[/B]"),
+        ("Итог: [B]важно[/B", "Итог: [B]важно[/B]"),
+        ("Начало [", "Начало "),
+        ("Начало [B", "Начало "),
+        ("[B]a[/B] b", "[B]a[/B] b"),
+    ],
+)
+def test_close_open_markers(partial, closed):
+    assert close_open_markers(partial) == closed
+
+
+def test_streaming_reply_throttles_edits_and_finishes_with_full_text():
+    message = ChatMessage()
+    keyboard = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text="Меню")]])
+
+    async def scenario():
+        reply = StreamingReply(message, main.render_markers_to_html, placeholder="…", reply_markup=keyboard, min_interval=0.05)
+        await reply.start()
+        for text in ["Карта ", "Карта [B]Шут", "Карта [B]Шут[/B] — начало"]:
+            await reply.update(text)
+        await asyncio.sleep(0.08)
+        await reply.update("Карта [B]Шут[/B] — начало пути")
+        return await reply.finish("Карта [B]Шут[/B] — начало пути.")
+
+    assert asyncio.run(scenario()) is True
+    assert message.log == [
+        ("answer", "…", keyboard),
+        ("edit", "Карта <b>Шут</b> — начало"),
+        ("edit", "Карта <b>Шут</b> — начало пути."),
+    ]
+
+
+def test_finish_without_start_reports_not_handled():
+    async def scenario():
+        reply = StreamingReply(ChatMessage(), main.render_markers_to_html, placeholder="…")
+        return await reply.finish("текст")
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_call_llm_streams_deltas(monkeypatch):
+    def chunk(content=None, usage=None):
+        choices = [types.SimpleNamespace(delta=types.SimpleNamespace(content=content))] if content is not None else []
+        return types.SimpleNamespace(choices=choices, usage=usage)
+
+    class Stream:
+        def __init__(self, chunks):
+            self.chunks = iter(chunks)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self.chunks)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    requests = []
+
+    async def create(**kwargs):
+        requests.append(kwargs)
+        return Stream([chunk("[B]Шут"), chunk("[/B] — "), chunk("начало"), chunk(usage=types.SimpleNamespace(total_tokens=3))])
+
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+    monkeypatch.setattr(main, "_llm_pool", LLMClientPool([PooledKey("test", client)]))
+    monkeypatch.setattr(main, "LLM_ENABLED", True)
+    deltas = []
+
+    async def on_delta(text):
+        deltas.append(text)
+
+    text = asyncio.run(main.call_llm([{"role": "user", "content": "?"}], 50, "DAY", on_delta=on_delta))
+
+    assert text == "[B]Шут[/B] — начало"
+    assert deltas == ["[B]Шут", "[B]Шут[/B] — ", "[B]Шут[/B] — начало"]
+    assert requests[0]["stream"] is True
@@ -45,7 +45,12 @@ class DummyCallback:
 @pytest.fixture(autouse=True)
 def override_data_file(tmp_path, monkeypatch):
     monkeypatch.setattr(main, "DATA_FILE", tmp_path / "users.json")
+    monkeypatch.setattr(main, "_user_storage", None)
+    monkeypatch.setattr(main, "_diamond_ledger", None)
+    monkeypatch.setattr(main, "_subscription_cache", None)
     yield
+    main.close_user_storage()
+    main.close_diamond_ledger()
 
 
 def test_ensure_subscribed_allows_member_and_rewards_once():
@@ -56,7 +61,7 @@ def test_ensure_subscribed_allows_member_and_rewards_once():
 
     assert is_subscribed is True
     assert message.answers == []
-    user = main.get_user_record(1)
+    user = asyncio.run(main.get_user_record(1))
     assert user["subscription_status"] == ChatMemberStatus.MEMBER
     assert user["free_granted"] is True
     assert user["diamonds"] == main.SUBSCRIPTION_DIAMOND_REWARD
@@ -71,7 +76,7 @@ def test_ensure_subscribed_blocks_and_notifies_for_left_user():
     assert is_subscribed is False
     assert message.answers
     assert "подпишитесь на канал" in message.answers[0]["text"].lower()
-    user = main.get_user_record(2)
+    user = asyncio.run(main.get_user_record(2))
     assert user["subscription_status"] == ChatMemberStatus.LEFT
 
 
@@ -149,3 +154,153 @@ def test_ensure_subscribed_answers_callback_on_refusal():
     assert callback.answers
     assert "подпишитесь" in (callback.answers[0] or "").lower()
     assert callback.message.answers
+
+
+def test_ensure_subscribed_uses_cached_status():
+    bot = DummyBot(ChatMemberStatus.MEMBER)
+
+    assert asyncio.run(main.ensure_subscribed(bot, 11, DummyMessage(user_id=11))) is True
+    assert asyncio.run(main.ensure_subscribed(bot, 11, DummyMessage(user_id=11))) is True
+
+    assert len(bot.calls) == 1
+    assert main.get_subscription_cache().stats()["hits"] == 1
+
+
+def test_ensure_subscribed_seeds_cache_from_stored_check():
+    user = main.ensure_user_defaults(None)
+    user["subscription_status"] = ChatMemberStatus.MEMBER
+    user["subscription_checked_at"] = main.timestamp_now()
+    main.save_user_record(12, user)
+    bot = DummyBot(ChatMemberStatus.LEFT)
+
+    assert asyncio.run(main.ensure_subscribed(bot, 12, DummyMessage(user_id=12))) is True
+    assert bot.calls == []
+    assert main.get_subscription_cache().stats()["seeded"] == 1
+
+
+def test_forced_check_bypasses_negative_cache():
+    bot = DummyBot(ChatMemberStatus.LEFT)
+    assert asyncio.run(main.ensure_subscribed(bot, 13, DummyMessage(user_id=13))) is False
+
+    bot.status = ChatMemberStatus.MEMBER
+    assert asyncio.run(main.ensure_subscribed(bot, 13, DummyMessage(user_id=13))) is False
+    callback = DummyCallback(user_id=13)
+    assert asyncio.run(main.ensure_subscribed(bot, 13, callback, force=True)) is True
+    assert len(bot.calls) == 2
+
+
+def member_update(user_id: int, status: ChatMemberStatus, username: str = "test_channel"):
+    return types.SimpleNamespace(
+        chat=types.SimpleNamespace(id=-100, username=username),
+        new_chat_member=types.SimpleNamespace(user=types.SimpleNamespace(id=user_id), status=status),
+    )
+
+
+def test_channel_member_updates_refresh_known_users_without_api_calls():
+    main.save_user_record(21, main.ensure_user_defaults(None))
+    asyncio.run(main.handle_channel_member(member_update(21, ChatMemberStatus.MEMBER)))
+    asyncio.run(main.handle_channel_member(member_update(22, ChatMemberStatus.MEMBER)))
+    asyncio.run(main.handle_channel_member(member_update(21, ChatMemberStatus.LEFT, "other_channel")))
+
+    user = asyncio.run(main.get_user_record(21))
+    assert user["subscription_status"] == ChatMemberStatus.MEMBER
+    assert user["diamonds"] == main.SUBSCRIPTION_DIAMOND_REWARD
+    assert asyncio.run(main.get_user_storage().get(22)) is None
+
+    bot = DummyBot(ChatMemberStatus.LEFT)
+    assert asyncio.run(main.ensure_subscribed(bot, 21, DummyMessage(user_id=21))) is True
+    asyncio.run(main.handle_channel_member(member_update(21, ChatMemberStatus.LEFT)))
+    assert asyncio.run(main.ensure_subscribed(bot, 21, DummyMessage(user_id=21))) is False
+    assert bot.calls == []
+
+
+def test_recheck_subscription_only_touches_stale_users():
+    user = main.ensure_user_defaults(None)
+    user["subscription_status"] = ChatMemberStatus.MEMBER
+    user["subscription_checked_at"] = 1
+    main.save_user_record(31, user)
+    bot = DummyBot(ChatMemberStatus.LEFT)
+
+    assert asyncio.run(main.recheck_subscription(bot, 31, checked_before=1)) is False
+    assert asyncio.run(main.recheck_subscription(bot, 31, checked_before=2)) is True
+    assert asyncio.run(main.get_user_record(31))["subscription_status"] == ChatMemberStatus.LEFT
+    assert len(bot.calls) == 1
+
+
+def test_bot_profile_is_fetched_once(monkeypatch):
+    monkeypatch.setattr(main, "_bot_profiles", {})
+
+    class ProfileBot:
+        id = 99
+
+        def __init__(self):
+            self.calls = 0
+
+        async def get_me(self):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return types.SimpleNamespace(username="tarot_bot")
+
+    bot = ProfileBot()
+
+    async def scenario():
+        profiles = await asyncio.gather(*(main.get_bot_profile(bot) for _ in range(3)))
+        return profiles + [await main.get_bot_profile(bot)]
+
+    profiles = asyncio.run(scenario())
+
+    assert bot.calls == 1
+    assert {profile.username for profile in profiles} == {"tarot_bot"}
+
+
+class StartBot(DummyBot):
+    def __init__(self):
+        super().__init__(ChatMemberStatus.MEMBER)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+
+
+def start_message(user_id, payload):
+    message = DummyMessage(user_id=user_id)
+    message.text = f"/start {payload}"
+    return message
+
+
+def test_referral_reward_waits_for_inviter_handler(monkeypatch):
+    monkeypatch.setattr(main, "user_locks", main.UserLockManager())
+
+    async def scenario():
+        await main.get_user_record(10)
+        bot = StartBot()
+        async with main.user_locks.hold(10):
+            inviter = await main.get_user_record(10)
+            await asyncio.wait_for(main.handle_start(start_message(11, 10), bot), 1)
+            await asyncio.sleep(0.05)
+            main.save_user_record(10, inviter)
+        await asyncio.gather(*main.referral_tasks)
+        return bot.sent, await main.get_user_record(10), await main.get_user_record(11)
+
+    sent, inviter, invited = asyncio.run(scenario())
+
+    assert sent == [10]
+    assert inviter["invited_count"] == 1
+    assert inviter["diamonds"] == main.get_diamond_ledger().balance(10)
+    assert invited["referred_by"] == 10
+
+
+def test_cross_referrals_do_not_deadlock(monkeypatch):
+    monkeypatch.setattr(main, "user_locks", main.UserLockManager())
+
+    async def start(user_id, payload, bot):
+        async with main.user_locks.hold(user_id):
+            await main.handle_start(start_message(user_id, payload), bot)
+
+    async def scenario():
+        bot = StartBot()
+        await asyncio.wait_for(asyncio.gather(start(21, 22, bot), start(22, 21, bot)), 1)
+        await asyncio.wait_for(asyncio.gather(*main.referral_tasks), 1)
+        return sorted(bot.sent)
+
+    assert asyncio.run(scenario()) == [21, 22]
@@ -0,0 +1,61 @@
+import asyncio
+
+from aiogram.enums import ChatMemberStatus
+
+from subscriptions import SubscriptionCache, SubscriptionSweeper
+
+SECOND = 1_000_000
+
+
+def test_positive_and_negative_entries_expire_separately():
+    cache = SubscriptionCache(positive_ttl=600, negative_ttl=60)
+    cache.put(1, ChatMemberStatus.MEMBER, checked_at=0)
+    cache.put(2, ChatMemberStatus.LEFT, checked_at=0)
+
+    assert cache.get(1, now=100 * SECOND) == ChatMemberStatus.MEMBER
+    assert cache.get(2, now=100 * SECOND) is None
+    assert cache.get(1, now=700 * SECOND) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_seed_ignores_stale_or_missing_checks():
+    cache = SubscriptionCache(positive_ttl=600, negative_ttl=60)
+
+    assert cache.seed(1, None, None) is None
+    assert cache.seed(1, "member", 0, now=601 * SECOND) is None
+    assert cache.seed(1, "member", 0, now=10 * SECOND) == "member"
+    assert cache.stats()["seeded"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = SubscriptionCache(max_entries=2)
+    cache.put(1, "member")
+    cache.put(2, "member")
+    cache.get(1)
+    cache.put(3, "member")
+
+    assert set(cache.entries) == {1, 3}
+
+
+def test_sweeper_rechecks_within_rate_budget():
+    requested = []
+    rechecked = []
+
+    async def find_stale(checked_before, limit):
+        requested.append(limit)
+        return [1, 2, 3, 4]
+
+    async def recheck(user_id, checked_before):
+        if user_id == 2:
+            return False
+        rechecked.append(user_id)
+        return True
+
+    sweeper = SubscriptionSweeper(find_stale, recheck, max_age=60, rate=1000, interval=0.004)
+
+    assert asyncio.run(sweeper.sweep_once()) == 3
+    assert requested == [4]
+    assert rechecked == [1, 3, 4]
+    assert sweeper.rechecked == 3
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import types
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import FSInputFile
+from PIL import Image
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("CHANNEL_USERNAME", "@test_channel")
+
+import main  # noqa: E402
+import warm_file_ids  # noqa: E402
+from telegram_files import TelegramFileCache  # noqa: E402
+
+
+def sent_photo(file_id, message_id=1):
+    return types.SimpleNamespace(
+        message_id=message_id,
+        photo=[types.SimpleNamespace(file_id=f"{file_id}-small"), types.SimpleNamespace(file_id=file_id)],
+    )
+
+
+class PhotoMessage:
+    def __init__(self, reject_file_ids=False):
+        self.bot = types.SimpleNamespace(id=42)
+        self.sent = []
+        self.reject_file_ids = reject_file_ids
+
+    async def answer_photo(self, photo):
+        self.sent.append(photo)
+        if isinstance(photo, str):
+            if self.reject_file_ids:
+                raise TelegramBadRequest(method=None, message="wrong file identifier")
+            return sent_photo(photo)
+        return sent_photo(f"uploaded-{len(self.sent)}")
+
+
+@pytest.fixture
+def deck(tmp_path, monkeypatch):
+    cards_dir = tmp_path / "cards"
+    cards_dir.mkdir()
+    for index, color in enumerate(["red", "green", "blue"]):
+        Image.new("RGB", (30, 50), color).save(cards_dir / f"card{index}.png")
+    monkeypatch.setattr(main, "DATA_FILE", tmp_path / "users.json")
+    monkeypatch.setattr(main, "CARDS_DIR", cards_dir)
+    monkeypatch.setattr(main, "_telegram_files", None)
+    monkeypatch.setattr(main, "_card_images", None)
+    monkeypatch.setattr(main, "_collage_renderer", None)
+    monkeypatch.setattr(main, "COLLAGE_EXECUTOR", "thread")
+    monkeypatch.setattr(main, "_io_executor", None)
+    yield sorted(cards_dir.iterdir())
+    main.close_telegram_files()
+    main.close_collage_renderer()
+    main.get_io_executor().shutdown()
+
+
+def test_keys_follow_file_content(tmp_path, deck):
+    files = TelegramFileCache(tmp_path / "file_ids.db")
+    key = files.content_key(deck[0])
+
+    assert key.startswith("card:card0.png:")
+    assert files.content_key(deck[0]) == key
+    Image.new("RGB", (30, 50), "black").save(deck[0])
+    os.utime(deck[0], ns=(1, 1))
+    assert files.content_key(deck[0]) != key
+    assert files.collage_key(deck, 720).count("card:") == 3
+    files.close()
+
+
+def test_file_ids_persist_per_bot(tmp_path):
+    files = TelegramFileCache(tmp_path / "file_ids.db")
+    files.put(42, "card:a", "file-a")
+    files.close()
+
+    reopened = TelegramFileCache(tmp_path / "file_ids.db")
+    assert reopened.get(42, "card:a") == "file-a"
+    assert reopened.get(7, "card:a") is None
+    reopened.forget(42, "card:a")
+    assert reopened.get(42, "card:a") is None
+    assert reopened.stats()["invalidated"] == 1
+    reopened.close()
+
+
+def test_card_photo_is_uploaded_once(deck):
+    async def build():
+        return FSInputFile(deck[0])
+
+    async def scenario():
+        message = PhotoMessage()
+        for _ in range(2):
+            await main.send_photo_cached(message, lambda files: files.content_key(deck[0]), build)
+        return message.sent
+
+    sent = asyncio.run(scenario())
+
+    assert isinstance(sent[0], FSInputFile)
+    assert sent[1] == "uploaded-1"
+
+
+def test_cached_collage_skips_rendering(deck):
+    async def scenario():
+        message = PhotoMessage()
+        for _ in range(2):
+            selected = list(deck)
+
+            async def build():
+                return await main.create_three_card_collage(selected)
+
+            await main.send_photo_cached(message, lambda files: files.collage_key(selected, main.CARD_IMAGE_HEIGHT), build)
+        return message.sent
+
+    sent = asyncio.run(scenario())
+
+    assert sent[1] == "uploaded-1"
+    assert main.get_card_images().stats()["collage_misses"] == 1
+    assert main.get_card_images().stats()["collage_hits"] == 0
+
+
+def test_rejected_file_id_is_reuploaded(deck):
+    async def build():
+        return FSInputFile(deck[1])
+
+    async def scenario():
+        message = PhotoMessage(reject_file_ids=True)
+        for _ in range(2):
+            await main.send_photo_cached(message, lambda files: files.content_key(deck[1]), build)
+        return message.sent
+
+    sent = asyncio.run(scenario())
+
+    assert [type(photo) for photo in sent] == [FSInputFile, str, FSInputFile]
+    assert main.get_telegram_files().stats()["invalidated"] == 1
+
+
+def test_warm_up_uploads_missing_cards(tmp_path, deck):
+    class WarmBot:
+        id = 42
+
+        def __init__(self):
+            self.sent = 0
+            self.deleted = []
+            self.throttled = False
+
+        async def send_photo(self, chat_id, photo, disable_notification=False):
+            if not self.throttled:
+                self.throttled = True
+                raise TelegramRetryAfter(method=None, message="flood", retry_after=0)
+            self.sent += 1
+            return sent_photo(f"warm-{self.sent}", message_id=self.sent)
+
+        async def delete_message(self, chat_id, message_id):
+            self.deleted.append(message_id)
+
+    files = TelegramFileCache(tmp_path / "warm.db")
+    files.put(42, files.content_key(deck[0]), "known")
+    bot = WarmBot()
+
+    counters = asyncio.run(warm_file_ids.warm_up(bot, -100, files, deck, delay=0))
+
+    assert counters == {"uploaded": 2, "skipped": 1, "failed": 0}
+    assert bot.deleted == [1, 2]
+    assert files.get(42, files.content_key(deck[2])) == "warm-2"
+    files.close()
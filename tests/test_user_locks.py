@@ -0,0 +1,76 @@
+import asyncio
+import types
+
+from user_locks import UserLockManager, UserSerialMiddleware
+
+
+def test_same_user_updates_run_in_order_and_locks_are_evicted():
+    locks = UserLockManager()
+    middleware = UserSerialMiddleware(locks)
+    events = []
+
+    async def handler(event, data):
+        events.append(("start", event))
+        await asyncio.sleep(0.01)
+        events.append(("end", event))
+        return event
+
+    async def scenario():
+        data = {"event_from_user": types.SimpleNamespace(id=1)}
+        results = await asyncio.gather(*(middleware(handler, index, dict(data)) for index in range(3)))
+        return results
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
+    assert events == [
+        ("start", 0), ("end", 0),
+        ("start", 1), ("end", 1),
+        ("start", 2), ("end", 2),
+    ]
+    assert len(locks) == 0
+
+
+def test_different_users_run_in_parallel():
+    middleware = UserSerialMiddleware()
+    running = []
+    peak = []
+
+    async def handler(event, data):
+        running.append(event)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(event)
+
+    async def scenario():
+        await asyncio.gather(
+            *(middleware(handler, user_id, {"event_from_user": types.SimpleNamespace(id=user_id)}) for user_id in range(5))
+        )
+
+    asyncio.run(scenario())
+    assert max(peak) == 5
+
+
+def test_events_without_user_are_not_serialized():
+    locks = UserLockManager()
+    middleware = UserSerialMiddleware(locks)
+
+    async def handler(event, data):
+        return "ok"
+
+    assert asyncio.run(middleware(handler, object(), {})) == "ok"
+    assert len(locks) == 0
+
+
+def test_chat_member_updates_lock_the_affected_member():
+    locks = UserLockManager()
+    middleware = UserSerialMiddleware(locks)
+    held = []
+
+    async def handler(event, data):
+        held.append(list(locks._locks))
+
+    event = types.SimpleNamespace(
+        chat_member=types.SimpleNamespace(new_chat_member=types.SimpleNamespace(user=types.SimpleNamespace(id=42)))
+    )
+    asyncio.run(middleware(handler, event, {"event_from_user": types.SimpleNamespace(id=7)}))
+
+    assert held == [[42]]
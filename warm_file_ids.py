@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import FSInputFile
+
+import main
+from telegram_files import TelegramFileCache
+
+
+async def warm_up(
+    bot: Bot,
+    chat_id: int | str,
+    files: TelegramFileCache,
+    card_paths: List[Path],
+    *,
+    delay: float = 1.0,
+    delete: bool = True,
+) -> Dict[str, int]:
+    counters = {"uploaded": 0, "skipped": 0, "failed": 0}
+    for path in sorted(card_paths):
+        key = files.content_key(path)
+        if files.get(bot.id, key):
+            counters["skipped"] += 1
+            continue
+        while True:
+            try:
+                sent = await bot.send_photo(chat_id, FSInputFile(path), disable_notification=True)
+                break
+            except TelegramRetryAfter as exc:
+                await asyncio.sleep(exc.retry_after)
+            except TelegramAPIError as exc:
+                logging.warning("Не удалось загрузить %s: %s", path.name, exc)
+                sent = None
+                break
+        if sent is None or not sent.photo:
+            counters["failed"] += 1
+            continue
+        files.put(bot.id, key, sent.photo[-1].file_id)
+        counters["uploaded"] += 1
+        if delete:
+            try:
+                await bot.delete_message(chat_id, sent.message_id)
+            except TelegramAPIError as exc:
+                logging.debug("Не удалось удалить служебное сообщение: %s", exc)
+        await asyncio.sleep(delay)
+    return counters
+
+
+async def run(args: argparse.Namespace) -> Dict[str, int]:
+    bot = Bot(token=main.BOT_TOKEN)
+    files = TelegramFileCache(main.DATA_FILE.parent / "file_ids.db")
+    try:
+        return await warm_up(bot, args.chat, files, main.load_card_files(), delay=args.delay, delete=not args.keep)
+    finally:
+        files.close()
+        await bot.session.close()
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Заранее загрузить колоду в Telegram и сохранить file_id карт.")
+    parser.add_argument("--chat", default=os.getenv("SERVICE_CHAT_ID"), help="служебный чат, куда бот может отправлять фото")
+    parser.add_argument("--delay", type=float, default=1.0, help="пауза между отправками, с")
+    parser.add_argument("--keep", action="store_true", help="не удалять служебные сообщения после загрузки")
+    args = parser.parse_args(argv)
+    if not main.BOT_TOKEN:
+        parser.error("не задан BOT_TOKEN")
+    if not args.chat:
+        parser.error("укажите --chat или SERVICE_CHAT_ID")
+    logging.basicConfig(level=logging.INFO)
+    counters = asyncio.run(run(args))
+    print(f"Колода {main.CARDS_DIR}: {counters}")
+
+
+if __name__ == "__main__":
+    main_cli()